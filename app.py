@@ -1,84 +1,187 @@
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
+import json
+import multiprocessing
+import os
+import signal
 import threading
 import time
-from sqlalchemy.exc import IntegrityError
+from typing import Dict, List, Optional, Tuple
 
-from src.models.models import Category
 from src.transaction_categorization.categorize import EnhancedTransactionCategorizationService
 from src.transaction_categorization.model_trainer import train_model
 from src.utils.config_utils import config
-from src.utils.logging_utils import setup_logger
-from src.database.db_utils import CategoryService, TransactionService, get_transaction_service, get_category_service
+from src.utils.logging_utils import setup_logger, shutdown_logging, start_worker_log_listener
+from src.utils.metrics import counter, gauge, histogram, start_metrics_server
+from src.database.db_utils import CategoryRegistry, TransactionService, get_transaction_service, get_category_service, get_category_registry
+from src.database.db_connector import engine, remove_scoped_session
 from src.utils.utils import RedisQueue
 
 logger = setup_logger(__name__)
 
+PROCESS_BATCH_SECONDS = histogram("txcat_process_batch_seconds", "Time to claim, categorize and write back one dequeued batch")
+TRANSACTIONS_PROCESSED = counter(
+    "txcat_transactions_processed", "Dequeued transactions by outcome: updated, skipped, unresolved or failed", ["outcome"]
+)
+QUEUE_DEPTH = gauge("txcat_queue_depth", "Transactions waiting in the queue")
+WORKER_RESTARTS = counter("txcat_worker_restarts", "Worker processes restarted after exiting unexpectedly")
+
+def start_metrics(port_offset: int = 0) -> None:
+    """Serve /metrics if enabled; forked workers each listen on their own port after the parent's."""
+    metrics_conf = config.get("metrics", {})
+    if metrics_conf.get("enabled", False):
+        start_metrics_server(int(metrics_conf.get("port", 9000)) + port_offset, metrics_conf.get("host", "0.0.0.0"))
+
+def start_model_hot_reload(categorization_service: EnhancedTransactionCategorizationService) -> None:
+    """Swap in newly published model versions if enabled; forked workers each run their own watcher."""
+    hot_reload_conf = config["model"].get("hot_reload", {})
+    if hot_reload_conf.get("enabled", False) and config["features"]["categorise_with_model"]:
+        categorization_service.start_model_watcher(float(hot_reload_conf.get("interval", 30)))
+
+def create_queue() -> RedisQueue:
+    """Create a connection to the transaction queue from the queue configuration."""
+    return RedisQueue(
+        host=config["queue"]["host"] or 'localhost',
+        port=config["queue"]["port"],
+        password=config["queue"]["password"],
+        queue_name=config["queue"]["queue_name"],
+    )
+
 def process_transaction(
     transaction: dict,
     redis_client: RedisQueue,
     categorization_service: EnhancedTransactionCategorizationService,
     transactionDBService: TransactionService = get_transaction_service(),
-    categoryDBService: CategoryService = get_category_service(),
+    categoryRegistry: CategoryRegistry = get_category_registry(),
     
 ) -> None:
+    process_transactions([transaction], redis_client, categorization_service, transactionDBService, categoryRegistry)
+
+def select_unprocessed(
+    transactions: List[dict],
+    claimed_ids: List,
+    transactionDBService: TransactionService
+) -> List[dict]:
+    """Return the claimed, not yet categorized transactions of a batch, with parsed dates."""
+    claimed = []
+    unprocessed = set(claimed_ids)
+
+    for transaction in transactions:
+        try:
+            if transaction['id'] not in unprocessed:
+                logger.info("Transaction %s was recently processed. Skipping.", transaction['id'], extra={"event": "transaction_skipped"})
+                continue
+            unprocessed.discard(transaction['id'])
+            claimed.append(transaction)
+        except Exception as e:
+            logger.error(f"Error processing transaction: {str(e)}")
+            logger.error(f"Problematic transaction: {transaction}")
+
+    # Check which transactions are already categorized with one query for the whole batch
     try:
-        # Use Redis to check if this transaction has been processed recently
-        transaction_key = f"processed_transaction:{transaction['id']}"
-        if redis_client.get(transaction_key):
-            logger.info(f"Transaction {transaction['id']} was recently processed. Skipping.")
-            return
+        category_ids = {
+            str(transaction_id): category_id
+            for transaction_id, category_id in transactionDBService.get_category_ids([transaction['id'] for transaction in claimed]).items()
+        }
+    except Exception as e:
+        # The write-back only updates uncategorized rows, so the batch is still safe to process
+        logger.error(f"Error checking the categories of {len(claimed)} transactions: {str(e)}")
+        category_ids = None
 
-        # Set a flag in Redis to indicate this transaction is being processed
-        redis_client.setex(transaction_key, 300, "1")  # Expires in 5 minutes
+    pending = []
+    for transaction in claimed:
+        try:
+            # Ids the check cannot see are processed anyway; the write-back only updates uncategorized rows
+            if category_ids is not None and category_ids.get(str(transaction['id'])) not in (None, 32):
+                logger.info("Transaction %s already categorized. Skipping.", transaction['id'], extra={"event": "transaction_skipped"})
+                continue
 
-        # Check if the transaction has already been categorized
-        existing_transaction = transactionDBService.get_transaction(transaction['id'])
-        if existing_transaction and existing_transaction.category_id:
-            logger.info(f"Transaction {transaction['id']} already categorized. Skipping.")
-            return
+            # Parse the date string to datetime object if it exists
+            if 'date' in transaction:
+                transaction['date'] = datetime.fromisoformat(transaction['date'])
 
-        # Parse the date string to datetime object if it exists
-        if 'date' in transaction:
-            transaction['date'] = datetime.fromisoformat(transaction['date'])
-        
-        category = categorization_service.categorize_transaction(
-            transaction['narration'],
-            transaction['amount'],
-            transaction.get('date')
+            pending.append(transaction)
+        except Exception as e:
+            logger.error(f"Error processing transaction: {str(e)}")
+            logger.error(f"Problematic transaction: {transaction}")
+
+    return pending
+
+def resolve_category_updates(
+    categorized: List[Tuple[dict, str]],
+    categoryRegistry: CategoryRegistry
+) -> List[Tuple[int, int]]:
+    """Map categorized transactions to (transaction id, category id) pairs, dropping unknown categories."""
+    updates = []
+    for transaction, category in categorized:
+        logger.info(
+            "Thread %s processed - Transaction: %s, Amount: $%.2f, Date: %s, Category: %s",
+            threading.current_thread().name, transaction['narration'], transaction['amount'],
+            transaction.get('date', 'N/A'), category,
+            extra={"event": "transaction_categorized"}
         )
-        
-        logger.info(f"Thread {threading.current_thread().name} processed - "
-              f"Transaction: {transaction['narration']}, "
-              f"Amount: ${transaction['amount']:.2f}, "
-              f"Date: {transaction.get('date', 'N/A')}, "
-              f"Category: {category}")
-        
-        categ: Category = categoryDBService.get_category_by_name(category)
 
-        if not categ:
+        category_id = categoryRegistry.get_id(category)
+
+        if not category_id:
             logger.error(f"Category not found: {category}")
-            return
+            continue
+
+        updates.append((transaction['id'], category_id))
+    return updates
+
+def process_transactions(
+    transactions: List[dict],
+    redis_client: RedisQueue,
+    categorization_service: EnhancedTransactionCategorizationService,
+    transactionDBService: TransactionService = get_transaction_service(),
+    categoryRegistry: CategoryRegistry = get_category_registry(),
+) -> bool:
+    """
+    Categorize a dequeued batch and write every category back in one bulk update.
+
+    Returns False if the batch failed and should be delivered again: the categorization or
+    the write-back raised, or the write-back was rolled back.
+    """
+    claimed_ids = []
+    pending = []
+    start = time.perf_counter()
+    try:
+        # Claim the batch in Redis so no other worker processes the same transactions
+        claimed_ids = redis_client.claim_batch(
+            list(dict.fromkeys(transaction['id'] for transaction in transactions if 'id' in transaction)),
+            ttl=300
+        )
+        pending = select_unprocessed(transactions, claimed_ids, transactionDBService)
+        TRANSACTIONS_PROCESSED.labels("skipped").inc(len(transactions) - len(pending))
+
+        if not pending:
+            return True
+
+        updates = resolve_category_updates(categorization_service.batch_categorize(pending), categoryRegistry)
+        TRANSACTIONS_PROCESSED.labels("unresolved").inc(len(pending) - len(updates))
+
+        updated = transactionDBService.bulk_update_categories(updates)
+        if updated is None:
+            TRANSACTIONS_PROCESSED.labels("failed").inc(len(updates))
+            return False
+        TRANSACTIONS_PROCESSED.labels("updated").inc(updated)
+        TRANSACTIONS_PROCESSED.labels("failed").inc(len(updates) - updated)
+        if updated == len(updates):
+            logger.info(f"Database update successful for {updated} transactions")
+        else:
+            logger.warning(f"Database update applied to {updated} of {len(updates)} transactions")
+        return True
 
-        try:
-            update_result = transactionDBService.update_transaction(
-                transaction['id'], 
-                {"category_id": categ.id}
-            )
-            
-            if update_result:
-                logger.info(f"Database update successful for transaction {transaction['id']}")
-            else:
-                logger.warning(f"Database update failed for transaction {transaction['id']}")
-        except IntegrityError:
-            logger.warning(f"IntegrityError: Transaction {transaction['id']} may already be updated.")
-    
     except Exception as e:
-        logger.error(f"Error processing transaction: {str(e)}")
-        logger.error(f"Problematic transaction: {transaction}")
+        TRANSACTIONS_PROCESSED.labels("failed").inc(len(pending) or len(transactions))
+        logger.error(f"Error processing batch of {len(transactions)} transactions: {str(e)}")
+        logger.error(f"Problematic transactions: {[transaction.get('id') for transaction in transactions]}")
+        return False
     finally:
-        # Remove the processing flag from Redis
-        redis_client.delete(transaction_key)
+        # Remove the processing flags from Redis
+        redis_client.release_batch(claimed_ids)
+        PROCESS_BATCH_SECONDS.observe(time.perf_counter() - start)
 
 def worker(
     queue: RedisQueue,
@@ -93,9 +196,11 @@ def worker(
             for transaction in transaction_generator:
                 transactions_processed += 1
                 try:
-                    logger.info(f"Thread {threading.current_thread().name} processing transaction: {transaction.get('id', 'Unknown ID')}")
+                    logger.info("Thread %s processing transaction: %s", threading.current_thread().name,
+                                transaction.get('id', 'Unknown ID'), extra={"event": "transaction_processing"})
                     process_transaction(transaction, categorization_service)
-                    logger.info(f"Thread {threading.current_thread().name} successfully processed transaction: {transaction.get('id', 'Unknown ID')}")
+                    logger.info("Thread %s successfully processed transaction: %s", threading.current_thread().name,
+                                transaction.get('id', 'Unknown ID'), extra={"event": "transaction_processed"})
                 except Exception as e:
                     logger.error(f"Error processing transaction: {str(e)}")
                     logger.error(f"Problematic transaction: {transaction}")
@@ -103,7 +208,7 @@ def worker(
             if transactions_processed > 0:
                 logger.info(f"Thread {threading.current_thread().name} processed {transactions_processed} transactions")
             else:
-                logger.debug(f"Thread {threading.current_thread().name} found no transactions to process")
+                logger.debug("Thread %s found no transactions to process", threading.current_thread().name)
                 
         except StopIteration:
             # This exception shouldn't be raised if dequeue_batch is implemented correctly,
@@ -116,11 +221,12 @@ def run_processing(
     queue: RedisQueue,
     categorization_service: EnhancedTransactionCategorizationService,
     num_workers: int,
-    batch_size: int
+    batch_size: int,
+    stop_event: Optional[threading.Event] = None
 ) -> None:
     with ThreadPoolExecutor(max_workers=num_workers) as executor:
         futures = [
-            executor.submit(process_batch, queue, categorization_service, batch_size)
+            executor.submit(process_batch, queue, categorization_service, batch_size, stop_event=stop_event)
             for _ in range(num_workers)
         ]
         
@@ -133,63 +239,216 @@ def run_processing(
 def process_batch(
     queue: RedisQueue,
     categorization_service: EnhancedTransactionCategorizationService,
-    batch_size: int
+    batch_size: int,
+    timeout: float = 0.1,
+    stop_event: Optional[threading.Event] = None
 ) -> None:
-    transaction_generator = queue.dequeue_batch(batch_size, timeout=0.1)
-    transactions_processed = 0
-    
-    for transaction in transaction_generator:
-        transactions_processed += 1
-        try:
-            logger.info(f"Thread {threading.current_thread().name} processing transaction: {transaction.get('id', 'Unknown ID')}")
-            process_transaction(transaction,queue, categorization_service)
-            logger.info(f"Thread {threading.current_thread().name} successfully processed transaction: {transaction.get('id', 'Unknown ID')}")
-        except Exception as e:
-            logger.error(f"Error processing transaction: {str(e)}")
-            logger.error(f"Problematic transaction: {transaction}")
-    
-    if transactions_processed > 0:
-        logger.info(f"Thread {threading.current_thread().name} processed {transactions_processed} transactions")
-    else:
-        logger.debug(f"Thread {threading.current_thread().name} found no transactions to process")
+    reliable = config["queue"].get("mode", "poll") == "reliable"
+    consumer = queue.consumer_name()
+    try:
+        while stop_event is None or not stop_event.is_set():
+            if reliable:
+                transactions = queue.dequeue_reliable(consumer, batch_size, config["queue"].get("block_timeout", 5))
+            else:
+                transactions = queue.pop_batch(batch_size)
+
+            if not transactions:
+                logger.debug("Thread %s found no transactions to process", threading.current_thread().name)
+                if reliable:
+                    queue.requeue_stale(config["queue"].get("stale_after", 300))
+                else:
+                    time.sleep(timeout)
+                continue
+
+            logger.info("Thread %s processing %d transactions", threading.current_thread().name, len(transactions))
+            if reliable:
+                # A batch outlasting 'stale_after' must not be requeued by a peer while it runs
+                with queue.keep_claim(consumer, config["queue"].get("stale_after", 300) / 3):
+                    succeeded = process_transactions(transactions, queue, categorization_service)
+                if succeeded:
+                    queue.acknowledge(consumer)
+                else:
+                    # Leave the batch for requeue_stale to deliver again
+                    logger.warning(f"Batch of {len(transactions)} transactions failed; it will be redelivered")
+                    queue.abandon(consumer)
+            else:
+                process_transactions(transactions, queue, categorization_service)
+            logger.info("Thread %s processed %d transactions", threading.current_thread().name, len(transactions))
+    finally:
+        # Release this worker thread's database session
+        remove_scoped_session()
+
+def _worker_process_main(
+    categorization_service: EnhancedTransactionCategorizationService,
+    num_threads: int,
+    batch_size: int,
+    slot: int = 0
+) -> None:
+    """Entry point of a forked worker process."""
+    # Connections inherited from the parent must not be shared; open this process's own
+    engine.dispose(close=False)
+    queue = create_queue()
+    start_metrics(port_offset=slot + 1)
+    start_model_hot_reload(categorization_service)
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+
+    logger.info(f"Worker process {os.getpid()} started with {num_threads} thread(s)")
+    run_processing(queue, categorization_service, num_threads, batch_size, stop_event)
+    logger.info(f"Worker process {os.getpid()} stopped")
+    # Forked processes exit without running exit handlers; write out queued log records now
+    shutdown_logging()
+
+def run_process_pool(
+    categorization_service: EnhancedTransactionCategorizationService,
+    num_processes: int,
+    threads_per_process: int,
+    batch_size: int,
+    shutdown_timeout: float = 30
+) -> None:
+    """
+    Fork 'num_processes' worker processes and supervise them until SIGTERM or SIGINT.
+
+    Workers are forked after the model and rule matchers are loaded, so they share those
+    pages copy-on-write. Dead workers are restarted; on shutdown every worker is asked to
+    finish its current batch and is killed if it has not exited within 'shutdown_timeout'.
+    """
+    context = multiprocessing.get_context("fork")
+    # Workers log through this process, so only one process writes and rotates the log file
+    start_worker_log_listener()
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+
+    processes: Dict[int, multiprocessing.Process] = {}
+
+    def start_worker(slot: int) -> None:
+        process = context.Process(
+            target=_worker_process_main,
+            args=(categorization_service, threads_per_process, batch_size, slot),
+            name=f"categorizer-worker-{slot}"
+        )
+        process.start()
+        processes[slot] = process
+        logger.info(f"Started worker process {process.name} (pid {process.pid})")
+
+    for slot in range(num_processes):
+        start_worker(slot)
+
+    while not stop_event.is_set():
+        for slot, process in list(processes.items()):
+            if not process.is_alive():
+                logger.warning(f"Worker process {process.name} (pid {process.pid}) exited with code {process.exitcode}. Restarting.")
+                WORKER_RESTARTS.inc()
+                start_worker(slot)
+        stop_event.wait(1)
+
+    logger.info("Stopping worker processes...")
+    for process in processes.values():
+        if process.is_alive():
+            process.terminate()
+    deadline = time.monotonic() + shutdown_timeout
+    for process in processes.values():
+        process.join(max(0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning(f"Worker process {process.name} (pid {process.pid}) did not stop in time. Killing it.")
+            process.kill()
+            process.join()
+    logger.info("All worker processes stopped.")
+
+def _load_sweep_checkpoint(checkpoint_path: Optional[str]) -> Optional[Tuple[Optional[datetime], int]]:
+    """Return the (date, id) of the last row a previous sweep processed, if any."""
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'r') as file:
+        checkpoint = json.load(file)
+    last_date = datetime.fromisoformat(checkpoint['date']) if checkpoint['date'] else None
+    return last_date, checkpoint['id']
+
+def _save_sweep_checkpoint(checkpoint_path: Optional[str], last_date: Optional[datetime], last_id: int) -> None:
+    if not checkpoint_path:
+        return
+    os.makedirs(os.path.dirname(checkpoint_path) or '.', exist_ok=True)
+    temp_path = f"{checkpoint_path}.tmp"
+    with open(temp_path, 'w') as file:
+        json.dump({'date': last_date.isoformat() if last_date else None, 'id': last_id}, file)
+    os.replace(temp_path, checkpoint_path)
 
 def categorize_uncategorized_transactions(
     categorization_service: EnhancedTransactionCategorizationService,
     batch_size: int = 100,
     transactionDBService: TransactionService = get_transaction_service(),
-    categoryDBService: CategoryService = get_category_service()
+    categoryRegistry: CategoryRegistry = get_category_registry(),
+    checkpoint_path: Optional[str] = None
 ) -> None:
-    while True:
-        batch = transactionDBService.get_latest_transactions_with_no_category(batch_size)
-        
-        if not batch:
-            break
-        
-        logger.info(f"Processing batch of {len(batch)} uncategorized transactions.")
+    """
+    Backfill categories for every uncategorized transaction, newest first.
 
-        for transaction in batch:
-            try:
-                category_name = categorization_service.categorize_transaction(
-                    transaction.narration,
-                    transaction.amount,
-                    transaction.date if transaction.date else None
-                )
-                logger.info(f"Uncategorized transaction: {transaction.narration} as {category_name}")
-                category = (
-                    categoryDBService.get_category(category_name)
-                    if isinstance(category_name, int)
-                    else categoryDBService.get_category_by_name(category_name)
-                )
-
-                if category:
-                    transactionDBService.update_transaction(transaction.id, {"category_id": category.id})
-                    logger.debug(f"Categorized transaction: {transaction.narration} as {category_name}")
+    Pages are streamed with keyset pagination and categorized with the batched path. After
+    each page the position is checkpointed to 'checkpoint_path', so a restarted sweep resumes
+    where the previous one stopped; the checkpoint is removed once the sweep completes.
+
+    After a page fails the checkpoint stays where it was for the rest of the sweep, so the
+    next sweep goes over the failed page again.
+    """
+    resume_from = _load_sweep_checkpoint(checkpoint_path)
+    if resume_from:
+        logger.info(f"Resuming uncategorized transaction sweep after {resume_from}")
+
+    started = time.monotonic()
+    processed = 0
+    categorized_total = 0
+    failed_pages = 0
+
+    for batch in transactionDBService.iter_uncategorized_transactions(batch_size, after=resume_from):
+        try:
+            categorized = categorization_service.batch_categorize([
+                {
+                    'id': transaction.id,
+                    'narration': transaction.narration,
+                    'amount': transaction.amount,
+                    'date': transaction.date if transaction.date else None
+                } for transaction in batch
+            ])
+
+            updates = []
+            for transaction, category_name in categorized:
+                logger.debug("Uncategorized transaction: %s as %s", transaction['narration'], category_name)
+                category_id = categoryRegistry.get_id(category_name)
+
+                if category_id:
+                    updates.append((transaction['id'], category_id))
                 else:
                     logger.warning(f"Category not found for name: {category_name}")
-            except Exception as e:
-                logger.error(f"Error categorizing transaction {transaction.id}: {str(e)}")
 
-    logger.info("Finished categorizing uncategorized transactions.")
+            updated = transactionDBService.bulk_update_categories(updates)
+            if updated is None:
+                logger.warning(f"Database update of {len(updates)} swept transactions was rolled back")
+                failed_pages += 1
+            else:
+                categorized_total += updated
+        except Exception as e:
+            logger.error(f"Error categorizing batch of uncategorized transactions: {str(e)}")
+            failed_pages += 1
+
+        processed += len(batch)
+        if not failed_pages:
+            _save_sweep_checkpoint(checkpoint_path, batch[-1].date, batch[-1].id)
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Swept {processed} uncategorized transactions ({categorized_total} categorized) "
+            f"at {processed / elapsed if elapsed else 0:.0f} rows/s"
+        )
+
+    if failed_pages:
+        logger.warning(f"{failed_pages} page(s) of the sweep failed; the next sweep resumes from the last checkpoint")
+    elif checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    logger.info(f"Finished categorizing uncategorized transactions: {categorized_total} of {processed} categorized.")
     
 def main() -> None:
     try:
@@ -201,6 +460,7 @@ def main() -> None:
         try:
             transactionDBService.get_latest_transactions_with_no_category(1)
             categoryDBService.get_category(2)
+            get_category_registry().refresh()
             logger.info("Database connection successful")
         except Exception as e:
             logger.error(f"Database connection failed: {str(e)}")
@@ -210,18 +470,34 @@ def main() -> None:
             logger.info("Training model on startup...")
             train_model(config["model"]["path"], logger, transactionDBService)
         
-        queue = RedisQueue(
-            port=config["queue"]["port"],
-            password=config["queue"]["password"],
-            queue_name=config["queue"]["queue_name"],
-        )
+        queue = create_queue()
+        QUEUE_DEPTH.set_function(queue.size)
+        start_metrics()
        
         categorization_service = EnhancedTransactionCategorizationService(model_path=config["model"]["path"])
         
         if config["features"]["categorize_uncategorized_on_startup"]:
             logger.info("Categorizing uncategorized transactions on startup...")
-            categorize_uncategorized_transactions(categorization_service, config["performance"]["batch_size"])
+            categorize_uncategorized_transactions(
+                categorization_service,
+                config["backfill"]["page_size"],
+                checkpoint_path=config["backfill"]["checkpoint_path"]
+            )
         
+        if config["performance"].get("execution_mode", "thread") == "process":
+            # Load everything the workers share before forking them
+            if config["features"]["categorise_with_model"]:
+                categorization_service.ml_model
+            logger.info(f"Starting transaction processing with {config['performance']['num_processes']} worker processes...")
+            run_process_pool(
+                categorization_service,
+                config["performance"]["num_processes"],
+                config["performance"]["max_concurrent_workers"],
+                config["performance"]["batch_size"]
+            )
+            return
+
+        start_model_hot_reload(categorization_service)
         logger.info(f"Starting transaction processing with {config['performance']['max_concurrent_workers']} workers...")
         
         while True:
@@ -0,0 +1,253 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import signal
+import time
+from typing import List, Optional, Tuple
+
+from app import resolve_category_updates, select_unprocessed, start_metrics, start_model_hot_reload
+from src.database.db_connector import remove_scoped_session
+from src.database.db_utils import CategoryRegistry, TransactionService, get_category_registry, get_transaction_service
+from src.transaction_categorization.categorize import EnhancedTransactionCategorizationService
+from src.utils.async_queue import AsyncRedisQueue
+from src.utils.config_utils import config
+from src.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+@dataclass
+class PipelineBatch:
+    consumer: str
+    raw_items: List[str]
+    transactions: List[dict]
+    claimed_ids: List = field(default_factory=list)
+    categorized: List[Tuple[dict, str]] = field(default_factory=list)
+
+class AsyncProcessingPipeline:
+    """
+    Queue processing as four concurrent stages connected by bounded queues:
+
+        fetch -> claim -> categorize -> write-back
+
+    Fetch and claim talk to Redis through redis.asyncio. The database calls and the
+    categorization of whole batches run in thread pools, so many batches overlap their
+    network waits while the event loop keeps the stages fed. A full stage queue blocks the
+    stage before it, which bounds the number of batches in flight.
+
+    While it runs, the pipeline refreshes its consumers' claims every third of 'stale_after',
+    so batches waiting in a full stage queue are not requeued by peers. A batch that fails
+    in any stage is set aside for redelivery instead of being acknowledged.
+    """
+
+    def __init__(
+        self,
+        queue: AsyncRedisQueue,
+        categorization_service: EnhancedTransactionCategorizationService,
+        transactionDBService: TransactionService,
+        categoryRegistry: CategoryRegistry,
+        batch_size: int = 30,
+        fetchers: int = 2,
+        categorizers: int = 2,
+        writers: int = 4,
+        queue_size: int = 8,
+        block_timeout: float = 5,
+        stale_after: float = 300,
+    ):
+        self.queue = queue
+        self.categorization_service = categorization_service
+        self.transactionDBService = transactionDBService
+        self.categoryRegistry = categoryRegistry
+        self.batch_size = batch_size
+        self.fetchers = fetchers
+        self.categorizers = categorizers
+        self.writers = writers
+        self.block_timeout = block_timeout
+        self.stale_after = stale_after
+        self._claim_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._categorize_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._write_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._cpu_executor = ThreadPoolExecutor(max_workers=categorizers, thread_name_prefix="categorize")
+        self._io_executor = ThreadPoolExecutor(max_workers=writers + 1, thread_name_prefix="db")
+        self.processed = 0
+        self.updated = 0
+        self.failed = 0
+
+    async def _run_io(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._io_executor, function, *args)
+
+    async def _fetch(self, consumer: str, stop_event: asyncio.Event) -> None:
+        while not stop_event.is_set():
+            try:
+                raw_items, transactions = await self.queue.dequeue_reliable(consumer, self.batch_size, self.block_timeout)
+                if not raw_items:
+                    await self.queue.requeue_stale(self.stale_after)
+                    continue
+                await self._claim_queue.put(PipelineBatch(consumer, raw_items, transactions))
+            except Exception as e:
+                logger.error(f"Error fetching transactions: {str(e)}")
+                await asyncio.sleep(self.block_timeout)
+
+    async def _keep_claims(self, consumers: List[str]) -> None:
+        """Refresh the consumers' claims until cancelled, however long their batches wait."""
+        while True:
+            await asyncio.sleep(self.stale_after / 3)
+            try:
+                await self.queue.refresh_claims(consumers)
+            except Exception as e:
+                logger.error(f"Error refreshing queue claims: {str(e)}")
+
+    async def _claim(self) -> None:
+        while True:
+            batch = await self._claim_queue.get()
+            try:
+                batch.claimed_ids = await self.queue.claim_batch(
+                    list(dict.fromkeys(transaction['id'] for transaction in batch.transactions if 'id' in transaction)),
+                    ttl=300
+                )
+                batch.transactions = await self._run_io(
+                    select_unprocessed, batch.transactions, batch.claimed_ids, self.transactionDBService
+                )
+                await self._categorize_queue.put(batch)
+            except Exception as e:
+                logger.error(f"Error claiming batch of {len(batch.raw_items)} transactions: {str(e)}")
+                await self._finish(batch, succeeded=False)
+            finally:
+                self._claim_queue.task_done()
+
+    async def _categorize(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._categorize_queue.get()
+            try:
+                if batch.transactions:
+                    batch.categorized = await loop.run_in_executor(
+                        self._cpu_executor, self.categorization_service.batch_categorize, batch.transactions
+                    )
+                await self._write_queue.put(batch)
+            except Exception as e:
+                logger.error(f"Error categorizing batch of {len(batch.transactions)} transactions: {str(e)}")
+                await self._finish(batch, succeeded=False)
+            finally:
+                self._categorize_queue.task_done()
+
+    async def _write(self) -> None:
+        while True:
+            batch = await self._write_queue.get()
+            succeeded = False
+            try:
+                if batch.categorized:
+                    updates = await self._run_io(resolve_category_updates, batch.categorized, self.categoryRegistry)
+                    updated = await self._run_io(self.transactionDBService.bulk_update_categories, updates)
+                    if updated is None:
+                        logger.warning(f"Database update of {len(updates)} transactions was rolled back")
+                    else:
+                        self.updated += updated
+                        if updated != len(updates):
+                            logger.warning(f"Database update applied to {updated} of {len(updates)} transactions")
+                        succeeded = True
+                else:
+                    succeeded = True
+            except Exception as e:
+                logger.error(f"Error writing back batch of {len(batch.categorized)} transactions: {str(e)}")
+            finally:
+                await self._finish(batch, succeeded)
+                self._write_queue.task_done()
+
+    async def _finish(self, batch: PipelineBatch, succeeded: bool) -> None:
+        """
+        Acknowledge a written batch, or set a failed one aside for redelivery, and release
+        its transaction claims.
+        """
+        self.processed += len(batch.raw_items)
+        try:
+            if succeeded:
+                await self.queue.acknowledge(batch.consumer, batch.raw_items)
+            else:
+                self.failed += len(batch.raw_items)
+                await self.queue.abandon(batch.consumer, batch.raw_items)
+            await self.queue.release_batch(batch.claimed_ids)
+        except Exception as e:
+            logger.error(f"Error finishing batch of {len(batch.raw_items)} transactions: {str(e)}")
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        """Process the queue until 'stop_event' is set, then drain the batches in flight."""
+        started = time.monotonic()
+        consumers = [self.queue.consumer_name(f"async-{index}") for index in range(self.fetchers)]
+        claim_keeper = asyncio.create_task(self._keep_claims(consumers))
+        fetchers = [asyncio.create_task(self._fetch(consumer, stop_event)) for consumer in consumers]
+        stages = (
+            [asyncio.create_task(self._claim()) for _ in range(self.fetchers)]
+            + [asyncio.create_task(self._categorize()) for _ in range(self.categorizers)]
+            + [asyncio.create_task(self._write()) for _ in range(self.writers)]
+        )
+
+        # A failed fetcher must not stop the batches already buffered from draining
+        for result in await asyncio.gather(*fetchers, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Fetcher stopped with an error: {str(result)}")
+        for stage_queue in (self._claim_queue, self._categorize_queue, self._write_queue):
+            await stage_queue.join()
+        for task in stages + [claim_keeper]:
+            task.cancel()
+        await asyncio.gather(*stages, claim_keeper, return_exceptions=True)
+
+        # Release the database sessions of the executor threads
+        for _ in range(self._io_executor._max_workers):
+            self._io_executor.submit(remove_scoped_session)
+        self._cpu_executor.shutdown()
+        self._io_executor.shutdown()
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Pipeline stopped after {self.processed} transactions ({self.updated} categorized, {self.failed} failed) "
+            f"at {self.processed / elapsed if elapsed else 0:.0f} transactions/s"
+        )
+
+async def run_pipeline(
+    categorization_service: EnhancedTransactionCategorizationService,
+    queue: Optional[AsyncRedisQueue] = None,
+) -> None:
+    async_conf = config["performance"].get("async_pipeline", {})
+    queue = queue or AsyncRedisQueue(
+        host=config["queue"]["host"] or 'localhost',
+        port=config["queue"]["port"],
+        password=config["queue"]["password"],
+        queue_name=config["queue"]["queue_name"],
+    )
+    pipeline = AsyncProcessingPipeline(
+        queue,
+        categorization_service,
+        get_transaction_service(),
+        get_category_registry(),
+        batch_size=config["performance"]["batch_size"],
+        fetchers=async_conf.get("fetchers", 2),
+        categorizers=async_conf.get("categorizers", 2),
+        writers=async_conf.get("writers", 4),
+        queue_size=async_conf.get("queue_size", 8),
+        block_timeout=config["queue"].get("block_timeout", 5),
+        stale_after=config["queue"].get("stale_after", 300),
+    )
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop_event.set)
+
+    try:
+        await pipeline.run(stop_event)
+    finally:
+        await queue.close()
+
+def main() -> None:
+    try:
+        get_category_registry().refresh()
+        start_metrics()
+        categorization_service = EnhancedTransactionCategorizationService(model_path=config["model"]["path"])
+        start_model_hot_reload(categorization_service)
+        logger.info("Starting asynchronous transaction processing pipeline...")
+        asyncio.run(run_pipeline(categorization_service))
+    except Exception as e:
+        logger.error(f"Fatal error in async pipeline: {str(e)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Compare per-row model predictions with one batched prediction.
+
+Usage:
+    python -m benchmarks.batch_predict [batch_size ...]
+"""
+import random
+import sys
+import time
+
+import joblib
+
+from benchmarks.synthetic import generate_narrations
+from src.transaction_categorization.categorization_rules import predict_category_ids
+from src.utils.config_utils import config
+
+
+def main(batch_sizes=(30, 300, 1000)) -> None:
+    model = joblib.load(config["model"]["path"])
+    rng = random.Random(42)
+
+    for batch_size in batch_sizes:
+        narrations = generate_narrations(batch_size)
+        amounts = [rng.randint(10, 50_000) for _ in narrations]
+
+        start = time.perf_counter()
+        per_row = [
+            predict_category_ids([narration], [amount], model)[0]
+            for narration, amount in zip(narrations, amounts)
+        ]
+        per_row_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = predict_category_ids(narrations, amounts, model)
+        batched_time = time.perf_counter() - start
+
+        assert per_row == batched
+        print(
+            f"batch {batch_size:>5}: per-row {batch_size / per_row_time:>9,.0f}/s, "
+            f"batched {batch_size / batched_time:>9,.0f}/s, "
+            f"speedup {per_row_time / batched_time:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or (30, 300, 1000))
@@ -0,0 +1,92 @@
+"""
+Check that the compiled model predicts exactly what the Pipeline does, row by row and in
+batches, and compare their prediction latency per batch size. Early-exit prediction is
+checked to reach the same decisions against the confidence threshold as evaluating every
+tree.
+
+Parity is checked on the stored training data plus synthetic narrations; the script exits
+with status 1 on any mismatch.
+
+Usage:
+    python -m benchmarks.compiled_inference [batch_size ...]
+"""
+import logging
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_narrations
+from src.transaction_categorization.data_loader import load_keyword_categories
+from src.transaction_categorization.model_artifact import compile_pipeline
+from src.transaction_categorization.training_store import get_training_store
+from src.utils.config_utils import config
+
+
+def main(batch_sizes=(1, 30, 300), repeats: int = 50) -> int:
+    logging.disable(logging.INFO)
+    pipeline = joblib.load(config["model"]["path"])
+    compiled = compile_pipeline(pipeline)
+
+    data = get_training_store().load().dropna(subset=['narration', 'amount'])
+    narrations = data['narration'].tolist() + generate_narrations(2_000, load_keyword_categories())
+    amounts = data['amount'].astype(float).tolist() + list(np.random.default_rng(42).uniform(10, 50_000, 2_000))
+
+    expected = pipeline.predict(pd.DataFrame({'narration': narrations, 'amount': amounts}))
+    expected_proba = pipeline.predict_proba(pd.DataFrame({'narration': narrations, 'amount': amounts}))
+    batch_mismatches = int((compiled.predict_arrays(narrations, amounts) != expected).sum())
+    proba_difference = float(np.abs(compiled.predict_proba_arrays(narrations, amounts) - expected_proba).max())
+    single_mismatches = sum(
+        compiled.predict_arrays([narration], [amount])[0] != prediction
+        for narration, amount, prediction in zip(narrations[:1_000], amounts[:1_000], expected[:1_000])
+    )
+
+    print(f"batch prediction mismatches:  {batch_mismatches} of {len(narrations)}")
+    print(f"single-row mismatches:        {single_mismatches} of {min(len(narrations), 1_000)}")
+    print(f"max probability difference:   {proba_difference:.3g}")
+
+    confidence_conf = config["categorization"].get("ml_confidence", {})
+    threshold = float(confidence_conf.get("threshold", 0.5))
+    check_every = int(confidence_conf.get("check_every", 10))
+    features = compiled.transform(narrations, amounts)
+    expected_confidence = expected_proba.max(axis=1)
+    labels, confidence, trees_evaluated = compiled.predict_confident_features(features, threshold, check_every)
+    confident = confidence >= threshold
+    early_exit_mismatches = int(
+        (confident != (expected_confidence >= threshold)).sum() + (labels[confident] != expected[confident]).sum()
+    )
+    print(f"early-exit mismatches:        {early_exit_mismatches} of {len(narrations)} (threshold {threshold})")
+    print(f"trees evaluated per row:      {trees_evaluated.mean():.1f} of {len(compiled.tree_roots)}")
+    print(f"below the threshold:          {(~confident).mean():.1%}")
+
+    for batch_size in batch_sizes:
+        batch_narrations, batch_amounts = narrations[:batch_size], amounts[:batch_size]
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            pipeline.predict(pd.DataFrame({'narration': batch_narrations, 'amount': batch_amounts}))
+        pipeline_time = (time.perf_counter() - start) / repeats
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            compiled.predict_arrays(batch_narrations, batch_amounts)
+        compiled_time = (time.perf_counter() - start) / repeats
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            compiled.predict_confident_arrays(batch_narrations, batch_amounts, threshold, check_every)
+        early_exit_time = (time.perf_counter() - start) / repeats
+
+        print(
+            f"batch {batch_size:>5}: Pipeline.predict {pipeline_time * 1000:8.2f} ms, "
+            f"compiled {compiled_time * 1000:7.2f} ms, speedup {pipeline_time / compiled_time:5.1f}x, "
+            f"early exit {early_exit_time * 1000:7.2f} ms"
+        )
+
+    return 1 if batch_mismatches or single_mismatches or early_exit_mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main([int(arg) for arg in sys.argv[1:]] or (1, 30, 300)))
@@ -0,0 +1,41 @@
+"""
+Compare `match_by_keyword` with the compiled `KeywordMatcher`.
+
+Usage:
+    python -m benchmarks.keyword_matcher [count]
+"""
+import sys
+import time
+
+from benchmarks.synthetic import generate_narrations
+from src.transaction_categorization.categorization_rules import KeywordMatcher, match_by_keyword
+from src.transaction_categorization.data_loader import load_keyword_categories
+
+
+def main(count: int = 100_000) -> None:
+    keyword_categories = load_keyword_categories()
+    narrations = generate_narrations(count, keyword_categories)
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(keyword_categories)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = [match_by_keyword(narration, keyword_categories) for narration in narrations]
+    linear_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [matcher.match(narration) for narration in narrations]
+    compiled_time = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    print(f"narrations:        {count}")
+    print(f"matcher build:     {build_time * 1000:.1f} ms")
+    print(f"match_by_keyword:  {linear_time:.3f} s ({count / linear_time:,.0f}/s)")
+    print(f"KeywordMatcher:    {compiled_time:.3f} s ({count / compiled_time:,.0f}/s)")
+    print(f"speedup:           {linear_time / compiled_time:.1f}x")
+    print(f"mismatches:        {mismatches}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,55 @@
+"""
+Compare `match_by_merchant` with the compiled `MerchantMatcher`.
+
+Usage:
+    python -m benchmarks.merchant_matcher [count] [merchants]
+
+`merchants` pads the YAML merchant list with synthetic names to simulate a larger list.
+"""
+import random
+import sys
+import time
+
+from benchmarks.synthetic import generate_narrations
+from src.transaction_categorization.categorization_rules import MerchantMatcher, match_by_merchant
+from src.transaction_categorization.data_loader import load_merchant_categories
+
+
+def main(count: int = 100_000, merchants: int = 0) -> None:
+    merchant_categories = dict(load_merchant_categories())
+    rng = random.Random(7)
+    while len(merchant_categories) < merchants:
+        name = " ".join(
+            "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(rng.randint(4, 8)))
+            for _ in range(rng.randint(1, 3))
+        )
+        merchant_categories[name] = "shopping"
+    narrations = generate_narrations(count)
+
+    start = time.perf_counter()
+    matcher = MerchantMatcher(merchant_categories)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = [match_by_merchant(narration, merchant_categories) for narration in narrations]
+    linear_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [matcher.match(narration) for narration in narrations]
+    compiled_time = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    print(f"narrations:         {count}")
+    print(f"merchants:          {len(merchant_categories)}")
+    print(f"matcher build:      {build_time * 1000:.1f} ms")
+    print(f"match_by_merchant:  {linear_time:.3f} s ({count / linear_time:,.0f}/s)")
+    print(f"MerchantMatcher:    {compiled_time:.3f} s ({count / compiled_time:,.0f}/s)")
+    print(f"speedup:            {linear_time / compiled_time:.1f}x")
+    print(f"mismatches:         {mismatches}")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 0,
+    )
@@ -0,0 +1,53 @@
+"""
+Compare loading the joblib Pipeline with memory-mapping the model artifact, and check that
+both predict the same categories on the stored training data.
+
+Usage:
+    python -m benchmarks.model_artifact [repeats]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import joblib
+
+from src.transaction_categorization.model_artifact import load_artifact, save_artifact
+from src.transaction_categorization.training_store import get_training_store
+from src.utils.config_utils import config
+
+
+def main(repeats: int = 20) -> None:
+    model_path = config["model"]["path"]
+    artifact_path = os.path.join(tempfile.mkdtemp(), "model.tcm")
+
+    pipeline = joblib.load(model_path)
+    save_artifact(pipeline, artifact_path)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        joblib.load(model_path)
+    joblib_time = (time.perf_counter() - start) / repeats
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        compiled = load_artifact(artifact_path)
+    artifact_time = (time.perf_counter() - start) / repeats
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        load_artifact(artifact_path, verify=False)
+    unverified_time = (time.perf_counter() - start) / repeats
+
+    data = get_training_store().load()
+    features = data[['narration', 'amount']]
+    mismatches = int((pipeline.predict(features) != compiled.predict(features)).sum())
+
+    print(f"joblib.load:                 {joblib_time * 1000:.2f} ms")
+    print(f"load_artifact:               {artifact_time * 1000:.2f} ms")
+    print(f"load_artifact (no checksum): {unverified_time * 1000:.2f} ms")
+    print(f"prediction mismatches:       {mismatches} of {len(features)}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,50 @@
+"""
+Compare the daily model update as a full refit with the incremental update, for growing
+amounts of training history.
+
+The stored training data is resampled to each history size; a day's new data is a
+held-out slice of the same distribution.
+
+Usage:
+    python -m benchmarks.model_update [history_size ...]
+"""
+import copy
+import logging
+import sys
+import time
+
+import pandas as pd
+
+from src.transaction_categorization.model_trainer import build_pipeline, incremental_update_model
+from src.transaction_categorization.training_store import get_training_store
+
+
+def main(history_sizes=(2_000, 10_000, 50_000), new_size: int = 500) -> None:
+    logger = logging.getLogger(__name__)
+    logging.disable(logging.INFO)
+    data = get_training_store().load()
+    data = data.dropna(subset=['narration', 'amount', 'category_id'])
+
+    for history_size in history_sizes:
+        sample = data.sample(history_size + new_size, replace=True, random_state=42).reset_index(drop=True)
+        history, new_data = sample.iloc[:history_size], sample.iloc[history_size:]
+
+        base = build_pipeline().fit(history[['narration', 'amount']], history['category_id'])
+
+        start = time.perf_counter()
+        combined = pd.concat([history, new_data], ignore_index=True)
+        build_pipeline().fit(combined[['narration', 'amount']], combined['category_id'])
+        refit_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        incremental_update_model(copy.deepcopy(base), new_data, logger)
+        incremental_time = time.perf_counter() - start
+
+        print(
+            f"history {history_size:>7,} + new {new_size}: full refit {refit_time:7.2f} s, "
+            f"incremental {incremental_time:6.2f} s, speedup {refit_time / incremental_time:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or (2_000, 10_000, 50_000))
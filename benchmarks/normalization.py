@@ -0,0 +1,105 @@
+"""
+Compare tokenizing narrations in every stage, as before, with the shared cached
+tokenization, on the retrain path (pipeline fit and evaluation) and the serve path
+(prediction cache key and model features, after the keyword and merchant rules).
+
+Training rows are resampled from the stored training data; served narrations are drawn
+with repeats from a pool of synthetic ones, as recurring transactions are in production.
+
+Usage:
+    python -m benchmarks.normalization [training_rows] [served_narrations]
+"""
+import logging
+import random
+import re
+import sys
+import time
+from typing import List
+
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split
+
+from benchmarks.synthetic import generate_narrations
+from src.transaction_categorization.categorization_rules import KeywordMatcher, MerchantMatcher
+from src.transaction_categorization.data_loader import load_keyword_categories, load_merchant_categories
+from src.transaction_categorization.model_trainer import build_pipeline
+from src.transaction_categorization.training_store import get_training_store
+from src.transaction_categorization.text_utils import narration_tokens, text_processor
+from src.utils.config_utils import config
+
+
+def legacy_text_processor(text: str) -> List[str]:
+    """text_processor before the shared tokenization."""
+    text = re.sub(r'[^\w\s]', '', text.lower())
+    return text.split()
+
+
+def time_retrain(data, analyzer) -> float:
+    narration_tokens.cache_clear()
+    start = time.perf_counter()
+    X_train, X_test, y_train, y_test = train_test_split(
+        data[['narration', 'amount']], data['category_id'], test_size=config["model"]["test_size"], random_state=config["model"]["random_state"]
+    )
+    model = build_pipeline().set_params(preprocessor__text__analyzer=analyzer)
+    model.fit(X_train, y_train)
+    model.score(X_test, y_test)
+    return time.perf_counter() - start
+
+
+def time_vectorizer(narrations: List[str], analyzer) -> float:
+    """Fit the TF-IDF vectorizer and transform the narrations again, as fitting and evaluating do."""
+    narration_tokens.cache_clear()
+    start = time.perf_counter()
+    vectorizer = clone(build_pipeline().named_steps['preprocessor'].transformers[0][1]).set_params(analyzer=analyzer)
+    vectorizer.fit_transform(narrations)
+    vectorizer.transform(narrations)
+    return time.perf_counter() - start
+
+
+def main(training_rows: int = 50_000, served: int = 100_000) -> None:
+    logging.disable(logging.INFO)
+
+    data = get_training_store().load().dropna(subset=['narration', 'amount', 'category_id'])
+    data = data.sample(training_rows, replace=True, random_state=42).reset_index(drop=True)
+    narrations = data['narration'].tolist()
+    legacy_vectorizer = time_vectorizer(narrations, legacy_text_processor)
+    shared_vectorizer = time_vectorizer(narrations, text_processor)
+    legacy_retrain = time_retrain(data, legacy_text_processor)
+    shared_retrain = time_retrain(data, text_processor)
+    print(f"TF-IDF {training_rows:,} rows:    per stage {legacy_vectorizer:6.2f} s, shared {shared_vectorizer:6.2f} s")
+    print(f"retrain {training_rows:,} rows:   per stage {legacy_retrain:6.2f} s, shared {shared_retrain:6.2f} s")
+
+    keyword_categories = load_keyword_categories()
+    merchant_categories = load_merchant_categories()
+    keyword_matcher = KeywordMatcher(keyword_categories)
+    merchant_matcher = MerchantMatcher(merchant_categories)
+    pool = generate_narrations(5_000, keyword_categories)
+    rng = random.Random(42)
+    narrations = [rng.choice(pool) for _ in range(served)]
+
+    start = time.perf_counter()
+    for narration in narrations:
+        keyword_matcher.match(narration)
+        merchant_matcher.match(narration)
+        " ".join(legacy_text_processor(narration))
+        legacy_text_processor(narration)
+    legacy_serve = time.perf_counter() - start
+
+    narration_tokens.cache_clear()
+    start = time.perf_counter()
+    for narration in narrations:
+        keyword_matcher.match(narration)
+        merchant_matcher.match(narration)
+        " ".join(narration_tokens(narration))
+        narration_tokens(narration)
+    shared_serve = time.perf_counter() - start
+
+    print(
+        f"serve {served:,} narrations: per stage {legacy_serve:6.2f} s, shared {shared_serve:6.2f} s "
+        f"({served / legacy_serve:,.0f}/s -> {served / shared_serve:,.0f}/s)"
+    )
+    print(f"tokenization cache:       {narration_tokens.cache_info()}")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,277 @@
+"""
+Time each categorization stage in isolation and report latency percentiles and throughput
+as JSON, so runs before and after a change can be compared.
+
+The database is an in-memory SQLite copy of the schema and the queue is fakeredis, so the
+numbers measure this code rather than the network.
+
+Usage:
+    python -m benchmarks.stages [--stages keyword_match forest_predict ...]
+                                [--iterations 1000] [--batch-size 30] [--output results.json]
+"""
+import argparse
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import json
+import logging
+import platform
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, update
+from sqlalchemy.pool import StaticPool
+
+from benchmarks.synthetic import generate_narrations
+from src.database.db_connector import Base, SessionLocal
+from src.database.db_utils import get_category_registry, get_transaction_service
+from src.models.models import Category, Transaction
+from src.transaction_categorization.categorize import EnhancedTransactionCategorizationService
+from src.transaction_categorization.model_artifact import CompiledPipeline
+from src.utils.config_utils import config
+from src.utils.utils import RedisQueue
+
+
+@dataclass
+class BenchmarkContext:
+    narrations: List[str]
+    amounts: List[float]
+    batch_size: int
+    service: EnhancedTransactionCategorizationService
+    engine: object
+
+
+def measure(
+    function: Callable[[], object],
+    iterations: int,
+    ops_per_call: int = 1,
+    warmup: int = 10,
+    setup: Optional[Callable[[], None]] = None,
+) -> Dict[str, float]:
+    """Call 'function' repeatedly and summarize its latency; 'setup' runs untimed before every call."""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        function()
+
+    timings = np.empty(iterations, dtype=np.float64)
+    for iteration in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings[iteration] = time.perf_counter() - start
+
+    total = timings.sum()
+    return {
+        "iterations": iterations,
+        "ops_per_call": ops_per_call,
+        "p50_ms": float(np.percentile(timings, 50) * 1000),
+        "p99_ms": float(np.percentile(timings, 99) * 1000),
+        "mean_ms": float(timings.mean() * 1000),
+        "ops_per_sec": float(iterations * ops_per_call / total) if total else 0.0,
+    }
+
+
+def _cycle(values: List):
+    """Return a function yielding the next value on each call, wrapping around."""
+    position = [0]
+
+    def next_value():
+        value = values[position[0] % len(values)]
+        position[0] += 1
+        return value
+    return next_value
+
+
+def bench_keyword_match(context: BenchmarkContext, iterations: int) -> Dict:
+    matcher = context.service.keyword_matcher
+    narration = _cycle(context.narrations)
+    return measure(lambda: matcher.match(narration()), iterations)
+
+
+def bench_merchant_match(context: BenchmarkContext, iterations: int) -> Dict:
+    matcher = context.service.merchant_matcher
+    narration = _cycle(context.narrations)
+    return measure(lambda: matcher.match(narration()), iterations)
+
+
+def _batches(context: BenchmarkContext):
+    size = context.batch_size
+    return _cycle([
+        (context.narrations[start:start + size], context.amounts[start:start + size])
+        for start in range(0, len(context.narrations) - size + 1, size)
+    ])
+
+
+def _batch_list(context: BenchmarkContext, count: int = 20) -> List:
+    batch = _batches(context)
+    return [batch() for _ in range(count)]
+
+
+def bench_tfidf_transform(context: BenchmarkContext, iterations: int) -> Dict:
+    model = context.service.ml_model
+    batch = _batches(context)
+    if isinstance(model, CompiledPipeline):
+        transform = lambda: model.transform(*batch())
+    else:
+        preprocessor = model.named_steps['preprocessor']
+        transform = lambda: preprocessor.transform(pd.DataFrame(dict(zip(('narration', 'amount'), batch()))))
+    return measure(transform, iterations, ops_per_call=context.batch_size)
+
+
+def bench_forest_predict(context: BenchmarkContext, iterations: int) -> Dict:
+    model = context.service.ml_model
+    if isinstance(model, CompiledPipeline):
+        features = _cycle([model.transform(*batch) for batch in _batch_list(context)])
+        predict = lambda: model.predict_proba_features(features())
+    else:
+        preprocessor = model.named_steps['preprocessor']
+        forest = model.named_steps['clf']
+        features = _cycle([
+            preprocessor.transform(pd.DataFrame({'narration': narrations, 'amount': amounts}))
+            for narrations, amounts in _batch_list(context)
+        ])
+        predict = lambda: forest.predict(features())
+    return measure(predict, iterations, ops_per_call=context.batch_size)
+
+
+def bench_categorize_transaction(context: BenchmarkContext, iterations: int) -> Dict:
+    service = context.service
+    transaction = _cycle(list(zip(context.narrations, context.amounts)))
+    return measure(lambda: service.categorize_transaction(*transaction()), iterations)
+
+
+def bench_batch_categorize(context: BenchmarkContext, iterations: int) -> Dict:
+    service = context.service
+    batch = _cycle([
+        [{'narration': narration, 'amount': amount} for narration, amount in zip(*pair)]
+        for pair in _batch_list(context)
+    ])
+    return measure(lambda: service.batch_categorize(batch()), iterations, ops_per_call=context.batch_size)
+
+
+def bench_queue_round_trip(context: BenchmarkContext, iterations: int) -> Dict:
+    """Enqueue a batch, dequeue it reliably, categorize it, write it back and acknowledge it."""
+    try:
+        import fakeredis
+    except ImportError:
+        return {"skipped": "fakeredis is not installed"}
+    from app import process_transactions
+
+    queue = RedisQueue(queue_name="benchmark_queue", redis_client=fakeredis.FakeRedis(decode_responses=True))
+    consumer = "benchmark"
+    payloads = [
+        json.dumps({'id': index, 'narration': context.narrations[index - 1], 'amount': context.amounts[index - 1]})
+        for index in range(1, context.batch_size + 1)
+    ]
+    transaction_service = get_transaction_service()
+    category_registry = get_category_registry()
+
+    def reset() -> None:
+        with context.engine.begin() as connection:
+            connection.execute(update(Transaction).values(category_id=None))
+
+    def round_trip() -> None:
+        queue.redis_client.rpush(queue.queue_name, *payloads)
+        transactions = queue.dequeue_reliable(consumer, context.batch_size, timeout=1)
+        process_transactions(transactions, queue, context.service, transaction_service, category_registry)
+        queue.acknowledge(consumer)
+
+    return measure(round_trip, iterations, ops_per_call=context.batch_size, setup=reset)
+
+
+STAGES = {
+    "keyword_match": bench_keyword_match,
+    "merchant_match": bench_merchant_match,
+    "tfidf_transform": bench_tfidf_transform,
+    "forest_predict": bench_forest_predict,
+    "categorize_transaction": bench_categorize_transaction,
+    "batch_categorize": bench_batch_categorize,
+    "queue_round_trip": bench_queue_round_trip,
+}
+
+# Per-item stages run many more iterations than the batch stages for the same wall time
+ITERATION_SCALE = {"keyword_match": 10, "merchant_match": 10}
+
+
+def create_database(service: EnhancedTransactionCategorizationService, narrations: List[str], amounts: List[float]):
+    """Create an in-memory SQLite database with the categories the rules and model produce."""
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[Category.__table__, Transaction.__table__])
+    SessionLocal.configure(bind=engine)
+
+    names = list(dict.fromkeys(list(service.keyword_categories) + list(service.merchant_categories.values())))
+    model_ids = [int(category_id) for category_id in service.ml_model.classes_] if config["features"]["categorise_with_model"] else []
+    category_ids = sorted(set(model_ids) | set(range(1, len(names) + 1)))
+    session = SessionLocal()
+    try:
+        for position, category_id in enumerate(category_ids):
+            name = names[position] if position < len(names) else f"category_{category_id}"
+            session.add(Category(id=category_id, name=name))
+        start = datetime(2024, 1, 1)
+        for index, (narration, amount) in enumerate(zip(narrations, amounts), 1):
+            session.add(Transaction(
+                id=index, transaction_id=str(index), type='debit', amount=int(amount), narration=narration,
+                balance=0, currency='KES', date=start + timedelta(minutes=index)
+            ))
+        session.commit()
+    finally:
+        session.close()
+    get_category_registry().refresh()
+    return engine
+
+
+def run(stages: List[str], iterations: int, batch_size: int, count: int, cache: bool) -> Dict:
+    service = EnhancedTransactionCategorizationService(model_path=config["model"]["path"])
+    if not cache:
+        # Measure the model itself rather than prediction cache hits
+        service.prediction_cache = None
+
+    narrations = generate_narrations(max(count, batch_size), service.keyword_categories)
+    rng = random.Random(42)
+    amounts = [float(rng.randint(10, 50_000)) for _ in narrations]
+    engine = create_database(service, narrations[:batch_size], amounts[:batch_size])
+    context = BenchmarkContext(narrations, amounts, batch_size, service, engine)
+
+    results = {}
+    for stage in stages:
+        results[stage] = STAGES[stage](context, iterations * ITERATION_SCALE.get(stage, 1))
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "model": type(service.ml_model).__name__,
+        "batch_size": batch_size,
+        "prediction_cache": cache,
+        "stages": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per stage (x10 for rule matchers)")
+    parser.add_argument("--batch-size", type=int, default=30)
+    parser.add_argument("--narrations", type=int, default=10_000, help="synthetic narrations to cycle through")
+    parser.add_argument("--cache", action="store_true", help="keep the prediction cache enabled")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep application INFO logging")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    report = run(args.stages, args.iterations, args.batch_size, args.narrations, args.cache)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
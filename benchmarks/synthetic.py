@@ -0,0 +1,48 @@
+import random
+from typing import Dict, List, Optional
+
+TEMPLATES = [
+    "Customer Transfer to 2547{d:02d}***{n:04d} - {name}",
+    "Pay Bill Online to {paybill} - {merchant}",
+    "Merchant Payment to {till} - {merchant}",
+    "Business Payment from {paybill} - {merchant}. via API. Original conversation ID is TR-UTSA/{ref}",
+    "Customer Payment to Small Business to 2547{d:02d}***{n:04d} - {name}",
+    "Buy Goods and Services to {till} - {merchant} {keyword}",
+    "Customer Transfer of Funds Charge",
+    "Pay Bill Charge",
+]
+
+NAMES = [
+    "JUSTINE ADHIAMBO OKENO", "STEPHEN MOSIARA MAKORI", "KEVIN OMONDI OWIDI",
+    "MOSES GICERU NDUNGU", "BENARD MURIMI WANJOHI", "MOURINE JUMA",
+]
+
+MERCHANTS = [
+    "KPLC PREPAID", "Safaricom Offers Acc. Tunukiwa", "MALI", "NAIVAS SUPERMARKET",
+    "QUICKMART KILIMANI", "CARREFOUR TRM", "THE RIGHTEOUS EGGS DEPORT", "NAIROBI WEST MART",
+    "JAVA HOUSE", "SHELL WESTLANDS", "AT&T", "UBER BV",
+]
+
+
+def generate_narrations(
+    count: int,
+    keyword_categories: Optional[Dict[str, List[str]]] = None,
+    seed: int = 42,
+) -> List[str]:
+    """Generate M-Pesa style narrations, optionally sprinkled with rule keywords."""
+    rng = random.Random(seed)
+    keywords = [keyword for words in (keyword_categories or {}).values() for keyword in words] or [""]
+    narrations = []
+    for _ in range(count):
+        template = rng.choice(TEMPLATES)
+        narrations.append(template.format(
+            d=rng.randint(0, 99),
+            n=rng.randint(0, 9999),
+            name=rng.choice(NAMES),
+            paybill=rng.randint(100000, 999999),
+            till=rng.randint(1000000, 9999999),
+            merchant=rng.choice(MERCHANTS),
+            keyword=rng.choice(keywords),
+            ref=rng.randint(10**8, 10**9),
+        ))
+    return narrations
@@ -0,0 +1,75 @@
+"""
+Compare saving the training history by rewriting the whole joblib DataFrame, as before,
+with appending the day's rows to the training store, and compare loading all of it with
+loading a recent time window.
+
+The stored training data is resampled to each history size with fresh transaction ids and
+spread dates; a day's new data is the newest slice of the same distribution.
+
+Usage:
+    python -m benchmarks.training_store [history_size ...]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.transaction_categorization.training_store import TrainingStore, get_training_store
+
+
+def synthetic_history(data: pd.DataFrame, size: int) -> pd.DataFrame:
+    history = data.sample(size, replace=True, random_state=42).reset_index(drop=True)
+    history['transaction_id'] = np.arange(1, size + 1)
+    history['date'] = pd.Timestamp('2024-01-01') + pd.to_timedelta(np.arange(size) * 60, unit='s')
+    return history
+
+
+def main(history_sizes=(10_000, 50_000, 200_000), new_size: int = 2_000) -> None:
+    logging.disable(logging.INFO)
+    data = get_training_store().load().dropna(subset=['narration', 'amount', 'category_id'])
+
+    for history_size in history_sizes:
+        history = synthetic_history(data, history_size + new_size)
+        stored, new_data = history.iloc[:history_size], history.iloc[history_size:]
+        since = new_data['date'].iloc[0] - pd.Timedelta(days=7)
+
+        with tempfile.TemporaryDirectory() as directory:
+            joblib_path = os.path.join(directory, 'training_data.joblib')
+            joblib.dump(stored, joblib_path)
+            start = time.perf_counter()
+            updated = pd.concat([joblib.load(joblib_path), new_data], ignore_index=True)
+            joblib.dump(updated, joblib_path)
+            joblib_save = time.perf_counter() - start
+
+            store = TrainingStore(os.path.join(directory, 'training_store'))
+            store.append(stored)
+            start = time.perf_counter()
+            store.append(new_data)
+            store_save = time.perf_counter() - start
+
+            start = time.perf_counter()
+            joblib.load(joblib_path)
+            joblib_load = time.perf_counter() - start
+
+            start = time.perf_counter()
+            store.load()
+            store_load = time.perf_counter() - start
+
+            start = time.perf_counter()
+            window = store.load(since=since.to_pydatetime())
+            window_load = time.perf_counter() - start
+
+        print(
+            f"history {history_size:>7,}: daily save joblib {joblib_save * 1000:8.1f} ms, "
+            f"append {store_save * 1000:7.1f} ms | load joblib {joblib_load * 1000:7.1f} ms, "
+            f"store {store_load * 1000:7.1f} ms, last 7 days ({len(window):,} rows) {window_load * 1000:6.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or (10_000, 50_000, 200_000))
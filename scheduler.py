@@ -1,58 +1,228 @@
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime
+import fcntl
+import multiprocessing
+from multiprocessing.connection import Connection
+import os
+import resource
+import signal
+import threading
+import time
+from typing import IO, Optional
+
+import redis
 
 from src.transaction_categorization.categorize import EnhancedTransactionCategorizationService
 from src.transaction_categorization.data_loader import load_update_data
+from src.transaction_categorization.model_trainer import last_fit_stats, record_fit_stats
 from src.utils.config_utils import config
-from src.utils.logging_utils import setup_logger
-from src.database.db_utils import get_transaction_service
+from src.utils.logging_utils import setup_logger, shutdown_logging
+from src.utils.metrics import counter, histogram, start_metrics_server
+from src.database.db_utils import get_transaction_service, get_category_registry
 
 logger = setup_logger(__name__)
 
+TRAINING_LOCK_KEY = "txcat:training_lock"
+
+TRAINING_JOB_SECONDS = histogram(
+    "txcat_training_job_seconds", "Wall time of scheduled training jobs",
+    buckets=(10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+)
+TRAINING_JOBS = counter("txcat_training_jobs", "Scheduled training jobs by outcome", ["outcome"])
+
+_training_process: Optional[multiprocessing.process.BaseProcess] = None
 
 
 def daily_model_update(config):
     print(f"Starting daily training at {datetime.now()}")
-   
+
+    # Pick up categories added since the last run before the model can predict them
+    get_category_registry().refresh()
+
     service = EnhancedTransactionCategorizationService(model_path=config['model']['path'])
-    
+
     new_data = load_update_data(get_transaction_service())
 
     service.update_model(new_data)
-    
+
     print(f"Daily training completed at {datetime.now()}")
 
+def _apply_resource_limits(training_conf: dict) -> None:
+    """Lower the priority and cap the resources of the training process and its children."""
+    niceness = int(training_conf.get("nice", 10))
+    if niceness:
+        os.nice(niceness)
+    max_memory_mb = training_conf.get("max_memory_mb")
+    if max_memory_mb:
+        limit = int(max_memory_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    max_cpu_seconds = training_conf.get("max_cpu_seconds")
+    if max_cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (int(max_cpu_seconds), int(max_cpu_seconds)))
+
+def _training_process_main(config: dict, results: Connection) -> None:
+    """
+    Entry point of the training subprocess.
+
+    Sends the fit statistics to the scheduler over 'results'.
+    """
+    try:
+        _apply_resource_limits(config["scheduler"].get("training", {}))
+        daily_model_update(config)
+        stats = last_fit_stats()
+        if stats is not None:
+            results.send(stats)
+    finally:
+        results.close()
+        shutdown_logging()
+
+def _record_training_results(results: Connection) -> None:
+    """Export the fit statistics a training process sent, as its own metrics died with it."""
+    try:
+        if results.poll():
+            record_fit_stats(results.recv())
+    except (EOFError, OSError) as e:
+        logger.warning(f"Could not read the training statistics: {str(e)}")
+    finally:
+        results.close()
+
+def _stop_process(process: multiprocessing.process.BaseProcess, grace: float = 30) -> None:
+    process.terminate()
+    process.join(grace)
+    if process.is_alive():
+        process.kill()
+        process.join()
+
+def _create_redis_client() -> redis.Redis:
+    return redis.Redis(
+        host=config["queue"]["host"] or 'localhost',
+        port=int(config["queue"]["port"] or 6379),
+        password=config["queue"]["password"] or None,
+    )
+
+def _acquire_local_lock(path: str) -> Optional[IO]:
+    """
+    Take the training lock file without waiting.
+
+    Returns the open file, which holds the lock until closed, or None if it is taken.
+    """
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def run_training_job(redis_client: Optional[redis.Redis] = None) -> str:
+    """
+    Run one training job in a separate process and return its outcome.
+
+    A Redis lock makes replicas of the scheduler skip the job while another one runs it. If
+    Redis is unreachable, a lock file at `scheduler.training.lock_path` stands in for it, which
+    only excludes schedulers on the same host. The training process starts fresh rather than
+    forked, so it shares nothing with the scheduler, and is killed if it exceeds
+    `scheduler.training.timeout_minutes`.
+
+    Returns:
+        str: "succeeded", "failed", "timeout" or "skipped".
+    """
+    global _training_process
+    training_conf = config["scheduler"].get("training", {})
+    timeout = float(training_conf.get("timeout_minutes", 120)) * 60
+    redis_client = redis_client or _create_redis_client()
+    # The lock outlives the longest allowed job, so a crashed scheduler cannot hold it forever
+    lock = redis_client.lock(TRAINING_LOCK_KEY, timeout=timeout + 60, blocking=False)
+
+    started = time.monotonic()
+    release = None
+    try:
+        if lock.acquire():
+            release = lock.release
+        else:
+            logger.info("Skipping training: another scheduler holds the training lock")
+    except redis.RedisError as e:
+        # Training must not stop for as long as Redis is down
+        lock_path = training_conf.get("lock_path", "model_files/training.lock")
+        logger.warning(f"Could not acquire the training lock, falling back to {lock_path}: {str(e)}")
+        local_lock = _acquire_local_lock(lock_path)
+        if local_lock is not None:
+            release = local_lock.close
+        else:
+            logger.info(f"Skipping training: another scheduler holds {lock_path}")
+    if release is None:
+        TRAINING_JOBS.labels("skipped").inc()
+        return "skipped"
+
+    try:
+        context = multiprocessing.get_context("spawn")
+        results, child_results = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_training_process_main, args=(config, child_results), name="training"
+        )
+        process.start()
+        child_results.close()
+        _training_process = process
+        logger.info(f"Training process {process.pid} started")
+        process.join(timeout)
+        if process.is_alive():
+            _stop_process(process)
+            outcome = "timeout"
+        else:
+            outcome = "succeeded" if process.exitcode == 0 else "failed"
+        _record_training_results(results)
+    finally:
+        _training_process = None
+        try:
+            release()
+        except redis.RedisError as e:
+            logger.warning(f"Could not release the training lock: {str(e)}")
+
+    duration = time.monotonic() - started
+    TRAINING_JOB_SECONDS.observe(duration)
+    TRAINING_JOBS.labels(outcome).inc()
+    log = logger.info if outcome == "succeeded" else logger.error
+    log(
+        "Training job %s after %.1fs (exit code %s)", outcome, duration, process.exitcode,
+        extra={"event": "training_job", "outcome": outcome, "duration_seconds": round(duration, 3)}
+    )
+    return outcome
+
 def main():
-    
-    service = EnhancedTransactionCategorizationService(model_path=config['model']['path'])
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
 
-    # Load initial training data and train the model
-    initial_data = load_update_data(get_transaction_service())
-    service.update_model(initial_data)
-    logger.info("Initial model training completed.")
+    metrics_conf = config.get("metrics", {})
+    if metrics_conf.get("enabled", False):
+        start_metrics_server(
+            int(config["scheduler"].get("metrics_port", 9100)), metrics_conf.get("host", "0.0.0.0")
+        )
 
-    scheduler = BackgroundScheduler()
-    
-    # Schedule the job to run at the specified time every day
+    # One job at a time; runs missed while one was still going are merged into one
+    scheduler = BackgroundScheduler(job_defaults={"max_instances": 1, "coalesce": True})
+
+    # Train once at startup, then at the specified time every day
+    scheduler.add_job(run_training_job, 'date', run_date=datetime.now())
     start_time = datetime.strptime(config['scheduler']['start_time'], "%H:%M").time()
-    scheduler.add_job(daily_model_update, 'interval', 
-                      hours=config['scheduler']['update_interval_hours'], 
-                      start_date=datetime.combine(datetime.now().date(), start_time),
-                      args=[config])
-    
+    scheduler.add_job(run_training_job, 'interval',
+                      hours=config['scheduler']['update_interval_hours'],
+                      start_date=datetime.combine(datetime.now().date(), start_time))
+
     scheduler.start()
 
     logger.info(f"Scheduler started. Daily training will occur at {start_time}")
 
-    try:
-        # Keep the script running
-        while True:
-            pass
-    except (KeyboardInterrupt, SystemExit):
-        
-        scheduler.shutdown()
-        print("Scheduler shut down.")
+    # Sleep until a signal arrives instead of spinning
+    stop_event.wait()
+    scheduler.shutdown(wait=False)
+    # Do not leave a training process running without its scheduler or its lock
+    process = _training_process
+    if process is not None and process.is_alive():
+        logger.info(f"Stopping training process {process.pid}")
+        _stop_process(process)
+    logger.info("Scheduler shut down.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,7 +1,7 @@
 
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 
 from src.utils.config_utils import config
 
@@ -15,7 +15,15 @@ DATABASE_NAME = db_config["name"]
 
 # engine instance
 DATABASE_URL = f"mysql+mysqlconnector://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_engine(
+    DATABASE_URL,
+    echo=db_config.get("echo", False),
+    pool_size=int(db_config.get("pool_size", 10)),
+    max_overflow=int(db_config.get("max_overflow", 10)),
+    pool_timeout=int(db_config.get("pool_timeout", 30)),
+    pool_recycle=int(db_config.get("pool_recycle", 1800)),
+    pool_pre_ping=db_config.get("pool_pre_ping", True),
+)
 
 # base class for declarative models
 Base = declarative_base()
@@ -23,6 +31,9 @@ Base = declarative_base()
 # session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# thread-local sessions: services holding this registry use a separate Session per thread
+ScopedSession = scoped_session(SessionLocal)
+
 # Dependency to get the database session
 def get_db():
     db = SessionLocal()
@@ -30,3 +41,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def remove_scoped_session():
+    """Close and discard the calling thread's scoped session."""
+    ScopedSession.remove()
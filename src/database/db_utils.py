@@ -1,23 +1,30 @@
 from datetime import date, datetime, timedelta
 from math import log
-from operator import or_
-from typing import Optional
+import threading
+import time
+from typing import Dict, Generator, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy import desc
+from sqlalchemy import Row, and_, case, desc, or_, select, update
 from sqlalchemy.exc import IntegrityError
 
-from .db_connector import get_db
+from .db_connector import ScopedSession, get_db
 
 from src.models.models import Category, Transaction
+from src.utils.config_utils import config
 from src.utils.logging_utils import setup_logger
+from src.utils.metrics import counter, histogram
 
 logger = setup_logger(__name__)
 
+DB_QUERY_SECONDS = histogram("txcat_db_query_seconds", "Time spent in TransactionService queries and updates", ["operation"])
+DB_ROWS_UPDATED = counter("txcat_db_rows_updated", "Transactions whose category was written back")
+
 class TransactionService:
     def __init__(self, db: Session):
         self.db = db
 
+    @DB_QUERY_SECONDS.labels("get_transaction").time()
     def get_transaction(self, transaction_id: int):
         try:
             transaction = self.db.query(Transaction).filter(Transaction.transaction_id == transaction_id).one()
@@ -25,10 +32,32 @@ class TransactionService:
         except NoResultFound:
             return None
 
+    @DB_QUERY_SECONDS.labels("get_category_ids").time()
+    def get_category_ids(self, ids: List[int], chunk_size: int = 500) -> Dict[int, Optional[int]]:
+        """
+        Return the category id of each of the given transactions, keyed by transaction id.
+
+        One column-only SELECT ... WHERE id IN (...) per chunk, so no ORM objects or joined
+        categories are built. Ids that do not exist are missing from the result.
+        """
+        category_ids = {}
+        try:
+            for start in range(0, len(ids), chunk_size):
+                statement = select(Transaction.id, Transaction.category_id).where(
+                    Transaction.id.in_(ids[start:start + chunk_size])
+                )
+                category_ids.update(self.db.execute(statement).tuples().all())
+        finally:
+            # End the read transaction, or the thread's next batch reads this snapshot under
+            # REPEATABLE READ and misses transactions inserted since
+            self.db.rollback()
+        return category_ids
+
     def get_transactions_by_user(self, user_id: int):
         transactions = self.db.query(Transaction).filter(Transaction.user_id == user_id).all()
         return transactions
 
+    @DB_QUERY_SECONDS.labels("update_transaction").time()
     def update_transaction(self, transaction_id: int, update_data: dict) -> bool:
         try:
            
@@ -55,6 +84,46 @@ class TransactionService:
             return False
 
 
+    @DB_QUERY_SECONDS.labels("bulk_update_categories").time()
+    def bulk_update_categories(self, updates: List[Tuple[int, int]], chunk_size: Optional[int] = 500) -> Optional[int]:
+        """
+        Set the category of many transactions in a single database transaction.
+
+        Each chunk is written with one UPDATE ... CASE statement. Rows that already have a
+        category (other than the "uncategorized" placeholder 32) are left untouched.
+
+        Returns the number of rows updated, or None if the write was rolled back.
+        """
+        if not updates:
+            return 0
+
+        chunk_size = chunk_size or len(updates)
+        try:
+            updated = 0
+            for start in range(0, len(updates), chunk_size):
+                chunk = dict(updates[start:start + chunk_size])
+                statement = (
+                    update(Transaction)
+                    .where(
+                        Transaction.id.in_(list(chunk)),
+                        or_(
+                            Transaction.category_id.is_(None),
+                            Transaction.category_id == 32
+                        )
+                    )
+                    .values(category_id=case(chunk, value=Transaction.id))
+                    .execution_options(synchronize_session=False)
+                )
+                updated += self.db.execute(statement).rowcount
+            self.db.commit()
+            DB_ROWS_UPDATED.inc(updated)
+            return updated
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error bulk updating categories of {len(updates)} transactions: {str(e)}")
+            return None
+
+    @DB_QUERY_SECONDS.labels("get_latest_transactions_with_category").time()
     def get_latest_transactions_with_category(self, limit: int = 1000):
         transactions = (
             self.db.query(Transaction)
@@ -68,6 +137,44 @@ class TransactionService:
         )
         return transactions
     
+    def iter_labelled_transactions(
+        self,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+        batch_size: int = 5000
+    ) -> Generator[List[Row], None, None]:
+        """
+        Stream categorized transactions newest first, in lists of up to 'batch_size' rows.
+
+        Only the columns used for training are selected, and results are streamed from a
+        server-side cursor, so no ORM objects (or joined categories) are built and memory
+        stays bounded by one batch however many rows are read.
+        """
+        statement = (
+            select(
+                Transaction.id, Transaction.type, Transaction.amount, Transaction.narration, Transaction.date,
+                Transaction.category_id, Transaction.subcategory_id, Transaction.currency
+            )
+            .where(
+                Transaction.category_id.isnot(None),
+                Transaction.category_id != 32
+            )
+            .order_by(desc(Transaction.date))
+            .execution_options(yield_per=batch_size)
+        )
+        if since is not None:
+            statement = statement.where(Transaction.date >= since)
+        if limit:
+            statement = statement.limit(limit)
+
+        with DB_QUERY_SECONDS.labels("iter_labelled_transactions").time():
+            result = self.db.execute(statement)
+        try:
+            yield from result.partitions()
+        finally:
+            result.close()
+
+    @DB_QUERY_SECONDS.labels("get_transactions_last_24hrs_with_category").time()
     def get_transactions_last_24hrs_with_category(self, limit: int = 1000):
         now = datetime.now()
         last_24hrs = now - timedelta(hours=24)
@@ -87,6 +194,7 @@ class TransactionService:
         return transactions
 
     
+    @DB_QUERY_SECONDS.labels("get_latest_transactions_with_no_category").time()
     def get_latest_transactions_with_no_category(self, limit: int = 1000):
         transactions = (
             self.db.query(Transaction)
@@ -102,6 +210,58 @@ class TransactionService:
         )
         return transactions
     
+    def iter_uncategorized_transactions(
+        self,
+        page_size: int = 1000,
+        after: Optional[Tuple[Optional[datetime], int]] = None
+    ) -> Generator[List[Row], None, None]:
+        """
+        Stream uncategorized transactions newest first, one page at a time.
+
+        Pages are keyset-paginated on (date, id), so each query resumes right after the
+        last row of the previous page instead of re-scanning from the top, and rows that
+        stay uncategorized are never fetched twice. Rows carry only the columns needed for
+        categorization. Pass the (date, id) of the last processed row as `after` to resume.
+        """
+        cursor = after
+        while True:
+            query = (
+                self.db.query(Transaction.id, Transaction.narration, Transaction.amount, Transaction.date)
+                .filter(
+                    or_(
+                        Transaction.category_id.is_(None),
+                        Transaction.category_id == 32
+                    )
+                )
+            )
+            if cursor is not None:
+                last_date, last_id = cursor
+                if last_date is None:
+                    # Rows without a date sort last and are paged by id alone
+                    query = query.filter(Transaction.date.is_(None), Transaction.id < last_id)
+                else:
+                    query = query.filter(
+                        or_(
+                            Transaction.date < last_date,
+                            and_(Transaction.date == last_date, Transaction.id < last_id),
+                            Transaction.date.is_(None)
+                        )
+                    )
+
+            with DB_QUERY_SECONDS.labels("iter_uncategorized_transactions").time():
+                rows = (
+                    query
+                    # MySQL sorts NULL dates last in descending order
+                    .order_by(desc(Transaction.date), desc(Transaction.id))
+                    .limit(page_size)
+                    .all()
+                )
+            if not rows:
+                return
+
+            yield rows
+            cursor = (rows[-1].date, rows[-1].id)
+
     def get_transaction_id_by_description(self, description: str):
         # Use the LIKE operator for partial matches
         transactions = self.db.query(Transaction).filter(
@@ -132,19 +292,124 @@ class CategoryService:
             category = self.db.query(Category).filter(
                 Category.name.like(f"%{category_name}%")
             ).one_or_none()
-            logger.info(f"Found category: {category} using {category_name}")
+            logger.debug("Found category: %s using %s", category, category_name)
             return category
         except NoResultFound:
 
             return None
 
-def get_transaction_service() -> CategoryService:
-    db = next(get_db())
-    return TransactionService(db=db)
+    def get_all_categories(self) -> List[Tuple[int, str]]:
+        return self.db.query(Category.id, Category.name).all()
+
+class CategoryRegistry:
+    """
+    Process-wide, in-memory id <-> name map of the categories table.
+
+    The table is small and rarely changes, so it is loaded once and reloaded when the TTL
+    expires or `refresh` is called, sparing a SELECT for every lookup.
+    """
+
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._names: Dict[int, str] = {}
+        self._ids: Dict[str, int] = {}
+        # Resolved partial-name lookups, including misses, until the next refresh
+        self._partial_ids: Dict[str, Optional[int]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def refresh(self) -> None:
+        """Reload every category from the database."""
+        db = next(get_db())
+        try:
+            categories = CategoryService(db=db).get_all_categories()
+        finally:
+            db.close()
+
+        with self._lock:
+            self._names = {int(category_id): name for category_id, name in categories}
+            self._ids = {}
+            for category_id, name in self._names.items():
+                self._ids.setdefault(name.lower(), category_id)
+            self._partial_ids = {}
+            self._loaded_at = time.monotonic()
+            self.refreshes += 1
+        logger.info(f"Category registry loaded {len(self._names)} categories. Stats: {self.stats()}")
+
+    def _is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_seconds
+
+    def _ensure_fresh(self) -> None:
+        if self._is_stale():
+            with self._refresh_lock:
+                if self._is_stale():
+                    self.refresh()
+
+    def _record(self, found: bool) -> None:
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_name(self, category_id: int) -> Optional[str]:
+        """Return the name of a category id, or None if it does not exist."""
+        self._ensure_fresh()
+        name = self._names.get(int(category_id))
+        self._record(name is not None)
+        return name
+
+    def get_id(self, category_name: str) -> Optional[int]:
+        """
+        Return the id of a category name, or None if it does not exist.
+
+        Mirrors `CategoryService.get_category_by_name`: an exact, case-insensitive match
+        wins, otherwise the single category whose name contains the given name.
+        """
+        self._ensure_fresh()
+        needle = category_name.lower()
+        category_id = self._ids.get(needle)
+        if category_id is None:
+            if needle in self._partial_ids:
+                category_id = self._partial_ids[needle]
+            else:
+                matches = [cid for name, cid in self._ids.items() if needle in name]
+                category_id = matches[0] if len(matches) == 1 else None
+                self._partial_ids[needle] = category_id
+        self._record(category_id is not None)
+        return category_id
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "categories": len(self._names),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+        }
+
+_category_registry: Optional[CategoryRegistry] = None
+_category_registry_lock = threading.Lock()
+
+def get_category_registry() -> CategoryRegistry:
+    global _category_registry
+    if _category_registry is None:
+        with _category_registry_lock:
+            if _category_registry is None:
+                _category_registry = CategoryRegistry(
+                    ttl_seconds=config["categorization"].get("category_cache_ttl", 300)
+                )
+    return _category_registry
+
+def get_transaction_service() -> TransactionService:
+    # The scoped session proxies to a per-thread Session, so the service can be shared by workers
+    return TransactionService(db=ScopedSession)
 
 def get_category_service() -> CategoryService:
-    db = next(get_db())
-    return CategoryService(db=db)
+    return CategoryService(db=ScopedSession)
 
 
 # print(get_category_service().get_category(7))
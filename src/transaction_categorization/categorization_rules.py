@@ -1,9 +1,11 @@
-from typing import Dict, List, Optional
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 from datetime import datetime
 import pandas as pd
 from sklearn.pipeline import Pipeline
 
-from src.database.db_utils import get_category_service
+from src.database.db_utils import get_category_registry
+from src.transaction_categorization.model_artifact import CompiledPipeline
 
 def match_by_keyword(narration: str, keyword_categories: Dict[str, List[str]]) -> Optional[str]:
     """Match transaction by keywords in the narration."""
@@ -13,6 +15,114 @@ def match_by_keyword(narration: str, keyword_categories: Dict[str, List[str]]) -
             return category
     return None
 
+class PatternAutomaton:
+    """
+    Aho-Corasick automaton over a set of prioritized substring patterns.
+
+    A single pass over a text finds the lowest priority of every pattern the text contains,
+    which is what the first-match loops of the rule matchers compute one pattern at a time.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, int]]):
+        goto: List[Dict[str, int]] = [{}]
+        # Best (lowest) priority of any pattern ending in each state
+        output: List[Optional[int]] = [None]
+
+        for pattern, priority in patterns:
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    goto.append({})
+                    output.append(None)
+                    next_state = len(goto) - 1
+                    goto[state][char] = next_state
+                state = next_state
+            if output[state] is None or priority < output[state]:
+                output[state] = priority
+
+        # Breadth-first pass computing failure links and folding the outputs reachable
+        # through them into each state.
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            inherited = output[fail[state]]
+            if inherited is not None and (output[state] is None or inherited < output[state]):
+                output[state] = inherited
+            for char, next_state in goto[state].items():
+                if state:
+                    fallback = fail[state]
+                    while fallback and char not in goto[fallback]:
+                        fallback = fail[fallback]
+                    fail[next_state] = goto[fallback].get(char, 0)
+                queue.append(next_state)
+
+        self._goto = goto
+        self._fail = fail
+        self._output = output
+
+    def lowest_priority(self, text: str) -> Optional[int]:
+        """Return the lowest priority of the patterns contained in the text."""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        best = output[0]
+        state = 0
+        for char in text:
+            next_state = goto[state].get(char)
+            while next_state is None and state:
+                state = fail[state]
+                next_state = goto[state].get(char)
+            state = next_state or 0
+            priority = output[state]
+            if priority is not None and (best is None or priority < best):
+                best = priority
+                if best == 0:
+                    break
+        return best
+
+class KeywordMatcher:
+    """
+    Compiled equivalent of `match_by_keyword`.
+
+    Returns the first category, in YAML order, that has any keyword contained in the
+    lowercased narration, scanning the narration once.
+    """
+
+    def __init__(self, keyword_categories: Dict[str, List[str]]):
+        self.categories: List[str] = list(keyword_categories)
+        self._automaton = PatternAutomaton(
+            (keyword, priority)
+            for priority, keywords in enumerate(keyword_categories.values())
+            for keyword in keywords
+        )
+
+    def match(self, narration: str) -> Optional[str]:
+        """Return the highest-priority category with a keyword in the narration."""
+        priority = self._automaton.lowest_priority(narration.lower())
+        return None if priority is None else self.categories[priority]
+
+class MerchantMatcher:
+    """
+    Compiled equivalent of `match_by_merchant`.
+
+    Returns the category of the first merchant, in YAML order, whose name is contained in
+    the uppercased narration, scanning the narration once. Matching stays substring-based
+    so names with spaces or punctuation ("NAIROBI WEST MART", "AT&T") behave as before.
+    """
+
+    def __init__(self, merchant_categories: Dict[str, str]):
+        self.categories: List[str] = list(merchant_categories.values())
+        self._automaton = PatternAutomaton(
+            (merchant, priority) for priority, merchant in enumerate(merchant_categories)
+        )
+
+    def match(self, narration: str) -> Optional[str]:
+        """Return the category of the first listed merchant found in the narration."""
+        priority = self._automaton.lowest_priority(narration.upper())
+        return None if priority is None else self.categories[priority]
+
 def match_by_merchant(narration: str, merchant_categories: Dict[str, str]) -> Optional[str]:
     """Match transaction by merchant name in the narration."""
     for merchant, category in merchant_categories.items():
@@ -20,12 +130,50 @@ def match_by_merchant(narration: str, merchant_categories: Dict[str, str]) -> Op
             return category
     return None
 
-def categorize_by_ml(narration: str, amount: float, model: Pipeline) -> str:
-    """Categorize transaction using the machine learning model."""
-    features = pd.DataFrame({'narration': [narration], 'amount': [amount]})
-    prediction = model.predict(features)
-    category_id = int(prediction[0])  
-    return get_category_service().get_category(category_id).name
+def _predict(narrations: List[str], amounts: List[float], model: Union[Pipeline, CompiledPipeline]):
+    # A compiled model takes the columns directly, skipping the DataFrame round trip
+    if isinstance(model, CompiledPipeline):
+        return model.predict_arrays(narrations, amounts)
+    return model.predict(pd.DataFrame({'narration': narrations, 'amount': amounts}))
+
+def predict_category_ids(narrations: List[str], amounts: List[float], model: Union[Pipeline, CompiledPipeline]) -> List[int]:
+    """Predict category ids for many transactions with a single model call."""
+    if not narrations:
+        return []
+    return [int(prediction) for prediction in _predict(narrations, amounts, model)]
+
+def categorize_batch_by_ml(narrations: List[str], amounts: List[float], model: Union[Pipeline, CompiledPipeline]) -> List[Optional[str]]:
+    """Categorize many transactions using one model prediction over the whole batch."""
+    category_ids = predict_category_ids(narrations, amounts, model)
+    category_registry = get_category_registry()
+    return [category_registry.get_name(category_id) for category_id in category_ids]
+
+def predict_with_confidence(
+    narrations: List[str],
+    amounts: List[float],
+    model: Union[Pipeline, CompiledPipeline],
+    threshold: float = 0.0,
+    check_every: Optional[int] = None
+) -> List[Tuple[int, float, int]]:
+    """
+    Predict (category id, confidence, trees evaluated) for many transactions.
+
+    A compiled model stops evaluating trees for a transaction once its outcome against
+    'threshold' is settled (see CompiledPipeline.predict_confident_features); a Pipeline
+    always evaluates every tree.
+    """
+    if not narrations:
+        return []
+    if isinstance(model, CompiledPipeline):
+        labels, confidence, trees_evaluated = model.predict_confident_arrays(narrations, amounts, threshold, check_every)
+    else:
+        proba = model.predict_proba(pd.DataFrame({'narration': narrations, 'amount': amounts}))
+        labels, confidence = model.classes_.take(proba.argmax(axis=1)), proba.max(axis=1)
+        trees_evaluated = [len(model.named_steps['clf'].estimators_)] * len(narrations)
+    return [
+        (int(label), float(score), int(trees))
+        for label, score, trees in zip(labels, confidence, trees_evaluated)
+    ]
 
 def categorize_by_amount(narration: str, amount: float, date: Optional[datetime]) -> Optional[str]:
     """Categorize transaction based on the amount."""
@@ -1,22 +1,50 @@
 from venv import logger
-import joblib
+import os
+import threading
+import time
+import redis
 import pandas as pd
+from sklearn.pipeline import Pipeline
 from typing import Dict, List, Tuple, Optional
 from datetime import datetime
 
 from src.transaction_categorization.data_loader import load_keyword_categories, load_merchant_categories
-from src.transaction_categorization.model_trainer import load_or_train_model, update_model
+from src.transaction_categorization.model_trainer import load_or_train_model, save_model_files, update_model
+from src.transaction_categorization.model_artifact import ModelArtifactError, compile_pipeline
+from src.transaction_categorization.model_registry import load_model_version, read_published_version
+from src.transaction_categorization.prediction_cache import PredictionCache
 from src.utils.logging_utils import setup_logger
-from src.database.db_utils import get_transaction_service
+from src.utils.metrics import counter, histogram
+from src.database.db_utils import get_category_registry, get_transaction_service
 from src.transaction_categorization.categorization_rules import (
-    match_by_keyword, 
-    match_by_merchant, 
-    categorize_by_ml,
+    KeywordMatcher,
+    MerchantMatcher,
+    categorize_batch_by_ml,
+    predict_with_confidence,
     # categorize_by_amount, 
     # categorize_by_date,
     )
 from src.utils.config_utils import config
 
+CATEGORIZER_HITS = counter(
+    "txcat_categorizer_hits", "Transactions categorized, by the categorizer that matched ('unknown' if none did)", ["categorizer"]
+)
+CATEGORIZER_SECONDS = histogram(
+    "txcat_categorizer_seconds", "Time spent in one categorizer for a single transaction", ["categorizer"]
+)
+BATCH_STAGE_SECONDS = histogram(
+    "txcat_batch_categorize_stage_seconds", "Time spent per batch in the rule and model stages of batch_categorize", ["stage"]
+)
+ML_CONFIDENCE = histogram(
+    "txcat_ml_confidence", "Probability of the predicted class over the trees evaluated",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0)
+)
+ML_TREES_EVALUATED = histogram(
+    "txcat_ml_trees_evaluated", "Trees evaluated per model prediction", buckets=(10, 25, 50, 60, 70, 80, 90, 100, 150, 200, 300)
+)
+ML_LOW_CONFIDENCE = counter(
+    "txcat_ml_low_confidence", "Model predictions below the confidence threshold, replaced by the default category"
+)
 
 class EnhancedTransactionCategorizationService:
     """
@@ -33,13 +61,161 @@ class EnhancedTransactionCategorizationService:
         """
         self.logger = setup_logger(__name__)
         self.keyword_categories = load_keyword_categories()
+        self.keyword_matcher = KeywordMatcher(self.keyword_categories)
         self.merchant_categories = load_merchant_categories()
+        self.merchant_matcher = MerchantMatcher(self.merchant_categories)
         self.model_path = model_path
         self.transactionDB = get_transaction_service()
-        self.ml_model = load_or_train_model(model_path, self.logger,self.transactionDB)
+        self._ml_model = None
+        # (model, predictor, cache namespace) of the model being served, replaced as one
+        self._served: Optional[Tuple[object, object, str]] = None
+        self.model_version: Optional[str] = None
+        self._model_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._watcher_stop = threading.Event()
+        self.prediction_cache = self._create_prediction_cache()
+
+        # In lazy mode the model is only loaded when the first transaction reaches it
+        if config["features"]["categorise_with_model"] and not config["model"].get("lazy_load", False):
+            with self._model_lock:
+                self._load_current_model()
 
         logger.info(self.keyword_categories)
 
+    @property
+    def ml_model(self):
+        """The machine learning model, loaded (or trained) on first access."""
+        return self._serving()[0]
+
+    @ml_model.setter
+    def ml_model(self, model) -> None:
+        with self._model_lock:
+            self._swap_model(model, self.model_version)
+
+    @property
+    def predictor(self):
+        """
+        The model predictions are made with: the served model, compiled to NumPy arrays if it
+        is a Pipeline. Compiled once per model and equivalent to Pipeline.predict.
+        """
+        return self._serving()[1]
+
+    def _serving(self) -> Tuple[object, object, str]:
+        """The served model, its predictor and its cache namespace, loading the model on first use."""
+        served = self._served
+        if served is None:
+            with self._model_lock:
+                if self._served is None:
+                    self._load_current_model()
+                served = self._served
+        return served
+
+    def _compile(self, model):
+        try:
+            return compile_pipeline(model) if isinstance(model, Pipeline) else model
+        except ModelArtifactError as e:
+            self.logger.warning(f"Predicting with the uncompiled pipeline: {str(e)}")
+            return model
+
+    def _swap_model(self, model, version: Optional[str], predictor=None) -> None:
+        """Serve 'model' from now on, compiling it unless its 'predictor' is given. The caller holds _model_lock."""
+        if predictor is None:
+            predictor = self._compile(model)
+        self._ml_model = model
+        self.model_version = version
+        self._served = (model, predictor, self._model_version())
+        self._invalidate_prediction_cache()
+
+    def _load_current_model(self) -> None:
+        """Load the published model version, training a model if none exists yet."""
+        manifest = read_published_version()
+        model = load_or_train_model(self.model_path, self.logger, self.transactionDB)
+        # A model trained just now was published while loading
+        manifest = manifest or read_published_version()
+        self._swap_model(model, manifest["version"] if manifest else None)
+
+    def reload_model_if_updated(self) -> bool:
+        """
+        Swap in the published model version if it is newer than the one being served.
+
+        The new model is loaded and compiled before the swap, so serving never waits for
+        it; a batch in flight finishes on the model it started with, caching its results
+        under that model's version, and the old model is released as soon as the last such
+        batch completes. Returns True if the model was swapped.
+        """
+        manifest = read_published_version()
+        if manifest is None or manifest["version"] == self.model_version or self._served is None:
+            # A model that is not loaded yet will load the published version when first used
+            return False
+
+        new_model = load_model_version(manifest)
+        predictor = self._compile(new_model)
+        with self._model_lock:
+            previous_version = self.model_version
+            self._swap_model(new_model, manifest["version"], predictor)
+        self.logger.info(f"Swapped model version {previous_version} for {manifest['version']}")
+        return True
+
+    def start_model_watcher(self, interval: float = 30) -> None:
+        """Check for newly published model versions every 'interval' seconds in a background thread."""
+        # A watcher inherited through fork is not running in the child
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._watcher_stop.clear()
+        self._watcher = threading.Thread(
+            target=self._watch_model_versions, args=(interval,), name="model-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def stop_model_watcher(self) -> None:
+        self._watcher_stop.set()
+
+    def _watch_model_versions(self, interval: float) -> None:
+        while not self._watcher_stop.wait(interval):
+            try:
+                self.reload_model_if_updated()
+            except Exception as e:
+                self.logger.error(f"Error reloading the published model: {str(e)}")
+
+    def _create_prediction_cache(self) -> Optional[PredictionCache]:
+        cache_conf = config["categorization"].get("prediction_cache", {})
+        if not cache_conf.get("enabled", False):
+            return None
+
+        redis_client = None
+        if cache_conf.get("redis", False):
+            redis_client = redis.Redis(
+                host=config["queue"]["host"] or 'localhost',
+                port=int(config["queue"]["port"] or 6379),
+                password=config["queue"]["password"] or None,
+                decode_responses=True
+            )
+
+        return PredictionCache(
+            max_size=cache_conf.get("max_size", 10000),
+            ttl_seconds=cache_conf.get("ttl_seconds", 3600),
+            amount_bucket_size=cache_conf.get("amount_bucket_size"),
+            redis_client=redis_client,
+            namespace=self._model_version()
+        )
+
+    def _model_version(self) -> str:
+        """Identify the model being served, so shared cache entries of older models are not reused."""
+        if self.model_version:
+            return self.model_version
+        try:
+            return str(os.stat(self.model_path).st_mtime_ns)
+        except OSError:
+            return "unsaved"
+
+    def _invalidate_prediction_cache(self) -> None:
+        if self.prediction_cache is not None:
+            self.prediction_cache.clear(namespace=self._model_version())
+
+    def cache_stats(self) -> Optional[Dict[str, float]]:
+        """Return the prediction cache hit/miss statistics, or None if caching is disabled."""
+        return self.prediction_cache.stats() if self.prediction_cache is not None else None
+
     def categorize_transaction(self, narration: str, amount: float, date: Optional[datetime] = None) -> str:
         """
         Categorize a single transaction using multiple methods.
@@ -54,20 +230,24 @@ class EnhancedTransactionCategorizationService:
         """
         # Define the list of categorizer functions
         categorizers = [
-            lambda n, a, d: match_by_keyword(n, self.keyword_categories),
-            lambda n, a, d: match_by_merchant(n, self.merchant_categories),
+            ("keyword", lambda n, a, d: self.keyword_matcher.match(n)),
+            ("merchant", lambda n, a, d: self.merchant_matcher.match(n)),
         ]
         
         # Conditionally add the model-based categorizer if the flag is set
         if config["features"]["categorise_with_model"]:
-            categorizers.append(lambda n, a, d: categorize_by_ml(n, a, self.ml_model))
+            categorizers.append(("ml", lambda n, a, d: self._categorize_by_ml(n, a)))
         
         # Process each categorizer function
-        for categorizer in categorizers:
+        for name, categorizer in categorizers:
+            start = time.perf_counter()
             category = categorizer(narration, amount, date)
+            CATEGORIZER_SECONDS.labels(name).observe(time.perf_counter() - start)
             if category:
+                CATEGORIZER_HITS.labels(name).inc()
                 return category
         
+        CATEGORIZER_HITS.labels("unknown").inc()
         return 'unknown'
 
     def update_model(self, new_data: pd.DataFrame) -> None:
@@ -77,28 +257,168 @@ class EnhancedTransactionCategorizationService:
         Args:
             new_data (pd.DataFrame): New training data to update the model.
         """
-        self.ml_model = update_model(self.ml_model, new_data, self.model_path, self.logger)
+        if new_data.empty:
+            self.logger.info("No new training data; the model is unchanged.")
+            return
+        # The refit does not need the current model, so a lazily loaded one is not loaded here
+        model = update_model(self._ml_model, new_data, self.model_path, self.logger)
+        predictor = self._compile(model)
+        manifest = read_published_version()
+        with self._model_lock:
+            self._swap_model(model, manifest["version"] if manifest else None, predictor)
 
     def batch_categorize(self, transactions: List[Dict]) -> List[Tuple[Dict, str]]:
         """
         Categorize a batch of transactions.
 
+        The rule matchers run over the whole batch first; every transaction they miss is
+        then categorized by a single model prediction, and results keep the input order.
+
         Args:
             transactions (List[Dict]): A list of transaction dictionaries.
 
         Returns:
             List[Tuple[Dict, str]]: A list of tuples containing the original transaction and its category.
         """
-        return [(transaction, self.categorize_transaction(
-            transaction['narration'],
-            transaction['amount'],
-            transaction.get('date')
-        )) for transaction in transactions]
-    
+        categories: List[Optional[str]] = []
+        misses: List[int] = []
+        hits = {"keyword": 0, "merchant": 0, "ml": 0}
+        start = time.perf_counter()
+        for index, transaction in enumerate(transactions):
+            category = self.keyword_matcher.match(transaction['narration'])
+            if category:
+                hits["keyword"] += 1
+            else:
+                category = self.merchant_matcher.match(transaction['narration'])
+                if category:
+                    hits["merchant"] += 1
+                else:
+                    misses.append(index)
+            categories.append(category)
+        BATCH_STAGE_SECONDS.labels("rules").observe(time.perf_counter() - start)
+
+        if misses and config["features"]["categorise_with_model"]:
+            start = time.perf_counter()
+            for index, category in zip(misses, self._categorize_batch_by_ml([transactions[index] for index in misses])):
+                categories[index] = category
+                if category:
+                    hits["ml"] += 1
+            BATCH_STAGE_SECONDS.labels("ml").observe(time.perf_counter() - start)
+
+        hits["unknown"] = len(transactions) - sum(hits.values())
+        for name, count in hits.items():
+            if count:
+                CATEGORIZER_HITS.labels(name).inc(count)
+
+        return [(transaction, category or 'unknown') for transaction, category in zip(transactions, categories)]
+
+    def _categorize_by_ml(self, narration: str, amount: float) -> Optional[str]:
+        """Categorize a narration with the model, going through the prediction cache."""
+        _, predictor, namespace = self._serving()
+        if self.prediction_cache is None:
+            return self._predict_categories([narration], [amount], predictor)[0]
+
+        key = self.prediction_cache.make_key(narration, amount)
+        category = self.prediction_cache.get(key, namespace)
+        if category is None:
+            category = self._predict_categories([narration], [amount], predictor)[0]
+            if category:
+                self.prediction_cache.set(key, category, namespace)
+        return category
+
+    def _categorize_batch_by_ml(self, transactions: List[Dict]) -> List[Optional[str]]:
+        """Categorize transactions with one model prediction for those not in the prediction cache."""
+        # One model for the whole batch, whose results are cached under its own version
+        _, predictor, namespace = self._serving()
+        if self.prediction_cache is None:
+            return self._predict_categories(
+                [transaction['narration'] for transaction in transactions],
+                [transaction['amount'] for transaction in transactions],
+                predictor
+            )
+
+        keys = [self.prediction_cache.make_key(t['narration'], t['amount']) for t in transactions]
+        categories: List[Optional[str]] = []
+        # Transactions sharing a key within the batch are predicted once
+        uncached: Dict[Tuple, List[int]] = {}
+        for index, key in enumerate(keys):
+            category = None if key in uncached else self.prediction_cache.get(key, namespace)
+            categories.append(category)
+            if category is None:
+                uncached.setdefault(key, []).append(index)
+
+        if uncached:
+            first_indices = [indices[0] for indices in uncached.values()]
+            predicted = self._predict_categories(
+                [transactions[index]['narration'] for index in first_indices],
+                [transactions[index]['amount'] for index in first_indices],
+                predictor
+            )
+            for (key, indices), category in zip(uncached.items(), predicted):
+                for index in indices:
+                    categories[index] = category
+                if category:
+                    self.prediction_cache.set(key, category, namespace)
+        return categories
+
+    def _predict_categories(self, narrations: List[str], amounts: List[float], predictor=None) -> List[Optional[str]]:
+        """
+        Predict categories with the model.
+
+        With categorization.ml_confidence enabled, predictions below the confidence threshold
+        are replaced by the default category, and batches of at least `early_exit_min_batch`
+        stop evaluating trees once each outcome is settled.
+        """
+        predictor = predictor if predictor is not None else self.predictor
+        confidence_conf = config["categorization"].get("ml_confidence", {})
+        if not confidence_conf.get("enabled", False):
+            return categorize_batch_by_ml(narrations, amounts, predictor)
+
+        threshold = float(confidence_conf.get("threshold", 0.0))
+        check_every = None
+        # A single row costs about the same however many trees it visits, so only batches exit early
+        if confidence_conf.get("early_exit", True) and len(narrations) >= confidence_conf.get("early_exit_min_batch", 10):
+            check_every = int(confidence_conf.get("check_every", 10))
+
+        category_registry = get_category_registry()
+        default_category = config["categorization"]["default_category"]
+        categories = []
+        for category_id, confidence, trees_evaluated in predict_with_confidence(
+            narrations, amounts, predictor, threshold, check_every
+        ):
+            ML_CONFIDENCE.observe(confidence)
+            ML_TREES_EVALUATED.observe(trees_evaluated)
+            if confidence < threshold:
+                ML_LOW_CONFIDENCE.inc()
+                category = default_category
+            else:
+                category = category_registry.get_name(category_id)
+            self.logger.debug(
+                "Model predicted %s (%s) with confidence %.3f from %d trees", category_id, category, confidence, trees_evaluated,
+                extra={"event": "ml_prediction", "confidence": round(confidence, 4), "trees_evaluated": trees_evaluated}
+            )
+            categories.append(category)
+        return categories
+
     def save_model(self):
-        joblib.dump(self.ml_model, self.model_path)
-        self.logger.info(f"Model saved to {self.model_path}")
+        if not isinstance(self._ml_model, Pipeline):
+            # A compiled model is read from its artifact on disk and has nothing new to save
+            self.logger.info("Model is unchanged since it was loaded. Nothing to save.")
+            return
+        manifest = save_model_files(self._ml_model, self.model_path, self.logger)
+        with self._model_lock:
+            # Saving does not change the model, so its compiled predictor still serves it
+            self._swap_model(self._ml_model, manifest["version"], self._served[1])
 
     def load_model(self):
-        self.ml_model = joblib.load(self.model_path)
-        self.logger.info(f"Model loaded from {self.model_path}")
\ No newline at end of file
+        with self._model_lock:
+            self._load_current_model()
+
+    def reload_rules(self) -> None:
+        """Reload the keyword and merchant YAML rules and rebuild their matchers."""
+        self.keyword_categories = load_keyword_categories()
+        self.keyword_matcher = KeywordMatcher(self.keyword_categories)
+        self.merchant_categories = load_merchant_categories()
+        self.merchant_matcher = MerchantMatcher(self.merchant_categories)
+        self._invalidate_prediction_cache()
+        self.logger.info("Categorization rules reloaded")
\ No newline at end of file
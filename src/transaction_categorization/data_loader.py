@@ -1,8 +1,10 @@
 
+from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-from typing import  Dict, List
+from typing import  Dict, List, Optional
 from src.database.db_utils import TransactionService
-from src.models.models import Transaction
+from src.utils.config_utils import config
 from src.utils.utils import loader
 from src.utils.logging_utils import setup_logger
 
@@ -16,64 +18,96 @@ def load_merchant_categories() -> Dict[str, str]:
     """Load merchant-based categories from a data source."""
     return loader._load_merchant_categories()
 
-def load_training_data(transactionDB: TransactionService) -> pd.DataFrame:
-    """Load training data for the model from the transaction database."""
+class _ColumnBuffers:
+    """Typed, growable column arrays filled from streamed row batches."""
+
+    def __init__(self, capacity: int):
+        self.size = 0
+        self.columns = {
+            'transaction_id': np.empty(capacity, dtype=np.int64),
+            'type': np.empty(capacity, dtype=object),
+            'amount': np.empty(capacity, dtype=np.float64),
+            'narration': np.empty(capacity, dtype=object),
+            'date': np.empty(capacity, dtype='datetime64[ns]'),
+            'category_id': np.empty(capacity, dtype=np.int64),
+            'subcategory_id': np.empty(capacity, dtype=np.float64),
+            'currency': np.empty(capacity, dtype=object),
+        }
+
+    def append(self, rows: List) -> None:
+        end = self.size + len(rows)
+        capacity = len(self.columns['transaction_id'])
+        if end > capacity:
+            capacity = max(end, capacity * 2)
+            for name, column in self.columns.items():
+                grown = np.empty(capacity, dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                self.columns[name] = grown
+
+        # Row fields are in the column order of TransactionService.iter_labelled_transactions
+        for position, (name, column) in enumerate(self.columns.items()):
+            values = [row[position] for row in rows]
+            if name == 'subcategory_id':
+                values = [np.nan if value is None else value for value in values]
+            elif name == 'date':
+                values = np.array(values, dtype='datetime64[ns]')
+            column[self.size:end] = values
+        self.size = end
+
+    def to_frame(self) -> pd.DataFrame:
+        df = pd.DataFrame({name: column[:self.size] for name, column in self.columns.items()})
+        # Few distinct values; categoricals store them once
+        df['type'] = df['type'].astype('category')
+        df['currency'] = df['currency'].astype('category')
+        return df
+
+def stream_labelled_data(
+    transactionDB: TransactionService,
+    limit: Optional[int] = None,
+    since: Optional[datetime] = None,
+    batch_size: int = 5000
+) -> pd.DataFrame:
+    """Read categorized transactions with a streamed, column-only query into a typed DataFrame."""
+    buffers = _ColumnBuffers(limit or batch_size)
+    for rows in transactionDB.iter_labelled_transactions(limit=limit, since=since, batch_size=batch_size):
+        buffers.append(rows)
+    return buffers.to_frame()
+
+def load_training_data(transactionDB: TransactionService, limit: Optional[int] = None) -> pd.DataFrame:
+    """
+    Load training data for the model from the transaction database.
+
+    Reads the newest 'limit' labelled transactions (model.training_rows by default; 0 or
+    null for the whole labelled history).
+    """
     try:
-        transactions: List[Transaction] = transactionDB.get_latest_transactions_with_category(2000)
-   
-        df = pd.DataFrame([
-            {
-                'transaction_id': t.id,
-                'type': t.type,
-                'amount': t.amount,
-                'narration': t.narration,
-                'date': t.date,
-                'category_id': t.category_id,
-                'subcategory_id': t.subcategory_id,
-                'currency': t.currency
-            } for t in transactions
-        ])
-    
-        # Ensure 'date' is in datetime format
-        df['date'] = pd.to_datetime(df['date'])
-    
+        model_conf = config["model"]
+        df = stream_labelled_data(
+            transactionDB,
+            limit=limit if limit is not None else model_conf.get("training_rows", 2000),
+            batch_size=model_conf.get("fetch_batch_size", 5000)
+        )
+        logger.info(f"Loaded {len(df)} training rows ({df.memory_usage(deep=True).sum() / 2**20:.1f} MiB)")
         return df
     except Exception as e:
         logger.error(f"Error loading training data: {str(e)}")
         raise
 
-def load_update_data(transactionDB: TransactionService) -> pd.DataFrame:
-    """Load training data for the model from the transaction database."""
+def load_update_data(transactionDB: TransactionService, limit: int = 2000) -> pd.DataFrame:
+    """Load the transactions categorized in the last 24 hours from the transaction database."""
     try:
-        transactions: List[Transaction] = transactionDB.get_transactions_last_24hrs_with_category(2000)
-   
-        # Convert transactions to DataFrame
-        df = pd.DataFrame([
-            {
-                'transaction_id': t.id,
-                'type': t.type,
-                'amount': t.amount,
-                'narration': t.narration,
-                'date': t.date,
-                'category_id': t.category_id,
-                'subcategory_id': t.subcategory_id,
-                'currency': t.currency
-            } for t in transactions
-        ])
+        df = stream_labelled_data(
+            transactionDB,
+            limit=limit,
+            since=datetime.now() - timedelta(hours=24),
+            batch_size=config["model"].get("fetch_batch_size", 5000)
+        )
         
         # Log the columns of the DataFrame for debugging
         logger.info(f"DataFrame columns: {df.columns}")
         logger.info(f"First few rows of DataFrame: {df.head()}")
-
-        # Ensure 'date' is in datetime format
-        if 'date' in df.columns:
-            if df['date'].dtype != 'datetime64[ns]':
-                df['date'] = pd.to_datetime(df['date'])
-        else:
-            logger.error("'date' column is missing from the DataFrame.")
-           
     
         return df
     except Exception as e:
         logger.error(f"Error loading training data: {str(e)}")
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,384 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import sklearn
+from sklearn.pipeline import Pipeline
+
+from src.transaction_categorization.text_utils import narration_tokens
+
+# File layout: MAGIC | version (uint32) | reserved (uint32) | header length (uint64) | JSON header
+# | zero padding to ALIGNMENT | arrays, each starting on an ALIGNMENT boundary of the data section.
+MAGIC = b"TXCATMDL"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<8sIIQ")
+# Rows of a batch expanded to dense features at a time when the trees are evaluated
+_APPLY_BLOCK_ROWS = 256
+
+# Analyzer names stored in artifacts, mapped to functions producing the same tokens
+ANALYZERS = {"text_processor": narration_tokens}
+
+class ModelArtifactError(Exception):
+    """Raised when a model artifact is malformed, corrupt or of an unsupported version."""
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def extract_arrays(model: Pipeline) -> Dict:
+    """
+    Flatten a fitted TF-IDF + StandardScaler + RandomForest pipeline into NumPy arrays.
+
+    Every tree is appended to shared node arrays; child indices are rewritten to global
+    node ids so the whole forest can be walked with one set of arrays.
+    """
+    preprocessor = model.named_steps['preprocessor']
+    forest = model.named_steps['clf']
+    vectorizer = preprocessor.named_transformers_['text']
+    scaler = preprocessor.named_transformers_['num']
+
+    analyzer = getattr(vectorizer.analyzer, '__name__', None)
+    if analyzer not in ANALYZERS:
+        raise ModelArtifactError(f"Unsupported TF-IDF analyzer: {vectorizer.analyzer!r}")
+
+    terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    encoded_terms = [term.encode('utf-8') for term in terms]
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    term_offsets[1:] = np.cumsum([len(term) for term in encoded_terms])
+
+    lefts, rights, features, thresholds, values, roots = [], [], [], [], [], []
+    node_offset = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left == -1
+        lefts.append(np.where(is_leaf, -1, tree.children_left + node_offset))
+        rights.append(np.where(is_leaf, -1, tree.children_right + node_offset))
+        features.append(tree.feature)
+        thresholds.append(tree.threshold)
+        # Per-node class distributions, normalized as DecisionTreeClassifier.predict_proba does
+        value = tree.value[:, 0, :].astype(np.float64)
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        values.append(value / normalizer)
+        roots.append(node_offset)
+        node_offset += tree.node_count
+
+    arrays = {
+        'term_bytes': np.frombuffer(b"".join(encoded_terms), dtype=np.uint8),
+        'term_offsets': term_offsets,
+        'idf': np.asarray(vectorizer.idf_, dtype=np.float64),
+        'scaler_mean': np.asarray(scaler.mean_ if scaler.with_mean else [0.0], dtype=np.float64),
+        'scaler_scale': np.asarray(scaler.scale_ if scaler.with_std else [1.0], dtype=np.float64),
+        'classes': np.asarray(forest.classes_),
+        'tree_roots': np.asarray(roots, dtype=np.int64),
+        'children_left': np.concatenate(lefts).astype(np.int64),
+        'children_right': np.concatenate(rights).astype(np.int64),
+        'feature': np.concatenate(features).astype(np.int64),
+        'threshold': np.concatenate(thresholds).astype(np.float64),
+        'value': np.concatenate(values),
+    }
+    params = {
+        'analyzer': analyzer,
+        'norm': vectorizer.norm,
+        'sublinear_tf': bool(vectorizer.sublinear_tf),
+        'binary': bool(vectorizer.binary),
+        'n_text_features': len(terms),
+        'n_trees': len(forest.estimators_),
+    }
+    return {'arrays': arrays, 'params': params}
+
+def compile_pipeline(model: Pipeline) -> "CompiledPipeline":
+    """Compile a fitted pipeline in memory, for processes serving a model that has no artifact."""
+    extracted = extract_arrays(model)
+    return CompiledPipeline(extracted['arrays'], extracted['params'])
+
+def save_artifact(model: Pipeline, path: str) -> None:
+    """Write the fitted pipeline as a versioned, checksummed artifact, atomically replacing 'path'."""
+    extracted = extract_arrays(model)
+
+    layout = {}
+    offset = 0
+    for name, array in extracted['arrays'].items():
+        array = np.ascontiguousarray(array)
+        extracted['arrays'][name] = array
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+
+    digest = hashlib.sha256()
+    for name, array in extracted['arrays'].items():
+        digest.update(array.tobytes())
+
+    header = json.dumps({
+        'format_version': FORMAT_VERSION,
+        'created_at': datetime.now().isoformat(),
+        'sklearn_version': sklearn.__version__,
+        'params': extracted['params'],
+        'arrays': layout,
+        'checksum': {'algorithm': 'sha256', 'digest': digest.hexdigest()},
+    }).encode('utf-8')
+    data_start = _align(_PREAMBLE.size + len(header))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, len(header)))
+        file.write(header)
+        for name, array in extracted['arrays'].items():
+            file.seek(data_start + layout[name]['offset'])
+            file.write(array.tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+def load_artifact(path: str, verify: bool = True) -> "CompiledPipeline":
+    """
+    Memory-map a model artifact and return a predictor reading straight from the mapping.
+
+    The arrays are never copied, so worker processes loading the same file share its pages
+    and loading costs little more than parsing the header.
+    """
+    with open(path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buffer) < _PREAMBLE.size:
+        raise ModelArtifactError(f"{path} is too short to be a model artifact")
+    magic, version, _, header_length = _PREAMBLE.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ModelArtifactError(f"{path} is not a model artifact")
+    if version != FORMAT_VERSION:
+        raise ModelArtifactError(f"Unsupported model artifact version {version} in {path}")
+
+    header = json.loads(bytes(buffer[_PREAMBLE.size:_PREAMBLE.size + header_length]))
+    data_start = _align(_PREAMBLE.size + header_length)
+
+    arrays = {}
+    digest = hashlib.sha256()
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        if data_start + spec['offset'] + count * dtype.itemsize > len(buffer):
+            raise ModelArtifactError(f"{path} is truncated")
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + spec['offset'])
+        arrays[name] = array.reshape(spec['shape'])
+        if verify:
+            digest.update(array.data)
+
+    if verify and digest.hexdigest() != header['checksum']['digest']:
+        raise ModelArtifactError(f"Checksum mismatch in {path}")
+
+    return CompiledPipeline(arrays, header['params'], metadata=header)
+
+def _row_entries(indptr: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the position in 'rows' and the CSR data position of every stored entry of those rows."""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    block_rows = np.repeat(np.arange(len(rows)), lengths)
+    # Each entry's offset within its row, added to where the row starts
+    offsets = np.arange(len(block_rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return block_rows, starts[block_rows] + offsets
+
+class CompiledPipeline:
+    """
+    Predictor equivalent to the trained Pipeline, evaluated with NumPy over flat arrays.
+
+    Accepts the same DataFrame the Pipeline does (columns 'narration' and 'amount').
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], params: Dict, metadata: Optional[Dict] = None):
+        self.params = params
+        self.metadata = metadata or {}
+        self.analyzer = ANALYZERS[params['analyzer']]
+
+        term_bytes = arrays['term_bytes'].tobytes()
+        offsets = arrays['term_offsets']
+        self.vocabulary = {
+            term_bytes[offsets[index]:offsets[index + 1]].decode('utf-8'): index
+            for index in range(len(offsets) - 1)
+        }
+        self.idf = arrays['idf']
+        self.scaler_mean = arrays['scaler_mean']
+        self.scaler_scale = arrays['scaler_scale']
+        self.classes_ = arrays['classes']
+        self.tree_roots = arrays['tree_roots']
+        self.children_left = arrays['children_left']
+        self.children_right = arrays['children_right']
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.value = arrays['value']
+        self.n_features = params['n_text_features'] + 1
+
+    def transform(self, narrations: Sequence[str], amounts: Sequence[float]) -> sparse.csr_matrix:
+        """
+        Build the float32 CSR feature matrix the forest is evaluated on.
+
+        Rows hold only the tokens of their narration plus the scaled amount, so a batch costs
+        memory in proportion to its tokens rather than to the vocabulary.
+        """
+        vocabulary = self.vocabulary
+        amount_index = self.n_features - 1
+        indptr = [0]
+        indices: List[int] = []
+        counts: List[int] = []
+        for narration in narrations:
+            row_counts: Dict[int, int] = {}
+            for token in self.analyzer(narration):
+                index = vocabulary.get(token)
+                if index is not None:
+                    row_counts[index] = row_counts.get(index, 0) + 1
+            # Sorted columns, as the vectorizer stores them, with the amount last
+            for index in sorted(row_counts):
+                indices.append(index)
+                counts.append(row_counts[index])
+            indices.append(amount_index)
+            counts.append(0)
+            indptr.append(len(indices))
+
+        indices_array = np.array(indices, dtype=np.int32)
+        data = np.array(counts, dtype=np.float64)
+        rows = np.repeat(np.arange(len(narrations)), np.diff(indptr))
+        text = indices_array != amount_index
+        values, text_rows = data[text], rows[text]
+        if self.params['binary']:
+            np.minimum(values, 1.0, out=values)
+        if self.params['sublinear_tf']:
+            np.log(values, out=values)
+            values += 1.0
+        values *= self.idf[indices_array[text]]
+        # Per-row sums in column order, the order scikit-learn's row normalization adds them in
+        if self.params['norm'] == 'l2':
+            norms = np.sqrt(np.bincount(text_rows, weights=values * values, minlength=len(narrations)))
+        elif self.params['norm'] == 'l1':
+            norms = np.bincount(text_rows, weights=np.abs(values), minlength=len(narrations))
+        else:
+            norms = None
+        if norms is not None:
+            norms[norms == 0.0] = 1.0
+            values /= norms[text_rows]
+        data[text] = values
+        data[~text] = (np.asarray(amounts, dtype=np.float64) - self.scaler_mean[0]) / self.scaler_scale[0]
+
+        # Trees compare float32 features, as scikit-learn does
+        return sparse.csr_matrix(
+            (data.astype(np.float32), indices_array, np.array(indptr, dtype=np.int32)),
+            shape=(len(narrations), self.n_features)
+        )
+
+    def apply(self, features: sparse.csr_matrix, trees: slice = slice(None), rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Return the global leaf id reached in every tree (or the 'trees' slice), shape
+        (n_samples, n_trees), for every row of 'features' or only the given 'rows'.
+        """
+        roots = self.tree_roots[trees]
+        rows = np.arange(features.shape[0]) if rows is None else np.asarray(rows)
+        n_samples, n_features = len(rows), features.shape[1]
+        leaves = np.empty((n_samples, len(roots)), dtype=roots.dtype)
+        # Blocks of rows are expanded into one reused dense buffer, so trees index their
+        # features directly while memory stays bounded whatever the batch size
+        block = np.zeros((min(n_samples, _APPLY_BLOCK_ROWS), n_features), dtype=np.float32)
+        for start in range(0, n_samples, _APPLY_BLOCK_ROWS):
+            stop = min(start + _APPLY_BLOCK_ROWS, n_samples)
+            block_rows, positions = _row_entries(features.indptr, rows[start:stop])
+            columns = features.indices[positions]
+            block[block_rows, columns] = features.data[positions]
+            leaves[start:stop] = self._apply_dense(block[:stop - start], roots)
+            block[block_rows, columns] = 0.0
+        return leaves
+
+    def _apply_dense(self, features: np.ndarray, roots: np.ndarray) -> np.ndarray:
+        n_samples, n_trees = features.shape[0], len(roots)
+        flat_features = features.reshape(-1)
+        nodes = np.tile(roots, n_samples)
+        row_offsets = np.repeat(np.arange(n_samples) * features.shape[1], n_trees)
+        # Only (sample, tree) pairs still at an internal node are stepped, so the work per
+        # level shrinks as shallow trees reach their leaves
+        active = np.flatnonzero(self.children_left[nodes] != -1)
+        while active.size:
+            current = nodes[active]
+            go_left = flat_features[row_offsets[active] + self.feature[current]] <= self.threshold[current]
+            current = np.where(go_left, self.children_left[current], self.children_right[current])
+            nodes[active] = current
+            active = active[self.children_left[current] != -1]
+        return nodes.reshape(n_samples, n_trees)
+
+    def predict_proba_features(self, features: np.ndarray) -> np.ndarray:
+        """Class probabilities for a feature matrix built by `transform`."""
+        leaves = self.apply(features)
+        # Summing over the tree axis adds the trees one after another, in the same order as
+        # RandomForestClassifier.predict_proba, so the probabilities match it exactly
+        proba = self.value[leaves].sum(axis=1)
+        proba /= leaves.shape[1]
+        return proba
+
+    def predict_confident_features(
+        self, features: np.ndarray, threshold: float = 0.0, check_every: Optional[int] = 10
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Predict classes with their confidence, evaluating only as many trees as needed.
+
+        A sample stops once the remaining trees can no longer change whether its confidence
+        reaches 'threshold', nor which class leads when it does: each tree adds at most 1 to
+        a class's summed probability. Deciding "confidence >= threshold, else fall back" on
+        the result gives the same outcome as evaluating the whole forest.
+
+        No lead is safe before more than half the trees have voted, so the first check comes
+        then and later ones every 'check_every' trees; None evaluates every tree at once.
+
+        Returns:
+            The predicted classes, their confidence (mean probability of the class over the
+            trees evaluated) and the number of trees evaluated, one entry per sample.
+        """
+        n_samples, n_trees = features.shape[0], len(self.tree_roots)
+        stops = list(range(n_trees // 2 + 1, n_trees, check_every)) + [n_trees] if check_every else [n_trees]
+        votes = np.zeros((n_samples, len(self.classes_)), dtype=np.float64)
+        trees_evaluated = np.zeros(n_samples, dtype=np.int64)
+        pending = np.arange(n_samples)
+        required = threshold * n_trees
+
+        start = 0
+        for stop in stops:
+            leaves = self.apply(features, slice(start, stop), rows=pending)
+            # Add the new trees one after another onto the running sums, as a full evaluation would
+            votes[pending] = np.concatenate([votes[pending][:, None, :], self.value[leaves]], axis=1).sum(axis=1)
+            trees_evaluated[pending] = stop
+            start = stop
+            remaining = n_trees - stop
+            if not remaining:
+                break
+
+            pending_votes = votes[pending]
+            if pending_votes.shape[1] > 1:
+                runner_up, leader = np.partition(pending_votes, -2, axis=1)[:, -2:].T
+            else:
+                leader, runner_up = pending_votes[:, 0], np.zeros(len(pending))
+            settled = ((leader - runner_up > remaining) & (leader >= required)) | (leader + remaining < required)
+            pending = pending[~settled]
+            if not pending.size:
+                break
+
+        confidence = votes.max(axis=1) / trees_evaluated
+        return self.classes_.take(np.argmax(votes, axis=1)), confidence, trees_evaluated
+
+    def predict_confident_arrays(
+        self, narrations: Sequence[str], amounts: Sequence[float], threshold: float = 0.0, check_every: Optional[int] = 10
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return self.predict_confident_features(self.transform(narrations, amounts), threshold, check_every)
+
+    def predict_proba_arrays(self, narrations: Sequence[str], amounts: Sequence[float]) -> np.ndarray:
+        return self.predict_proba_features(self.transform(narrations, amounts))
+
+    def predict_arrays(self, narrations: Sequence[str], amounts: Sequence[float]) -> np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba_arrays(narrations, amounts), axis=1))
+
+    def predict_proba(self, X: pd.DataFrame) -> np.ndarray:
+        return self.predict_proba_arrays(X['narration'].tolist(), X['amount'].tolist())
+
+    def predict(self, X: pd.DataFrame) -> np.ndarray:
+        return self.predict_arrays(X['narration'].tolist(), X['amount'].tolist())
+
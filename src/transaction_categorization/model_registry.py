@@ -0,0 +1,164 @@
+"""
+Versioned model publishing, so serving processes can pick up a retrained model without
+restarting.
+
+The trainer writes every model to its own versioned file, then publishes a small manifest
+naming the version. The manifest is replaced atomically, so a reader sees either the old or
+the new version, never a half-written one; with `model.hot_reload.redis` enabled it is also
+stored in Redis. The manifest names the version file by its path, so every serving host must
+read the same model directory as the trainer, e.g. a shared volume.
+
+The app's startup training and the scheduler may publish at the same time, so publishing
+holds a file lock next to the manifest and every file is written through its own temp file.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+import fcntl
+import glob
+import json
+import os
+import tempfile
+from typing import Dict, Iterator, Optional, Union
+
+import joblib
+import redis
+from sklearn.pipeline import Pipeline
+
+from src.transaction_categorization.model_artifact import CompiledPipeline, load_artifact, save_artifact
+from src.utils.config_utils import config
+from src.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+MODEL_VERSION_KEY = "txcat:model_version"
+
+_redis_client: Optional[redis.Redis] = None
+
+def _get_redis_client() -> Optional[redis.Redis]:
+    global _redis_client
+    if not config["model"].get("hot_reload", {}).get("redis", False):
+        return None
+    if _redis_client is None:
+        _redis_client = redis.Redis(
+            host=config["queue"]["host"] or 'localhost',
+            port=int(config["queue"]["port"] or 6379),
+            password=config["queue"]["password"] or None,
+            decode_responses=True
+        )
+    return _redis_client
+
+def _write_atomically(path: str, write) -> None:
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    # A temp file of its own, so concurrent writers never write into the same one
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=f"{os.path.basename(path)}.", suffix=".tmp", delete=False) as file:
+        try:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        except BaseException:
+            file.close()
+            os.remove(file.name)
+            raise
+    os.replace(file.name, path)
+
+@contextmanager
+def _publish_lock(manifest_path: str) -> Iterator[None]:
+    """Serialize publishing across processes sharing the model directory."""
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    with open(f"{manifest_path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _prune_versions(versions_dir: str, keep: int) -> None:
+    """Delete all but the newest 'keep' versioned model files."""
+    # Processes still serving a deleted version keep their open mapping until they swap
+    files = sorted(glob.glob(os.path.join(versions_dir, "model-*")))
+    for path in files[:-keep] if keep > 0 else []:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not remove old model version {path}: {str(e)}")
+
+def publish_model(model: Pipeline, model_path: str) -> Dict:
+    """
+    Save a fitted pipeline as a new model version and publish it to serving processes.
+
+    The joblib pickle at 'model_path' is kept up to date as the source for later updates;
+    serving processes load the versioned file in the configured format.
+    """
+    model_config = config["model"]
+    model_format = model_config.get("format", "joblib")
+    versions_dir = model_config.get("versions_dir", os.path.join(os.path.dirname(model_path), "versions"))
+    manifest_path = model_config.get("manifest_path", "model_files/model_version.json")
+
+    with _publish_lock(manifest_path):
+        manifest = _publish_locked(model, model_path, model_format, versions_dir, manifest_path)
+    logger.info(f"Published model version {manifest['version']} at {manifest['path']}")
+    return manifest
+
+def _publish_locked(model: Pipeline, model_path: str, model_format: str, versions_dir: str, manifest_path: str) -> Dict:
+    # Taken under the lock, so versions published concurrently still differ and sort in publish order
+    version = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    _write_atomically(model_path, lambda file: joblib.dump(model, file))
+    if model_format == "artifact":
+        path = os.path.join(versions_dir, f"model-{version}.tcm")
+        os.makedirs(versions_dir, exist_ok=True)
+        save_artifact(model, path)
+    else:
+        path = os.path.join(versions_dir, f"model-{version}.joblib")
+        _write_atomically(path, lambda file: joblib.dump(model, file))
+
+    manifest = {
+        "version": version,
+        "format": model_format,
+        "path": path,
+        "created_at": datetime.now().isoformat(),
+    }
+    encoded = json.dumps(manifest)
+    _write_atomically(manifest_path, lambda file: file.write(encoded.encode("utf-8")))
+    redis_client = _get_redis_client()
+    if redis_client is not None:
+        try:
+            redis_client.set(MODEL_VERSION_KEY, encoded)
+        except redis.RedisError as e:
+            logger.warning(f"Could not publish model version {version} to Redis: {str(e)}")
+
+    _prune_versions(versions_dir, int(config["model"].get("keep_versions", 3)))
+    return manifest
+
+def read_published_version() -> Optional[Dict]:
+    """Return the manifest of the published model version, or None if none was published."""
+    redis_client = _get_redis_client()
+    if redis_client is not None:
+        try:
+            encoded = redis_client.get(MODEL_VERSION_KEY)
+            if encoded:
+                return json.loads(encoded)
+        except redis.RedisError as e:
+            logger.warning(f"Could not read the model version from Redis, falling back to the manifest file: {str(e)}")
+
+    manifest_path = config["model"].get("manifest_path", "model_files/model_version.json")
+    try:
+        with open(manifest_path, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+class ModelVersionError(Exception):
+    """Raised when the published manifest names a model file this host cannot read."""
+
+def load_model_version(manifest: Dict) -> Union[Pipeline, CompiledPipeline]:
+    """Load the model file a manifest points to."""
+    # Not a FileNotFoundError, which callers take to mean that no model was trained yet
+    if not os.path.exists(manifest["path"]):
+        raise ModelVersionError(
+            f"Published model version {manifest['version']} is missing at {manifest['path']}; "
+            "serving hosts must share the trainer's model directory"
+        )
+    if manifest["format"] == "artifact":
+        return load_artifact(manifest["path"])
+    return joblib.load(manifest["path"])
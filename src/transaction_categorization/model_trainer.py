@@ -1,5 +1,11 @@
+import copy
+from datetime import datetime
 import os
+import resource
+import time
+import numpy as np
 import pandas as pd
+from sklearn.base import clone
 from sklearn.compose import ColumnTransformer
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.model_selection import train_test_split
@@ -7,21 +13,98 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.pipeline import Pipeline
 from sklearn.metrics import accuracy_score, classification_report
 from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.tree._tree import Tree
 import joblib
 import logging
+from typing import Dict, Optional, Union
 from src.database.db_utils import TransactionService
 from src.transaction_categorization.text_utils import text_processor
 from src.transaction_categorization.data_loader import load_training_data
+from src.transaction_categorization.model_artifact import CompiledPipeline, load_artifact, save_artifact
+from src.transaction_categorization.model_registry import load_model_version, publish_model, read_published_version
+from src.transaction_categorization.training_store import get_training_store
 from src.utils.config_utils import config
+from src.utils.metrics import gauge
 
 model_config = config['model']
 
-def load_or_train_model(model_path: str, logger: logging.Logger, transactionDB: TransactionService) -> Pipeline:
-    """Load the existing model or train a new one if not found."""
-    try:
+MODEL_FIT_SECONDS = gauge("txcat_model_fit_seconds", "Duration of the last model fit")
+MODEL_FIT_ROWS = gauge("txcat_model_fit_rows", "Training rows of the last model fit")
+TRAINING_PEAK_RSS = gauge("txcat_model_training_peak_rss_bytes", "Peak resident memory of the process after the last model fit")
+
+_last_fit_stats: Optional[Dict[str, float]] = None
+
+def fit_with_stats(model, X, y, logger: logging.Logger):
+    """Fit 'model', then log and export the fit time, rows and the process's peak memory."""
+    global _last_fit_stats
+    clf = model.named_steps['clf'] if isinstance(model, Pipeline) else model
+    # A model loaded for refitting was saved with n_jobs cleared below
+    clf.n_jobs = model_config.get("n_jobs")
+    start = time.perf_counter()
+    model.fit(X, y)
+    elapsed = time.perf_counter() - start
+    # Parallel prediction costs more in thread start-up than it saves on small serving batches
+    clf.n_jobs = None
+    # ru_maxrss is in KiB on Linux; it is the high-water mark of the whole process
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    _last_fit_stats = {"seconds": elapsed, "rows": X.shape[0], "peak_rss_bytes": peak_rss}
+    record_fit_stats(_last_fit_stats)
+    logger.info(f"Fitted {type(model).__name__} on {X.shape[0]} rows in {elapsed:.2f}s; peak RSS {peak_rss / 2**20:.0f} MiB")
+    return model
+
+def record_fit_stats(stats: Dict[str, float]) -> None:
+    """Export the statistics of a model fit, which may have run in another process."""
+    MODEL_FIT_SECONDS.set(stats["seconds"])
+    MODEL_FIT_ROWS.set(stats["rows"])
+    TRAINING_PEAK_RSS.set(stats["peak_rss_bytes"])
+
+def last_fit_stats() -> Optional[Dict[str, float]]:
+    """Statistics of the last fit in this process, or None if it has not fitted a model."""
+    return _last_fit_stats
+
+def load_saved_model(model_path: str, logger: logging.Logger) -> Union[Pipeline, CompiledPipeline]:
+    """
+    Load the saved model in the configured format.
+
+    The published model version is loaded if there is one. Otherwise, with model.format
+    set to "artifact", the memory-mapped artifact is loaded; a model that only exists as a
+    joblib pickle is converted to an artifact on first load.
+    """
+    manifest = read_published_version()
+    if manifest is not None:
+        model = load_model_version(manifest)
+        logger.info(f"Model version {manifest['version']} loaded from {manifest['path']}")
+        return model
+
+    if model_config.get("format", "joblib") != "artifact":
         model = joblib.load(model_path)
         logger.info(f"Model loaded from {model_path}")
         return model
+
+    artifact_path = model_config["artifact_path"]
+    if not os.path.exists(artifact_path):
+        model = joblib.load(model_path)
+        try:
+            save_artifact(model, artifact_path)
+            logger.info(f"Model {model_path} converted to artifact {artifact_path}")
+        except OSError as e:
+            logger.warning(f"Could not write model artifact {artifact_path}, serving {model_path}: {str(e)}")
+            return model
+    model = load_artifact(artifact_path)
+    logger.info(f"Model artifact loaded from {artifact_path}")
+    return model
+
+def save_model_files(model: Pipeline, model_path: str, logger: logging.Logger) -> Dict:
+    """Save the fitted pipeline as a new model version and publish it to serving processes."""
+    manifest = publish_model(model, model_path)
+    logger.info(f"Model saved to {model_path} and published as version {manifest['version']}")
+    return manifest
+
+def load_or_train_model(model_path: str, logger: logging.Logger, transactionDB: TransactionService) -> Union[Pipeline, CompiledPipeline]:
+    """Load the existing model or train a new one if not found."""
+    try:
+        return load_saved_model(model_path, logger)
     except FileNotFoundError:
         logger.info("Model not found. Training a new one...")
         return train_model(model_path, logger, transactionDB)
@@ -29,6 +112,23 @@ def load_or_train_model(model_path: str, logger: logging.Logger, transactionDB:
         logger.error(f"Error loading model: {str(e)}")
         raise
 
+def build_pipeline() -> Pipeline:
+    """Create the unfitted TF-IDF + RandomForest pipeline."""
+    # Define the preprocessing for different feature types
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('text', TfidfVectorizer(analyzer=text_processor, max_features=1000), 'narration'),
+            ('num', StandardScaler(), ['amount'])  # Keep 'amount' as a list to ensure it's a DataFrame
+        ],
+        remainder='passthrough'
+    )
+
+    # Create the full pipeline
+    return Pipeline([
+        ('preprocessor', preprocessor),
+        ('clf', RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=model_config.get("n_jobs")))
+    ])
+
 def train_model(model_path: str, logger: logging.Logger, transactionDB: TransactionService) -> Pipeline:
     """Train a new machine learning model for transaction categorization."""
     try:
@@ -42,32 +142,17 @@ def train_model(model_path: str, logger: logging.Logger, transactionDB: Transact
         logger.info(f"X_train shape: {X_train.shape}")
         logger.info(f"y_train shape: {y_train.shape}")
 
-        # Define the preprocessing for different feature types
-        preprocessor = ColumnTransformer(
-            transformers=[
-                ('text', TfidfVectorizer(analyzer=text_processor, max_features=1000), 'narration'),
-                ('num', StandardScaler(), ['amount'])  # Keep 'amount' as a list to ensure it's a DataFrame
-            ],
-            remainder='passthrough'
-        )
-
-        # Create the full pipeline
-        model = Pipeline([
-            ('preprocessor', preprocessor),
-            ('clf', RandomForestClassifier(n_estimators=100, random_state=42))
-        ])
+        model = build_pipeline()
 
         # Train the model
-        model.fit(X_train, y_train)
+        fit_with_stats(model, X_train, y_train, logger)
 
         # Evaluate the model
         evaluate_model(model, X_test, y_test, logger)
 
         # Save the model
-        os.makedirs(os.path.dirname(model_path), exist_ok=True)
-        joblib.dump(model, model_path)
-        joblib.dump(data, model_config["training_data_path"])
-        logger.info(f"Model saved to {model_path}")
+        save_model_files(model, model_path, logger)
+        save_training_history(data)
         return model
 
     except Exception as e:
@@ -84,34 +169,166 @@ def evaluate_model(model: Pipeline, X_test: pd.DataFrame, y_test: pd.Series, log
         logger.error(f"Error evaluating model: {str(e)}")
         raise
 
-def update_model(model: Pipeline, new_data: pd.DataFrame, model_path: str, logger: logging.Logger) -> Pipeline:
-    """Update the model with new training data and evaluate its performance."""
+def load_training_history(logger: logging.Logger) -> pd.DataFrame:
+    """Load the stored training data, or an empty DataFrame if there is none yet."""
+    existing_data = get_training_store().load(limit=model_config.get("training_window"))
+    if existing_data.empty:
+        logger.warning("No existing training data found. Starting fresh.")
+    else:
+        logger.info(f"Existing training data loaded: {len(existing_data)} rows.")
+    return existing_data
+
+def save_training_history(data: pd.DataFrame) -> None:
+    """Append rows to the stored training data, keeping the most recent 'model.training_window' rows."""
+    store = get_training_store()
+    store.append(data)
+    store.maintain(model_config.get("training_window"))
+
+def _remap_tree_classes(tree_estimator: DecisionTreeClassifier, positions: np.ndarray, n_classes: int) -> None:
+    """
+    Widen a fitted tree's class columns to 'n_classes', moving column i to positions[i].
+
+    Forest trees predict class indices, so trees fitted on different label sets must share
+    one class order before they can vote together.
+    """
+    tree = tree_estimator.tree_
+    _, (n_features, _, n_outputs), state = tree.__reduce__()
+    values = np.zeros((state['node_count'], n_outputs, n_classes), dtype=state['values'].dtype)
+    values[:, :, positions] = state['values']
+    state['values'] = values
+
+    remapped = Tree(n_features, np.array([n_classes], dtype=np.intp), n_outputs)
+    remapped.__setstate__(state)
+    tree_estimator.tree_ = remapped
+    tree_estimator.classes_ = np.arange(n_classes, dtype=np.float64)
+    tree_estimator.n_classes_ = n_classes
+
+def extend_forest(forest: RandomForestClassifier, new_forest: RandomForestClassifier, max_trees: Optional[int] = None) -> None:
+    """
+    Add the trees of 'new_forest' to 'forest', keeping at most 'max_trees' trees.
+
+    The trees 'forest' was first fitted with, on the whole history, are never retired; beyond
+    'max_trees' the oldest added trees are. Both forests must be fitted on the same feature
+    space; their class sets may differ.
+    """
+    # Recorded on the first extension and pickled with the forest
+    if not hasattr(forest, 'n_base_estimators_'):
+        forest.n_base_estimators_ = len(forest.estimators_)
+    n_base = forest.n_base_estimators_
+
+    classes = np.union1d(forest.classes_, new_forest.classes_)
+    for source in (forest, new_forest):
+        if not np.array_equal(source.classes_, classes):
+            positions = np.searchsorted(classes, source.classes_)
+            for tree_estimator in source.estimators_:
+                _remap_tree_classes(tree_estimator, positions, len(classes))
+
+    base, added = forest.estimators_[:n_base], forest.estimators_[n_base:] + new_forest.estimators_
+    if max_trees:
+        # Each added tree saw one update's data, the oldest the oldest; retire those first
+        added = added[max(len(base) + len(added) - max_trees, 0):]
+    estimators = base + added
+    forest.estimators_ = estimators
+    forest.n_estimators = len(estimators)
+    forest.classes_ = classes
+    forest.n_classes_ = len(classes)
+
+def _update_random_state(new_data: pd.DataFrame) -> int:
+    """Seed the trees of an update by the day of its newest data, so each day's trees differ from the last."""
+    dates = pd.to_datetime(new_data['date'], errors='coerce').dropna() if 'date' in new_data else pd.Series(dtype='datetime64[ns]')
+    day = dates.max().toordinal() if len(dates) else datetime.now().toordinal()
+    return (int(model_config["random_state"]) + day) % 2**32
+
+def incremental_update_model(model: Pipeline, new_data: pd.DataFrame, logger: logging.Logger) -> Pipeline:
+    """
+    Add trees fitted on 'new_data' only to the fitted pipeline's forest.
+
+    The TF-IDF vocabulary and amount scaling stay as they were fitted, so the cost grows
+    with the new data rather than the whole history. Tokens first seen after the last full
+    refit are not features until the next refit (model.update_mode "refit").
+    """
+    incremental_conf = model_config.get("incremental", {})
+    X = new_data[['narration', 'amount']]
+    y = new_data['category_id']
+
+    if len(new_data) >= 10 and y.nunique() > 1:
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=model_config["test_size"], random_state=model_config["random_state"])
+    else:
+        X_train, X_test, y_train, y_test = X, None, y, None
+
+    forest = model.named_steps['clf']
+    new_forest = RandomForestClassifier(
+        n_estimators=int(incremental_conf.get("trees_per_update", 10)),
+        # A fixed seed would grow every update's trees from the same bootstrap and feature draws
+        random_state=_update_random_state(new_data),
+        n_jobs=model_config.get("n_jobs")
+    )
+    fit_with_stats(new_forest, model.named_steps['preprocessor'].transform(X_train), y_train, logger)
+    extend_forest(forest, new_forest, incremental_conf.get("max_trees"))
+    logger.info(f"Added {new_forest.n_estimators} trees fitted on {len(X_train)} records; forest now has {forest.n_estimators} trees")
+
+    if X_test is not None:
+        evaluate_model(model, X_test, y_test, logger)
+    return model
+
+def update_model(model: Optional[Union[Pipeline, CompiledPipeline]], new_data: pd.DataFrame, model_path: str, logger: logging.Logger) -> Optional[Union[Pipeline, CompiledPipeline]]:
+    """
+    Update the model with new training data and evaluate its performance.
+
+    Without new data the model is returned as it is and nothing is published.
+
+    With model.update_mode "incremental" new trees are fitted on the new data only;
+    otherwise the whole pipeline is refitted on the stored history plus the new data.
+    """
+    if new_data.empty:
+        logger.info("No new training data; keeping the current model.")
+        return model
+
     try:
         logger.info(f"Updating model with new data: {len(new_data)} records")
+        start = time.perf_counter()
 
-        try:
-            existing_data = joblib.load('training_data.joblib')
-            logger.info("Existing training data loaded.")
-        except (FileNotFoundError, EOFError):
-            logger.warning("No existing training data found. Starting fresh.")
-            existing_data = pd.DataFrame()
+        if model_config.get("update_mode", "refit") == "incremental":
+            # Only the pickled Pipeline can be extended; the serving model may be a compiled artifact.
+            # A serving Pipeline is copied so predictions in flight never see a half-extended forest.
+            base_model = copy.deepcopy(model) if isinstance(model, Pipeline) else None
+            if base_model is None and os.path.exists(model_path):
+                base_model = joblib.load(model_path)
+            unseen = set(new_data['category_id'].unique()) - set(base_model.named_steps['clf'].classes_) if base_model is not None else set()
+            if unseen:
+                # A handful of new trees cannot outvote the rest of the forest for a new category
+                logger.info(f"New data has categories the model has never seen ({sorted(unseen)}). Refitting from scratch.")
+            elif base_model is not None:
+                model = incremental_update_model(base_model, new_data, logger)
+                save_model_files(model, model_path, logger)
+                save_training_history(new_data)
+                logger.info(f"Model updated incrementally in {time.perf_counter() - start:.2f}s.")
+                return model
+            else:
+                logger.warning("No fitted model to extend. Refitting from scratch.")
 
-        updated_data = pd.concat([existing_data, new_data], ignore_index=True)
+        # Rows already stored and seen again in the new data keep their newest label
+        updated_data = pd.concat([load_training_history(logger), new_data], ignore_index=True)
+        if 'transaction_id' in updated_data:
+            updated_data = updated_data.drop_duplicates('transaction_id', keep='last')
 
         X = updated_data[['narration', 'amount']]
         y = updated_data['category_id']  
 
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=model_config["test_size"], random_state=model_config["random_state"])
-        
-        model.fit(X_train, y_train)
+
+        # The refit starts from scratch on an unfitted copy, so the model being served is never
+        # changed under it; a compiled (or not yet loaded) serving model cannot be refitted
+        model = clone(model) if isinstance(model, Pipeline) else build_pipeline()
+
+        fit_with_stats(model, X_train, y_train, logger)
 
         evaluate_model(model, X_test, y_test, logger)
-        os.makedirs(os.path.dirname(model_path), exist_ok=True)
-        joblib.dump(model, model_path)
-        joblib.dump(updated_data, model_config["training_data_path"])
-        logger.info("Model and training data updated, evaluated, and saved.")
+        save_model_files(model, model_path, logger)
+        save_training_history(new_data)
+        logger.info(f"Model and training data updated, evaluated, and saved in {time.perf_counter() - start:.2f}s.")
         
         return model
     except Exception as e:
         logger.error(f"Error updating model: {str(e)}")
-        raise
\ No newline at end of file
+        raise
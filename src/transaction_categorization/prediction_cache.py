@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from src.transaction_categorization.text_utils import narration_tokens
+from src.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+CacheKey = Tuple[str, float]
+
+class PredictionCache:
+    """
+    Bounded LRU cache of model predictions with a per-entry TTL.
+
+    Keys are the narration as the TF-IDF vectorizer sees it (the `text_processor` tokens)
+    plus the amount, so recurring transactions such as the same paybill or salary line skip
+    the model. With 'amount_bucket_size' set, amounts in the same bucket share a key. That is
+    an approximation: the model sees the scaled amount itself, so a cached category may differ
+    from the one it would predict for the actual amount. An optional Redis client adds a tier
+    shared by replicas; its keys carry a namespace that should change whenever the model does.
+
+    Local entries are tagged with the namespace too. Callers pass the namespace of the model
+    that made a prediction, so a batch finishing on a model that has since been swapped out
+    neither reads nor stores entries of the current one.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl_seconds: float = 3600,
+        amount_bucket_size: Optional[float] = None,
+        redis_client=None,
+        namespace: str = "",
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.amount_bucket_size = amount_bucket_size
+        self.redis_client = redis_client
+        self.namespace = namespace
+        self._entries: "OrderedDict[CacheKey, Tuple[str, float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, narration: str, amount: float) -> CacheKey:
+        if self.amount_bucket_size:
+            return " ".join(narration_tokens(narration)), int(float(amount) // self.amount_bucket_size)
+        return " ".join(narration_tokens(narration)), float(amount)
+
+    def _redis_key(self, key: CacheKey, namespace: str) -> str:
+        return f"prediction_cache:{namespace}:{key[1]}:{key[0]}"
+
+    def get(self, key: CacheKey, namespace: Optional[str] = None) -> Optional[str]:
+        """Return the category cached for the key by the model of 'namespace' (the current one by default), or None on a miss."""
+        namespace = self.namespace if namespace is None else namespace
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] == namespace:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+
+        if self.redis_client is not None:
+            try:
+                category = self.redis_client.get(self._redis_key(key, namespace))
+            except Exception as e:
+                logger.warning(f"Prediction cache Redis lookup failed: {str(e)}")
+                category = None
+            if category is not None:
+                self._store(key, category, namespace)
+                with self._lock:
+                    self.hits += 1
+                return category
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: CacheKey, category: str, namespace: Optional[str] = None) -> None:
+        """Cache a category predicted by the model of 'namespace' (the current one by default)."""
+        namespace = self.namespace if namespace is None else namespace
+        self._store(key, category, namespace)
+        if self.redis_client is not None:
+            try:
+                self.redis_client.setex(self._redis_key(key, namespace), int(self.ttl_seconds), category)
+            except Exception as e:
+                logger.warning(f"Prediction cache Redis write failed: {str(e)}")
+
+    def _store(self, key: CacheKey, category: str, namespace: str) -> None:
+        with self._lock:
+            # Results of a model swapped out meanwhile are of no use locally
+            if namespace != self.namespace:
+                return
+            self._entries[key] = (category, time.monotonic() + self.ttl_seconds, namespace)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """
+        Drop every local entry. Passing a new namespace also orphans the shared Redis
+        entries written for the previous model.
+        """
+        with self._lock:
+            self._entries.clear()
+            if namespace is not None:
+                self.namespace = namespace
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,7 +1,24 @@
 import re
-from typing import List
+from functools import lru_cache
+from typing import List, Tuple
+
+from src.utils.config_utils import config
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+
+@lru_cache(maxsize=config["categorization"].get("normalization_cache_size", 10000))
+def narration_tokens(text: str) -> Tuple[str, ...]:
+    """
+    Split a narration into its words without punctuation, as the TF-IDF vectorizer sees them.
+
+    Results are kept in a bounded LRU cache, so a recurring narration is tokenized once per
+    process, whether it is being predicted, used as a prediction cache key or trained on.
+    Tokens are not persisted: the training store keeps raw narrations, which the vectorizer
+    tokenizes at each fit. The keyword and merchant matchers do not use them either, as they
+    match substrings that may span words or contain punctuation ("AT&T").
+    """
+    return tuple(_PUNCTUATION.sub('', text.lower()).split())
 
 def text_processor(text: str) -> List[str]:
     """Process text for TF-IDF vectorization."""
-    text = re.sub(r'[^\w\s]', '', text.lower())
-    return text.split()
\ No newline at end of file
+    return list(narration_tokens(text))
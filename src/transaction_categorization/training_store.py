@@ -0,0 +1,226 @@
+"""
+Append-only columnar store of the labelled rows the model is trained on.
+
+The store is a directory of partitions, one per append, each holding only the columns
+training reads as .npy files plus a small JSON header with its row count and date range.
+A daily update writes its few thousand rows as a new partition instead of rewriting the
+whole history. Reads memory-map the column files, skip partitions outside the requested
+time window, and keep the last stored row of each transaction id, so a relabelled
+transaction replaces its earlier label.
+
+The app and the scheduler may write to the same store, so writers hold an exclusive
+lock on the store's lock file and readers a shared one.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+import fcntl
+import json
+import os
+import shutil
+import threading
+from typing import Dict, Iterator, List, Optional
+import uuid
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.utils.config_utils import config
+from src.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+COLUMNS = ('transaction_id', 'narration', 'amount', 'category_id', 'date')
+
+# Fixed-width columns; narrations are stored as one UTF-8 text, separated by _SEPARATOR
+_DTYPES = {
+    'transaction_id': np.int64,
+    'amount': np.float64,
+    'category_id': np.int64,
+    'date': 'datetime64[ns]',
+}
+# An ASCII record separator, which narrations never contain; text_processor treats it as whitespace
+_SEPARATOR = "\x1e"
+_PARTITION_PREFIX = "part-"
+_HEADER = "partition.json"
+_LOCK_FILE = ".lock"
+
+class TrainingStore:
+    """Labelled training rows in append-only, memory-mapped column partitions under 'path'."""
+
+    def __init__(self, path: str, max_partitions: int = 30):
+        self.path = path
+        self.max_partitions = max_partitions
+        os.makedirs(path, exist_ok=True)
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        """Hold the store's file lock, which serializes writers across threads and processes."""
+        with open(os.path.join(self.path, _LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _partitions(self) -> List[str]:
+        # Zero-padded sequence numbers, so name order is append order
+        return sorted(name for name in os.listdir(self.path) if name.startswith(_PARTITION_PREFIX))
+
+    def _read_header(self, partition: str) -> Dict:
+        with open(os.path.join(self.path, partition, _HEADER)) as file:
+            return json.load(file)
+
+    def _write_partition(self, rows: pd.DataFrame) -> str:
+        """Write 'rows' as the next partition. The caller holds the exclusive lock."""
+        # Unique per writer, so a writer that does not hold the lock can never clobber it
+        temp_path = os.path.join(self.path, f".tmp-{os.getpid()}-{uuid.uuid4().hex}")
+        os.makedirs(temp_path)
+        try:
+            self._write_columns(rows, temp_path)
+            while True:
+                partitions = self._partitions()
+                sequence = int(partitions[-1][len(_PARTITION_PREFIX):]) + 1 if partitions else 1
+                name = f"{_PARTITION_PREFIX}{sequence:08d}"
+                try:
+                    # Readers never see a partially written partition
+                    os.rename(temp_path, os.path.join(self.path, name))
+                    return name
+                except OSError:
+                    if not os.path.exists(os.path.join(self.path, name)):
+                        raise
+                    # Another writer claimed this sequence number; take the next one
+        except BaseException:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+
+    def _write_columns(self, rows: pd.DataFrame, temp_path: str) -> None:
+        for column, dtype in _DTYPES.items():
+            # Through np.asarray, as pandas attaches metadata np.save warns about to datetime dtypes
+            np.save(os.path.join(temp_path, f"{column}.npy"), np.asarray(rows[column].to_numpy(), dtype=dtype))
+        narrations = rows['narration'].astype(str).str.replace(_SEPARATOR, " ", regex=False)
+        with open(os.path.join(temp_path, "narration.txt"), 'w', encoding='utf-8', newline='') as file:
+            file.write(_SEPARATOR.join(narrations))
+
+        dates = rows['date'].dropna()
+        header = {
+            'rows': len(rows),
+            'min_date': dates.min().isoformat() if len(dates) else None,
+            'max_date': dates.max().isoformat() if len(dates) else None,
+            'created_at': datetime.now().isoformat(),
+        }
+        with open(os.path.join(temp_path, _HEADER), 'w') as file:
+            json.dump(header, file)
+
+    def _read_partition(self, partition: str, since: Optional[np.datetime64]) -> Dict[str, np.ndarray]:
+        directory = os.path.join(self.path, partition)
+        columns = {
+            column: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode='r') for column in _DTYPES
+        }
+        with open(os.path.join(directory, "narration.txt"), encoding='utf-8', newline='') as file:
+            narrations = np.array(file.read().split(_SEPARATOR), dtype=object)
+
+        selected = slice(None) if since is None else np.flatnonzero(columns['date'] >= since)
+        columns = {column: np.asarray(values[selected]) for column, values in columns.items()}
+        columns['narration'] = narrations[selected]
+        return columns
+
+    def append(self, data: pd.DataFrame) -> int:
+        """Store the rows of 'data' as a new partition. Returns the number of rows stored."""
+        rows = data.loc[:, list(COLUMNS)].dropna(subset=['transaction_id', 'narration', 'amount', 'category_id'])
+        if rows.empty:
+            return 0
+        rows = rows.assign(date=pd.to_datetime(rows['date']))
+        with self._locked(exclusive=True):
+            name = self._write_partition(rows)
+        logger.info(f"Appended {len(rows)} training rows as {name}")
+        return len(rows)
+
+    def load(self, since: Optional[datetime] = None, limit: Optional[int] = None) -> pd.DataFrame:
+        """
+        Return the stored rows in the order they were appended, one per transaction id.
+
+        Args:
+            since (datetime, optional): Only rows dated at or after this time.
+            limit (int, optional): Only the most recently appended 'limit' rows.
+        """
+        # Shared, so a compaction in another process cannot delete partitions being read
+        with self._locked(exclusive=False):
+            return self._load(since, limit)
+
+    def _load(self, since: Optional[datetime], limit: Optional[int]) -> pd.DataFrame:
+        threshold = None if since is None else np.datetime64(pd.Timestamp(since).to_datetime64(), 'ns')
+        parts = []
+        for partition in self._partitions():
+            if threshold is not None:
+                max_date = self._read_header(partition)['max_date']
+                if max_date is None or np.datetime64(pd.Timestamp(max_date).to_datetime64(), 'ns') < threshold:
+                    continue
+            parts.append(self._read_partition(partition, threshold))
+        if not parts:
+            return pd.DataFrame({column: pd.Series(dtype=_DTYPES.get(column, object)) for column in COLUMNS})
+
+        columns = {column: np.concatenate([part[column] for part in parts]) for column in COLUMNS}
+        # Keep the last appended row of every transaction id
+        _, last_from_end = np.unique(columns['transaction_id'][::-1], return_index=True)
+        keep = np.sort(len(columns['transaction_id']) - 1 - last_from_end)
+        if limit:
+            keep = keep[-int(limit):]
+        return pd.DataFrame({column: values[keep] for column, values in columns.items()})
+
+    def compact(self, keep: Optional[int] = None) -> None:
+        """Merge every partition into one holding the deduplicated rows, only the newest 'keep' if given."""
+        with self._locked(exclusive=True):
+            partitions = self._partitions()
+            if not partitions:
+                return
+            data = self._load(None, keep)
+            self._write_partition(data)
+            for partition in partitions:
+                shutil.rmtree(os.path.join(self.path, partition), ignore_errors=True)
+        logger.info(f"Compacted {len(partitions)} training data partitions into {len(data)} rows")
+
+    def maintain(self, keep: Optional[int] = None) -> None:
+        """Compact once there are more than 'max_partitions' partitions or more than twice 'keep' stored rows."""
+        with self._locked(exclusive=False):
+            partitions = self._partitions()
+            stored_rows = sum(self._read_header(partition)['rows'] for partition in partitions)
+        if len(partitions) > self.max_partitions or (keep and stored_rows > 2 * keep):
+            self.compact(keep)
+
+    def count(self) -> int:
+        """Number of stored rows, counting every stored version of a relabelled transaction."""
+        with self._locked(exclusive=False):
+            return sum(self._read_header(partition)['rows'] for partition in self._partitions())
+
+    def import_legacy(self, path: str) -> int:
+        """Copy the rows of a training_data.joblib DataFrame written by earlier versions into the store."""
+        try:
+            data = joblib.load(path)
+        except (FileNotFoundError, EOFError):
+            return 0
+        if data.empty or not set(COLUMNS) <= set(data.columns):
+            return 0
+        imported = self.append(data)
+        logger.info(f"Imported {imported} training rows from {path}")
+        return imported
+
+_training_store: Optional[TrainingStore] = None
+_training_store_lock = threading.Lock()
+
+def get_training_store() -> TrainingStore:
+    """Return the configured store, importing the legacy joblib training data into it when it is new."""
+    global _training_store
+    if _training_store is None:
+        with _training_store_lock:
+            if _training_store is None:
+                model_config = config["model"]
+                store_conf = model_config.get("training_store", {})
+                store = TrainingStore(
+                    store_conf.get("path", "model_files/training_store"),
+                    max_partitions=int(store_conf.get("max_partitions", 30))
+                )
+                if store.count() == 0 and model_config.get("training_data_path"):
+                    store.import_legacy(model_config["training_data_path"])
+                _training_store = store
+    return _training_store
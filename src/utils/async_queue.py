@@ -0,0 +1,137 @@
+import json
+import os
+import socket
+import time
+from typing import Iterable, List, Tuple
+import uuid
+
+import redis.asyncio as aioredis
+
+from src.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+class AsyncRedisQueue:
+    """
+    asyncio counterpart of `RedisQueue` for the asynchronous processing pipeline.
+
+    Uses the same keys as `RedisQueue`'s reliable mode, except that items are acknowledged
+    one by one, so a consumer can have several batches in flight at once.
+    """
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, queue_name='default_queue', redis_client=None):
+        self.redis_client = redis_client or aioredis.Redis(
+            host=host,
+            port=port,
+            db=db,
+            password=password,
+            decode_responses=True
+        )
+        self.queue_name = queue_name
+
+    def consumer_name(self, suffix: str) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}:{suffix}"
+
+    def _processing_list(self, consumer: str) -> str:
+        return f"{self.queue_name}:processing:{consumer}"
+
+    def _claims_key(self) -> str:
+        return f"{self.queue_name}:processing"
+
+    async def dequeue_reliable(self, consumer: str, batch_size: int = 10, timeout: float = 5) -> Tuple[List[str], List[dict]]:
+        """
+        Move up to 'batch_size' items into the consumer's processing list, blocking for up to
+        'timeout' seconds for the first one. Returns the raw items, needed to acknowledge
+        them, and the parsed transactions.
+        """
+        processing_list = self._processing_list(consumer)
+        await self.redis_client.hset(self._claims_key(), consumer, time.time())
+        first = await self.redis_client.blmove(self.queue_name, processing_list, timeout, "LEFT", "RIGHT")
+        if first is None:
+            return [], []
+
+        pipe = self.redis_client.pipeline()
+        for _ in range(batch_size - 1):
+            pipe.lmove(self.queue_name, processing_list, "LEFT", "RIGHT")
+        raw_items = [first] + [item for item in await pipe.execute() if item is not None]
+
+        transactions = []
+        for item in raw_items:
+            try:
+                transactions.append(json.loads(item))
+            except json.JSONDecodeError as e:
+                logger.error(f"JSON parsing error for item: {item[:100]}... Error: {str(e)}")
+                await self.redis_client.rpush("error_queue", item)
+        logger.debug("Dequeued %d item(s) for %s.", len(raw_items), consumer)
+        return raw_items, transactions
+
+    async def acknowledge(self, consumer: str, raw_items: List[str]) -> None:
+        """Remove processed items from the consumer's processing list."""
+        if not raw_items:
+            return
+        processing_list = self._processing_list(consumer)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for item in raw_items:
+            pipe.lrem(processing_list, 1, item)
+        await pipe.execute()
+
+    async def abandon(self, consumer: str, raw_items: List[str]) -> None:
+        """
+        Set aside the items of a failed batch, for `requeue_stale` to return to the queue once
+        they are 'stale_after' seconds old.
+
+        The items move from the consumer's processing list to a list of their own, so the
+        consumer's other batches in flight neither refresh their claim nor acknowledge them.
+        """
+        if not raw_items:
+            return
+        abandoned = f"{consumer}:failed:{uuid.uuid4().hex}"
+        processing_list = self._processing_list(consumer)
+        pipe = self.redis_client.pipeline()
+        for item in raw_items:
+            pipe.lrem(processing_list, 1, item)
+        pipe.rpush(self._processing_list(abandoned), *raw_items)
+        pipe.hset(self._claims_key(), abandoned, time.time())
+        await pipe.execute()
+
+    async def refresh_claims(self, consumers: Iterable[str]) -> None:
+        """Mark the consumers' processing lists as still being worked on, so peers do not requeue them."""
+        now = time.time()
+        mapping = {consumer: now for consumer in consumers}
+        if mapping:
+            await self.redis_client.hset(self._claims_key(), mapping=mapping)
+
+    async def requeue_stale(self, stale_after: float = 300) -> int:
+        """Return items claimed more than 'stale_after' seconds ago to the head of the queue."""
+        requeued = 0
+        now = time.time()
+        for consumer, claimed_at in (await self.redis_client.hgetall(self._claims_key())).items():
+            if now - float(claimed_at) < stale_after:
+                continue
+            processing_list = self._processing_list(consumer)
+            while await self.redis_client.lmove(processing_list, self.queue_name, "RIGHT", "LEFT") is not None:
+                requeued += 1
+            await self.redis_client.hdel(self._claims_key(), consumer)
+
+        if requeued:
+            logger.warning(f"Requeued {requeued} stale item(s) to {self.queue_name}.")
+        return requeued
+
+    async def claim_batch(self, ids: List, ttl: int = 300, prefix: str = "processed_transaction") -> List:
+        """Claim ids with pipelined SET NX EX and return the ids this caller won."""
+        if not ids:
+            return []
+        pipe = self.redis_client.pipeline(transaction=False)
+        for id_ in ids:
+            pipe.set(f"{prefix}:{id_}", "1", nx=True, ex=ttl)
+        return [id_ for id_, won in zip(ids, await pipe.execute()) if won]
+
+    async def release_batch(self, ids: List, prefix: str = "processed_transaction") -> None:
+        if ids:
+            await self.redis_client.delete(*(f"{prefix}:{id_}" for id_ in ids))
+
+    async def size(self) -> int:
+        return await self.redis_client.llen(self.queue_name)
+
+    async def close(self) -> None:
+        await self.redis_client.aclose()
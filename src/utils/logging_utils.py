@@ -1,61 +1,244 @@
+import atexit
+from datetime import datetime
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import multiprocessing
+import multiprocessing.queues
 import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
 from src.utils.config_utils import config
 
-def setup_logger(name: str) -> logging.Logger:
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including fields passed through `extra`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
     """
-    Set up and return a logger for the given name.
-    
-    Args:
-        name (str): The name of the logger.
+    Thin out high-volume events, identified by the `event` field passed through `extra`.
 
-    Returns:
-        logging.Logger: Configured logger instance.
+    Each configured event keeps one record in every `sample_every` and at most
+    `max_per_second` records per second. Records without an event, or at WARNING and above,
+    always pass.
     """
-    logging_conf = config.get("logging", {})
-    
-    # Set up basic configuration
-    level = getattr(logging, logging_conf.get("level", "INFO"))
-    log_format = logging_conf.get("format", '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    date_format = logging_conf.get("date_format", '%Y-%m-%d %H:%M:%S')
 
-    # Create logger
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
+    def __init__(self, rules: Dict[str, Dict[str, float]]):
+        super().__init__()
+        self.rules = rules
+        self._seen: Dict[str, int] = {}
+        self._window: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
 
-    # Clear any existing handlers
-    if logger.hasHandlers():
-        logger.handlers.clear()
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        rule = self.rules.get(event) if event else None
+        if rule is None or record.levelno >= logging.WARNING:
+            return True
+
+        with self._lock:
+            seen = self._seen.get(event, 0)
+            self._seen[event] = seen + 1
+            sample_every = int(rule.get("sample_every", 1))
+            if sample_every > 1 and seen % sample_every:
+                return False
+
+            max_per_second = rule.get("max_per_second")
+            if max_per_second is not None:
+                now = time.monotonic()
+                window = self._window.setdefault(event, [now, 0])
+                if now - window[0] >= 1.0:
+                    window[0], window[1] = now, 0
+                if window[1] >= max_per_second:
+                    return False
+                window[1] += 1
+        return True
+
+class _DeferredFormatQueueHandler(QueueHandler):
+    """Hand records to the listener unformatted, so formatting happens off the calling thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The queue never leaves the process, so the record needs no pickling-safe copy;
+        # merging the arguments now keeps later mutation of them out of the message.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+_handlers: Optional[List[logging.Handler]] = None
+_queue_handler: Optional[QueueHandler] = None
+_listener: Optional[QueueListener] = None
+_sampling_filter: Optional[SamplingFilter] = None
+_handlers_lock = threading.Lock()
+
+# Forked worker processes send their records here; the parent's listener writes them
+_worker_queue: Optional[multiprocessing.queues.Queue] = None
+_worker_listener: Optional[QueueListener] = None
+_in_worker = False
+
+def _build_handlers(logging_conf: dict) -> List[logging.Handler]:
+    """Create the console and file handlers shared by every logger."""
+    if logging_conf.get("json", False):
+        formatter = JsonFormatter()
+    else:
+        log_format = logging_conf.get("format", '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        date_format = logging_conf.get("date_format", '%Y-%m-%d %H:%M:%S')
+        formatter = logging.Formatter(log_format, date_format)
 
-    # Create formatters
-    formatter = logging.Formatter(log_format, date_format)
+    handlers = []
 
     # Set up console handler
     if logging_conf.get("console_output", True):
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+        handlers.append(console_handler)
 
     # Set up file handler with rotation
     if logging_conf.get("file_output", False):
         log_file = logging_conf.get("file", "app.log")
-        
+
         # Ensure that max_file_size is an integer
         max_file_size = int(logging_conf.get("max_file_size", 5 ))* 1024 * 1024  # Default 5MB
         backup_count = int(logging_conf.get("backup_count", 3))
-        
+
         # Ensure log directory exists
         log_dir = os.path.dirname(log_file)
         if log_dir and not os.path.exists(log_dir):
             os.makedirs(log_dir)
 
         file_handler = RotatingFileHandler(
-            log_file, 
-            maxBytes=max_file_size, 
+            log_file,
+            maxBytes=max_file_size,
             backupCount=backup_count
         )
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+
+    return handlers
+
+def _start_listener() -> None:
+    """Start the thread writing queued records to the shared handlers."""
+    global _listener
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = QueueListener(log_queue, *_handlers, respect_handler_level=True)
+    _listener.start()
+
+def start_worker_log_listener() -> None:
+    """
+    Have worker processes forked from now on send their records to this process.
+
+    Without it every worker would write to, and rotate, the same log file through its own
+    copy of the file handler. Call it in the parent before forking workers.
+    """
+    global _worker_queue, _worker_listener
+    _get_handlers(config.get("logging", {}))
+    with _handlers_lock:
+        if _worker_queue is None:
+            _worker_queue = multiprocessing.get_context("fork").Queue()
+            _worker_listener = QueueListener(_worker_queue, *_handlers, respect_handler_level=True)
+            _worker_listener.start()
+
+def _after_fork_in_child() -> None:
+    global _handlers, _queue_handler, _listener, _in_worker
+    if _worker_queue is None:
+        # The listener thread does not survive a fork; forked workers start their own
+        if _queue_handler is not None:
+            _start_listener()
+        return
+
+    # Route every configured logger to the parent's listener instead of the inherited handlers
+    worker_handler = QueueHandler(_worker_queue)
+    shared = set(_handlers) | ({_queue_handler} if _queue_handler is not None else set())
+    for logger in list(logging.Logger.manager.loggerDict.values()):
+        if isinstance(logger, logging.Logger) and shared.intersection(logger.handlers):
+            logger.handlers = [worker_handler]
+    _handlers, _queue_handler, _listener = [worker_handler], None, None
+    _in_worker = True
+
+def shutdown_logging() -> None:
+    """
+    Write out the records still queued in async mode or for the parent's listener.
+
+    Runs at interpreter exit; forked worker processes skip exit handlers and call it
+    themselves before exiting.
+    """
+    if _in_worker:
+        _worker_queue.close()
+        _worker_queue.join_thread()
+        return
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+    if _worker_listener is not None and _worker_listener._thread is not None:
+        _worker_listener.stop()
+
+def _get_handlers(logging_conf: dict) -> List[logging.Handler]:
+    """Return the handlers to attach to a logger: the queue handler in async mode, else the shared handlers."""
+    global _handlers, _queue_handler, _sampling_filter
+    with _handlers_lock:
+        if _handlers is None:
+            _handlers = _build_handlers(logging_conf)
+            sampling = logging_conf.get("sampling") or {}
+            if sampling:
+                _sampling_filter = SamplingFilter(sampling)
+            if logging_conf.get("async", False):
+                _queue_handler = _DeferredFormatQueueHandler(queue.SimpleQueue())
+                _start_listener()
+            atexit.register(shutdown_logging)
+            os.register_at_fork(after_in_child=_after_fork_in_child)
+    return [_queue_handler] if _queue_handler is not None else _handlers
+
+def setup_logger(name: str) -> logging.Logger:
+    """
+    Set up and return a logger for the given name.
+
+    All loggers share one set of handlers. With `logging.async` enabled they only enqueue
+    records; a single listener thread formats them and does the console and file I/O.
+
+    Args:
+        name (str): The name of the logger.
+
+    Returns:
+        logging.Logger: Configured logger instance.
+    """
+    logging_conf = config.get("logging", {})
+
+    # Set up basic configuration
+    level = getattr(logging, logging_conf.get("level", "INFO"))
+
+    # Create logger
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+
+    # Clear any existing handlers
+    if logger.hasHandlers():
+        logger.handlers.clear()
+
+    for handler in _get_handlers(logging_conf):
+        logger.addHandler(handler)
+
+    # Sample on the logger rather than on each handler, so every record is counted once and
+    # all handlers keep the same records; in async mode this also drops them before enqueueing
+    if _sampling_filter is not None and _sampling_filter not in logger.filters:
+        logger.addFilter(_sampling_filter)
 
     return logger
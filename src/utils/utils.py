@@ -1,14 +1,24 @@
+from contextlib import contextmanager
+import socket
+import threading
 import time
+import uuid
 import yaml
-from typing import Dict, Generator, List
+from typing import Dict, Generator, Iterator, List, Optional
 import os
 import json
 import redis
 
 from src.utils.logging_utils import setup_logger
+from src.utils.metrics import counter, histogram
 
 logger = setup_logger(__name__)
 
+QUEUE_DEQUEUE_SECONDS = histogram(
+    "txcat_queue_dequeue_seconds", "Time to move a batch off the queue, excluding the wait for the first item", ["method"]
+)
+QUEUE_DEQUEUED_ITEMS = counter("txcat_queue_dequeued_items", "Items taken off the queue", ["method"])
+
 class CategoryLoader:
 
     def __init__(self, category_folder: str):
@@ -20,7 +30,9 @@ class CategoryLoader:
             return yaml.safe_load(file)
 
     def _load_keyword_categories(self) -> Dict[str, List[str]]:
-        return self._read_yaml_file('keyword_categories.yaml')
+        categories = self._read_yaml_file('keyword_categories.yaml')
+        # The YAML nests every category under a top-level 'keyword_categories' key
+        return categories.get('keyword_categories', categories)
 
     def _load_merchant_categories(self) -> Dict[str, str]:
         return self._read_yaml_file('merchant_categories.yaml')
@@ -33,8 +45,8 @@ loader = CategoryLoader(category_folder)
 
 
 class RedisQueue:
-    def __init__(self, host='localhost', port=6379, db=0, password=None, queue_name='default_queue'):
-        self.redis_client = redis.Redis(
+    def __init__(self, host='localhost', port=6379, db=0, password=None, queue_name='default_queue', redis_client=None):
+        self.redis_client = redis_client or redis.Redis(
             host=host,
             port=port,
             db=db,
@@ -55,6 +67,24 @@ class RedisQueue:
     def delete(self, var):
         return self.redis_client.delete(var)
     
+    def claim_batch(self, ids: List, ttl: int = 300, prefix: str = "processed_transaction") -> List:
+        """
+        Claim many ids at once with pipelined SET NX EX and return the ids this caller won.
+
+        Ids already claimed by another worker within the last 'ttl' seconds are left out.
+        """
+        if not ids:
+            return []
+        pipe = self.redis_client.pipeline(transaction=False)
+        for id_ in ids:
+            pipe.set(f"{prefix}:{id_}", "1", nx=True, ex=ttl)
+        return [id_ for id_, won in zip(ids, pipe.execute()) if won]
+
+    def release_batch(self, ids: List, prefix: str = "processed_transaction") -> None:
+        """Release claims taken with `claim_batch` in a single DEL."""
+        if ids:
+            self.redis_client.delete(*(f"{prefix}:{id_}" for id_ in ids))
+
     def get_queue_name(self):
         return self.queue_name
     
@@ -66,30 +96,164 @@ class RedisQueue:
         serialized_item = json.dumps(item)
         self.redis_client.rpush(self.queue_name, serialized_item)
 
+    def pop_batch(self, batch_size: int = 10) -> List[dict]:
+        """
+        Remove and return up to 'batch_size' items from the queue without waiting.
+        Items that are not valid JSON are moved to the error queue.
+        """
+        start = time.perf_counter()
+        pipe = self.redis_client.pipeline()
+        pipe.lrange(self.queue_name, 0, batch_size - 1)
+        pipe.ltrim(self.queue_name, batch_size, -1)
+        results, _ = pipe.execute()
+
+        items = self._parse_items(results)
+        QUEUE_DEQUEUE_SECONDS.labels("pop").observe(time.perf_counter() - start)
+        QUEUE_DEQUEUED_ITEMS.labels("pop").inc(len(results))
+        return items
+
+    def _parse_items(self, results: List[str], processing_list: Optional[str] = None) -> List[dict]:
+        """Parse dequeued items, moving those that are not valid JSON to the error queue (and out of 'processing_list')."""
+        if results:
+            logger.info("Found and dequeued %d item(s) from the queue.", len(results))
+
+        items = []
+        for item in results:
+            try:
+                items.append(json.loads(item))
+                logger.info("Found and dequeued %s", items[-1], extra={"event": "transaction_dequeued"})
+            except json.JSONDecodeError as e:
+                logger.error(f"JSON parsing error for item: {item[:100]}... Error: {str(e)}")
+                pipe = self.redis_client.pipeline()
+                pipe.rpush("error_queue", item)
+                if processing_list is not None:
+                    # Dead-lettered, so it must not be delivered again
+                    pipe.lrem(processing_list, 1, item)
+                pipe.execute()
+        return items
+
+    def consumer_name(self) -> str:
+        """Return a name identifying the calling worker across hosts, processes and threads."""
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    def _processing_list(self, consumer: str) -> str:
+        return f"{self.queue_name}:processing:{consumer}"
+
+    def _claims_key(self) -> str:
+        return f"{self.queue_name}:processing"
+
+    def dequeue_reliable(self, consumer: str, batch_size: int = 10, timeout: float = 5) -> List[dict]:
+        """
+        Atomically move up to 'batch_size' items into the consumer's processing list and return them.
+
+        Blocks for up to 'timeout' seconds (BLMOVE) until the first item arrives, so idle
+        workers make no requests in between. Items stay in the processing list until
+        `acknowledge` is called, so a worker that dies mid-batch does not lose them:
+        `requeue_stale` returns them to the queue.
+        """
+        processing_list = self._processing_list(consumer)
+        # Register the claim before blocking so an item moved just before a crash is still found
+        self.redis_client.hset(self._claims_key(), consumer, time.time())
+        first = self.redis_client.blmove(self.queue_name, processing_list, timeout, "LEFT", "RIGHT")
+        if first is None:
+            return []
+
+        start = time.perf_counter()
+        pipe = self.redis_client.pipeline()
+        for _ in range(batch_size - 1):
+            pipe.lmove(self.queue_name, processing_list, "LEFT", "RIGHT")
+        pipe.hset(self._claims_key(), consumer, time.time())
+        *rest, _ = pipe.execute()
+
+        results = [first] + [item for item in rest if item is not None]
+        items = self._parse_items(results, processing_list)
+        QUEUE_DEQUEUE_SECONDS.labels("reliable").observe(time.perf_counter() - start)
+        QUEUE_DEQUEUED_ITEMS.labels("reliable").inc(len(results))
+        return items
+
+    @contextmanager
+    def keep_claim(self, consumer: str, interval: float) -> Iterator[None]:
+        """
+        Refresh the consumer's claim every 'interval' seconds while the block runs, so a batch
+        that takes longer than 'stale_after' to process is not requeued by a peer.
+        """
+        stop = threading.Event()
+
+        def refresh() -> None:
+            while not stop.wait(interval):
+                try:
+                    self.redis_client.hset(self._claims_key(), consumer, time.time())
+                except redis.RedisError as e:
+                    logger.error(f"Error refreshing the claim of {consumer}: {str(e)}")
+
+        keeper = threading.Thread(target=refresh, name=f"claim-{threading.current_thread().name}", daemon=True)
+        keeper.start()
+        try:
+            yield
+        finally:
+            # Stopped before the batch is acknowledged or abandoned, which remove the claim
+            stop.set()
+            keeper.join()
+
+    def acknowledge(self, consumer: str) -> None:
+        """Drop the consumer's processing list once its batch has been written back."""
+        pipe = self.redis_client.pipeline()
+        pipe.delete(self._processing_list(consumer))
+        pipe.hdel(self._claims_key(), consumer)
+        pipe.execute()
+
+    def abandon(self, consumer: str) -> None:
+        """
+        Set aside the consumer's processing list after its batch failed, for `requeue_stale`
+        to return to the queue once it is 'stale_after' seconds old.
+
+        The list moves to a name of its own, so the consumer can take new batches meanwhile
+        without refreshing the failed batch's claim or acknowledging it with the next one.
+        """
+        processing_list = self._processing_list(consumer)
+        if not self.redis_client.exists(processing_list):
+            return
+        abandoned = f"{consumer}:failed:{uuid.uuid4().hex}"
+        pipe = self.redis_client.pipeline()
+        pipe.rename(processing_list, self._processing_list(abandoned))
+        pipe.hset(self._claims_key(), abandoned, time.time())
+        pipe.hdel(self._claims_key(), consumer)
+        pipe.execute()
+
+    def requeue_stale(self, stale_after: float = 300) -> int:
+        """
+        Return items claimed more than 'stale_after' seconds ago to the head of the queue.
+
+        Returns the number of items requeued.
+        """
+        requeued = 0
+        now = time.time()
+        for consumer, claimed_at in self.redis_client.hgetall(self._claims_key()).items():
+            if now - float(claimed_at) < stale_after:
+                continue
+            processing_list = self._processing_list(consumer)
+            while self.redis_client.lmove(processing_list, self.queue_name, "RIGHT", "LEFT") is not None:
+                requeued += 1
+            self.redis_client.hdel(self._claims_key(), consumer)
+
+        if requeued:
+            logger.warning(f"Requeued {requeued} stale item(s) to {self.queue_name}.")
+        return requeued
+
     def dequeue_batch(self, batch_size: int = 10, timeout: int = 5) -> Generator[dict, None, None]:
         """
         Remove and return items from the queue in batches.
         If the queue is empty, it will wait for 'timeout' seconds before checking again.
         """
         while True:
-            pipe = self.redis_client.pipeline()
-            pipe.lrange(self.queue_name, 0, batch_size - 1)
-            pipe.ltrim(self.queue_name, batch_size, -1)
-            results, _ = pipe.execute()
+            items = self.pop_batch(batch_size)
 
-            if not results:
+            if not items:
                 # Wait for a short time before checking again
                 time.sleep(timeout)
                 continue
 
-            logger.info(f"Found and dequeued {len(results)} item(s) from the queue.")
-            for item in results:
-                try:
-                    logger.info(f"Found and dequeued {json.loads(item)}")
-                    yield json.loads(item)
-                except json.JSONDecodeError as e:
-                    logger.error(f"JSON parsing error for item: {item[:100]}... Error: {str(e)}")
-                    self.redis_client.rpush("error_queue", item)
+            yield from items
 
     def is_empty(self):
         """Check if the queue is empty."""
@@ -0,0 +1,105 @@
+import os
+import sys
+
+# The database engine is created at import time and needs a port, though tests never connect
+os.environ.setdefault("DB_PORT", "3306")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture
+def redis_queue():
+    """A RedisQueue backed by fakeredis."""
+    fakeredis = pytest.importorskip("fakeredis")
+    from src.utils.utils import RedisQueue
+
+    return RedisQueue(queue_name="test_queue", redis_client=fakeredis.FakeRedis(decode_responses=True))
+
+
+@pytest.fixture
+def db_session():
+    """A Session on an in-memory sqlite database with the categories and transactions tables."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+
+    from src.database.db_connector import Base
+    from src.models.models import Category, Transaction
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[Category.__table__, Transaction.__table__])
+    session = sessionmaker(bind=engine, autoflush=False)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def add_transactions(session, category_ids):
+    """Store one transaction per entry of 'category_ids' (id -> category id or None)."""
+    from datetime import datetime
+
+    from src.models.models import Transaction
+
+    for id_, category_id in category_ids.items():
+        session.add(Transaction(
+            id=id_, transaction_id=str(id_), type='debit', amount=100, narration=f"narration {id_}",
+            balance=0, currency='KES', date=datetime(2024, 1, 1), category_id=category_id
+        ))
+    session.commit()
+
+
+class StubCategorizer:
+    """Categorizes every transaction as 'Groceries'."""
+
+    def batch_categorize(self, transactions):
+        return [(transaction, "Groceries") for transaction in transactions]
+
+
+class StubCategoryRegistry:
+    def get_id(self, name):
+        return 7
+
+
+class StubTransactionService:
+    """
+    Records the category updates written back instead of touching a database.
+
+    'pages' are the uncategorized transactions the sweep pages through, newest first. A
+    write-back that includes any of 'failing_ids' fails as a rolled back one does.
+    """
+
+    def __init__(self, pages=(), failing_ids=()):
+        self.pages = list(pages)
+        self.failing_ids = set(failing_ids)
+        self.updates = []
+
+    def get_category_ids(self, ids):
+        return {id_: None for id_ in ids}
+
+    def iter_uncategorized_transactions(self, batch_size, after=None):
+        for page in self.pages:
+            if after is None or (page[-1].date, page[-1].id) < after:
+                yield page
+
+    def bulk_update_categories(self, updates):
+        if any(id_ in self.failing_ids for id_, _ in updates):
+            return None
+        self.updates.extend(updates)
+        return len(updates)
+
+
+@pytest.fixture
+def categorizer():
+    return StubCategorizer()
+
+
+@pytest.fixture
+def category_registry():
+    return StubCategoryRegistry()
+
+
+@pytest.fixture
+def make_transaction_service():
+    """Build StubTransactionService instances; a test may need several."""
+    return StubTransactionService
@@ -0,0 +1,152 @@
+import asyncio
+import json
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from async_app import AsyncProcessingPipeline
+from src.utils.async_queue import AsyncRedisQueue
+
+
+def make_queue():
+    redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    blmove = redis_client.blmove
+
+    async def blocking_blmove(source, destination, timeout, *args):
+        # fakeredis answers an empty list at once; wait like Redis would
+        item = await blmove(source, destination, timeout, *args)
+        await asyncio.sleep(timeout if item is None else 0)
+        return item
+
+    redis_client.blmove = blocking_blmove
+    return AsyncRedisQueue(queue_name="test_queue", redis_client=redis_client)
+
+
+async def enqueue(queue, count):
+    for index in range(count):
+        await queue.redis_client.rpush(queue.queue_name, json.dumps({"id": index, "narration": f"narration {index}", "amount": 100}))
+
+
+async def run_until_drained(pipeline, queue):
+    stop_event = asyncio.Event()
+
+    async def stop_when_drained():
+        while await queue.size() or pipeline.processed < pipeline_items:
+            await asyncio.sleep(0.01)
+        stop_event.set()
+
+    pipeline_items = await queue.size()
+    await asyncio.wait_for(asyncio.gather(pipeline.run(stop_event), stop_when_drained()), timeout=10)
+
+
+@pytest.fixture
+def make_pipeline(categorizer, category_registry):
+    def make(queue, transaction_service, **kwargs):
+        options = dict(batch_size=4, fetchers=2, categorizers=1, writers=2, queue_size=2, block_timeout=0.01)
+        options.update(kwargs)
+        return AsyncProcessingPipeline(queue, categorizer, transaction_service, category_registry, **options)
+    return make
+
+
+async def processing_items(queue):
+    items = 0
+    for key in await queue.redis_client.keys(f"{queue.queue_name}:processing:*"):
+        items += await queue.redis_client.llen(key)
+    return items
+
+
+def test_pipeline_writes_back_and_acknowledges_every_transaction(make_pipeline, make_transaction_service):
+    async def scenario():
+        queue = make_queue()
+        await enqueue(queue, 25)
+        transaction_service = make_transaction_service()
+        pipeline = make_pipeline(queue, transaction_service)
+
+        await run_until_drained(pipeline, queue)
+
+        assert sorted(id_ for id_, _ in transaction_service.updates) == list(range(25))
+        assert pipeline.updated == 25 and pipeline.failed == 0
+        assert await processing_items(queue) == 0
+
+    asyncio.run(scenario())
+
+
+def test_pipeline_sets_aside_batches_whose_write_back_failed(make_pipeline, make_transaction_service):
+    async def scenario():
+        queue = make_queue()
+        await enqueue(queue, 10)
+        pipeline = make_pipeline(queue, make_transaction_service(failing_ids=range(10)), stale_after=300)
+
+        await run_until_drained(pipeline, queue)
+
+        assert pipeline.failed == 10
+        assert await processing_items(queue) == 10
+        assert await queue.requeue_stale(stale_after=300) == 0
+        assert await queue.requeue_stale(stale_after=0) == 10
+        assert await queue.size() == 10
+
+    asyncio.run(scenario())
+
+
+def test_fetchers_survive_redis_errors_while_requeueing(make_pipeline, make_transaction_service):
+    async def scenario():
+        queue = make_queue()
+        requeue_stale = queue.requeue_stale
+        failures = []
+
+        async def flaky_requeue_stale(stale_after):
+            if not failures:
+                failures.append(stale_after)
+                raise ConnectionError("Redis went away")
+            return await requeue_stale(stale_after)
+
+        queue.requeue_stale = flaky_requeue_stale
+        transaction_service = make_transaction_service()
+        pipeline = make_pipeline(queue, transaction_service)
+        stop_event = asyncio.Event()
+        running = asyncio.create_task(pipeline.run(stop_event))
+
+        while not failures:
+            await asyncio.sleep(0.01)
+        await enqueue(queue, 12)
+        while pipeline.processed < 12:
+            await asyncio.sleep(0.01)
+        stop_event.set()
+        await asyncio.wait_for(running, timeout=10)
+
+        assert len(transaction_service.updates) == 12
+
+    asyncio.run(asyncio.wait_for(scenario(), timeout=10))
+
+
+def test_claims_stay_fresh_while_batches_wait_in_the_pipeline(make_pipeline, make_transaction_service, categorizer):
+    async def scenario():
+        queue = make_queue()
+        # More batches than the stages buffer, so the fetchers block handing theirs over
+        await enqueue(queue, 60)
+        release = asyncio.Event()
+
+        class SlowCategorizer:
+            def batch_categorize(self, transactions):
+                asyncio.run_coroutine_threadsafe(release.wait(), loop).result()
+                return categorizer.batch_categorize(transactions)
+
+        loop = asyncio.get_running_loop()
+        pipeline = make_pipeline(queue, make_transaction_service(), stale_after=0.3, queue_size=1)
+        pipeline.categorization_service = SlowCategorizer()
+        stop_event = asyncio.Event()
+        running = asyncio.create_task(pipeline.run(stop_event))
+
+        # Well past 'stale_after' with every batch stuck behind the categorizer
+        await asyncio.sleep(1)
+        assert await queue.requeue_stale(stale_after=0.3) == 0
+
+        release.set()
+        while pipeline.processed < 60:
+            await asyncio.sleep(0.01)
+        stop_event.set()
+        await asyncio.wait_for(running, timeout=10)
+        assert pipeline.updated == 60
+
+    asyncio.run(scenario())
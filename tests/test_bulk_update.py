@@ -0,0 +1,39 @@
+from src.database.db_utils import TransactionService
+from src.models.models import Transaction
+
+from conftest import add_transactions
+
+
+def stored_categories(session):
+    session.expire_all()
+    return dict(session.query(Transaction.id, Transaction.category_id).order_by(Transaction.id).all())
+
+
+def test_only_uncategorized_rows_are_written(db_session):
+    add_transactions(db_session, {1: None, 2: 32, 3: 5, 4: None, 5: 9})
+
+    updated = TransactionService(db_session).bulk_update_categories(
+        [(1, 7), (2, 8), (3, 7), (4, 11), (5, 7), (6, 7)], chunk_size=2
+    )
+
+    # 3 and 5 keep their categories and 6 does not exist
+    assert updated == 3
+    assert stored_categories(db_session) == {1: 7, 2: 8, 3: 5, 4: 11, 5: 9}
+
+
+def test_a_failed_chunk_rolls_back_the_whole_write(db_session, monkeypatch):
+    add_transactions(db_session, {1: None, 2: None, 3: None})
+    execute = db_session.execute
+    calls = []
+
+    def failing_execute(statement, *args, **kwargs):
+        calls.append(statement)
+        if len(calls) == 2:
+            raise RuntimeError("connection lost")
+        return execute(statement, *args, **kwargs)
+
+    monkeypatch.setattr(db_session, "execute", failing_execute)
+
+    assert TransactionService(db_session).bulk_update_categories([(1, 7), (2, 7), (3, 7)], chunk_size=2) is None
+    monkeypatch.undo()
+    assert stored_categories(db_session) == {1: None, 2: None, 3: None}
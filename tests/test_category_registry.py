@@ -0,0 +1,68 @@
+import pytest
+
+from src.database import db_utils
+from src.database.db_utils import CategoryRegistry
+from src.models.models import Category
+
+
+def add_categories(session, names):
+    for id_, name in names.items():
+        session.add(Category(id=id_, name=name, status=True))
+    session.commit()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(db_utils.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def registry(db_session, monkeypatch):
+    def get_db():
+        yield db_session
+
+    monkeypatch.setattr(db_utils, "get_db", get_db)
+    return CategoryRegistry(ttl_seconds=60)
+
+
+def test_lookups_by_id_and_name(db_session, registry):
+    add_categories(db_session, {5: "Groceries", 7: "Transport", 8: "Public Transport", 9: "Dining"})
+
+    assert registry.get_name(5) == "Groceries"
+    assert registry.get_name("9") == "Dining"
+    assert registry.get_name(99) is None
+    # Exact names match regardless of case and win over partial ones
+    assert registry.get_id("groceries") == 5
+    assert registry.get_id("TRANSPORT") == 7
+    # Otherwise only a name contained in a single category matches
+    assert registry.get_id("din") == 9
+    assert registry.get_id("port") is None
+    assert registry.get_id("Utilities") is None
+    assert registry.stats() == {"categories": 4, "hits": 5, "misses": 3, "refreshes": 1}
+
+
+def test_categories_are_reloaded_once_the_ttl_expires(db_session, registry, clock):
+    add_categories(db_session, {5: "Groceries"})
+    assert registry.get_id("Groceries") == 5
+
+    add_categories(db_session, {6: "Rent"})
+    clock[0] += 60
+    assert registry.get_id("Rent") is None
+    assert registry.refreshes == 1
+
+    clock[0] += 1
+    assert registry.get_id("Rent") == 6
+    assert registry.get_name(6) == "Rent"
+    assert registry.refreshes == 2
+
+
+def test_refresh_forgets_resolved_partial_names(db_session, registry):
+    add_categories(db_session, {5: "Groceries"})
+    assert registry.get_id("gas") is None
+
+    add_categories(db_session, {6: "Gas Station"})
+    registry.refresh()
+
+    assert registry.get_id("gas") == 6
@@ -0,0 +1,28 @@
+import time
+
+
+def test_each_id_is_won_by_one_claim(redis_queue):
+    first = redis_queue.claim_batch([1, 2, 3], ttl=300)
+    second = redis_queue.claim_batch([2, 3, 4, 5], ttl=300)
+
+    assert first == [1, 2, 3]
+    assert second == [4, 5]
+    assert redis_queue.claim_batch([], ttl=300) == []
+
+
+def test_claims_expire_after_their_ttl(redis_queue):
+    redis_queue.claim_batch([1], ttl=1)
+
+    assert redis_queue.redis_client.ttl("processed_transaction:1") == 1
+    assert redis_queue.claim_batch([1], ttl=1) == []
+    time.sleep(1.1)
+    assert redis_queue.claim_batch([1], ttl=1) == [1]
+
+
+def test_released_ids_can_be_claimed_again(redis_queue):
+    redis_queue.claim_batch([1, 2, 3], prefix="claims")
+
+    redis_queue.release_batch([1, 3], prefix="claims")
+
+    assert redis_queue.claim_batch([1, 2, 3], prefix="claims") == [1, 3]
+    assert redis_queue.claim_batch([1, 2, 3]) == [1, 2, 3]
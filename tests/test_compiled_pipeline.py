@@ -0,0 +1,74 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.transaction_categorization.model_artifact import compile_pipeline, load_artifact, save_artifact
+from src.utils.config_utils import config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    return joblib.load(os.path.join(ROOT, config["model"]["path"]))
+
+
+@pytest.fixture(scope="module")
+def transactions():
+    data = joblib.load(os.path.join(ROOT, config["model"]["training_data_path"])).dropna(subset=['narration', 'amount'])
+    edge_cases = pd.DataFrame({
+        'narration': ["", "   ", "zzqx unknown tokens only", "MPESA to NAIVAS!!! ref#123", "ümlaut café payment"],
+        'amount': [0.0, -250.0, 1e9, 1500.5, 42.0],
+    })
+    return pd.concat([data[['narration', 'amount']], edge_cases], ignore_index=True).astype({'amount': float})
+
+
+def test_compiled_features_match_the_preprocessor(pipeline, transactions):
+    compiled = compile_pipeline(pipeline)
+
+    features = compiled.transform(transactions['narration'].tolist(), transactions['amount'].tolist())
+    expected = pipeline.named_steps['preprocessor'].transform(transactions)
+
+    # The forest sees float32 features
+    assert np.array_equal(features.toarray(), np.asarray(expected.todense(), dtype=np.float32))
+
+
+def test_compiled_predictions_match_the_pipeline(pipeline, transactions):
+    compiled = compile_pipeline(pipeline)
+    narrations, amounts = transactions['narration'].tolist(), transactions['amount'].tolist()
+
+    assert np.array_equal(compiled.predict_proba_arrays(narrations, amounts), pipeline.predict_proba(transactions))
+    assert np.array_equal(compiled.predict_arrays(narrations, amounts), pipeline.predict(transactions))
+    single = [compiled.predict_arrays([narration], [amount])[0] for narration, amount in zip(narrations[:50], amounts[:50])]
+    assert np.array_equal(single, pipeline.predict(transactions.iloc[:50]))
+
+
+def test_early_exit_reaches_the_full_forest_decisions(pipeline, transactions):
+    compiled = compile_pipeline(pipeline)
+    threshold = 0.6
+    expected_proba = pipeline.predict_proba(transactions)
+    expected_confident = expected_proba.max(axis=1) >= threshold
+
+    labels, confidence, trees_evaluated = compiled.predict_confident_arrays(
+        transactions['narration'].tolist(), transactions['amount'].tolist(), threshold, check_every=10
+    )
+
+    confident = confidence >= threshold
+    assert np.array_equal(confident, expected_confident)
+    assert np.array_equal(labels[confident], pipeline.classes_.take(expected_proba.argmax(axis=1))[confident])
+    assert trees_evaluated.max() <= len(compiled.tree_roots)
+
+
+def test_artifact_round_trip_predicts_the_same(pipeline, transactions, tmp_path):
+    path = str(tmp_path / "model.tcm")
+    save_artifact(pipeline, path)
+
+    loaded = load_artifact(path)
+
+    assert np.array_equal(
+        loaded.predict_arrays(transactions['narration'].tolist(), transactions['amount'].tolist()),
+        pipeline.predict(transactions)
+    )
@@ -0,0 +1,17 @@
+import logging
+
+import pytest
+
+from src.transaction_categorization import model_trainer
+from src.transaction_categorization.model_registry import ModelVersionError
+
+
+def test_a_missing_version_file_is_an_error_not_a_reason_to_train(monkeypatch, tmp_path):
+    manifest = {"version": "20240301000000000000", "format": "joblib", "path": str(tmp_path / "model.joblib")}
+    monkeypatch.setattr(model_trainer, "read_published_version", lambda: manifest)
+    trained = []
+    monkeypatch.setattr(model_trainer, "train_model", lambda *args: trained.append(args))
+
+    with pytest.raises(ModelVersionError):
+        model_trainer.load_or_train_model("unused.joblib", logging.getLogger(__name__), None)
+    assert trained == []
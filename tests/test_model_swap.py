@@ -0,0 +1,56 @@
+import logging
+
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from src.transaction_categorization import categorize, model_trainer
+
+logger = logging.getLogger(__name__)
+
+TRAINING_DATA = pd.DataFrame({
+    'transaction_id': range(1, 41),
+    'narration': ["naivas supermarket", "kplc prepaid token", "uber trip", "salary payment"] * 10,
+    'amount': [1500.0, 500.0, 800.0, 90000.0] * 10,
+    'category_id': [7, 12, 3, 1] * 10,
+    'date': pd.Timestamp('2024-03-01'),
+})
+
+
+def fitted_pipeline(trees):
+    pipeline = model_trainer.build_pipeline()
+    pipeline.set_params(clf=RandomForestClassifier(n_estimators=trees, random_state=0))
+    return pipeline.fit(TRAINING_DATA[['narration', 'amount']], TRAINING_DATA['category_id'])
+
+
+def test_refit_leaves_the_served_model_untouched(monkeypatch):
+    monkeypatch.setitem(model_trainer.model_config, "update_mode", "refit")
+    monkeypatch.setattr(model_trainer, "load_training_history", lambda logger: TRAINING_DATA.iloc[:0])
+    monkeypatch.setattr(model_trainer, "save_model_files", lambda *args: None)
+    monkeypatch.setattr(model_trainer, "save_training_history", lambda data: None)
+    served = fitted_pipeline(trees=5)
+    served_trees = served.named_steps['clf'].estimators_
+
+    refitted = model_trainer.update_model(served, TRAINING_DATA, "unused.joblib", logger)
+
+    assert refitted is not served
+    assert served.named_steps['clf'].estimators_ is served_trees
+
+
+def test_updated_model_is_compiled_before_it_is_served(monkeypatch):
+    monkeypatch.setitem(categorize.config["model"], "lazy_load", True)
+    monkeypatch.setitem(categorize.config["categorization"].setdefault("prediction_cache", {}), "enabled", False)
+    service = categorize.EnhancedTransactionCategorizationService(model_path="unused.joblib")
+    served = fitted_pipeline(trees=100)
+    service.ml_model = served
+
+    def refit_in_place(model, new_data, model_path, logger):
+        # Even a trainer that mutates the served pipeline must not leave its old predictor serving
+        model.set_params(clf__n_estimators=5)
+        return model.fit(new_data[['narration', 'amount']], new_data['category_id'])
+
+    monkeypatch.setattr(categorize, "update_model", refit_in_place)
+    monkeypatch.setattr(categorize, "read_published_version", lambda: {"version": "2"})
+    service.update_model(TRAINING_DATA)
+
+    assert len(service.predictor.tree_roots) == 5
+    assert service.model_version == "2"
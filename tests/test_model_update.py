@@ -0,0 +1,59 @@
+import logging
+
+import pandas as pd
+
+from src.transaction_categorization import model_trainer
+
+logger = logging.getLogger(__name__)
+
+
+def test_update_without_new_data_keeps_the_model(monkeypatch):
+    published = []
+    monkeypatch.setattr(model_trainer, "save_model_files", lambda *args: published.append(args))
+    model = object()
+
+    empty = pd.DataFrame(columns=['transaction_id', 'narration', 'amount', 'category_id', 'date'])
+    assert model_trainer.update_model(model, empty, "unused.joblib", logger) is model
+    assert published == []
+
+
+def test_incremental_trees_are_seeded_per_day():
+    def seed(day):
+        return model_trainer._update_random_state(pd.DataFrame({'date': [pd.Timestamp(day)]}))
+
+    assert seed('2024-03-01') == seed('2024-03-01')
+    assert seed('2024-03-01') != seed('2024-03-02')
+
+
+def test_fit_restores_the_configured_parallelism(monkeypatch):
+    class Estimator:
+        n_jobs = None
+
+        def fit(self, X, y):
+            self.fitted_with = self.n_jobs
+            return self
+
+    monkeypatch.setitem(model_trainer.model_config, "n_jobs", 4)
+    estimator = Estimator()
+
+    model_trainer.fit_with_stats(estimator, pd.DataFrame({'amount': [1.0, 2.0]}), [0, 1], logger)
+
+    assert estimator.fitted_with == 4
+    # Saved for serving, where parallel prediction does not pay off
+    assert estimator.n_jobs is None
+    assert model_trainer.last_fit_stats()['rows'] == 2
+
+
+def test_extending_the_forest_never_retires_the_refit_trees():
+    from sklearn.ensemble import RandomForestClassifier
+    import numpy as np
+
+    X, y = np.arange(40, dtype=float).reshape(20, 2), [0, 1] * 10
+    forest = RandomForestClassifier(n_estimators=6, random_state=0).fit(X, y)
+    base_trees = list(forest.estimators_)
+
+    for day in range(5):
+        model_trainer.extend_forest(forest, RandomForestClassifier(n_estimators=2, random_state=day).fit(X, y), max_trees=10)
+
+    assert forest.estimators_[:6] == base_trees
+    assert forest.n_estimators == 10
@@ -0,0 +1,61 @@
+import pytest
+
+from src.transaction_categorization import prediction_cache
+from src.transaction_categorization.prediction_cache import PredictionCache
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    cache = PredictionCache(max_size=2)
+    cache.set(("kplc", 500.0), "Utilities")
+    cache.set(("naivas", 1500.0), "Groceries")
+    assert cache.get(("kplc", 500.0)) == "Utilities"
+
+    cache.set(("uber", 800.0), "Transport")
+
+    assert cache.get(("naivas", 1500.0)) is None
+    assert cache.get(("kplc", 500.0)) == "Utilities"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(prediction_cache.time, "monotonic", lambda: now[0])
+    cache = PredictionCache(ttl_seconds=60)
+    cache.set(("kplc", 500.0), "Utilities")
+
+    now[0] += 59
+    assert cache.get(("kplc", 500.0)) == "Utilities"
+    now[0] += 2
+    assert cache.get(("kplc", 500.0)) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_keys_carry_the_exact_amount_unless_bucketed():
+    assert PredictionCache().make_key("KPLC  Prepaid", 500) != PredictionCache().make_key("KPLC  Prepaid", 501)
+    bucketed = PredictionCache(amount_bucket_size=500)
+    assert bucketed.make_key("KPLC  Prepaid", 500) == bucketed.make_key("kplc prepaid", 501)
+
+
+def test_a_new_model_version_orphans_the_entries_of_the_old_one():
+    cache = PredictionCache(namespace="v1")
+    cache.set(("kplc", 500.0), "Utilities")
+
+    cache.clear(namespace="v2")
+    # A batch still finishing on v1 neither stores nor reads entries for v2
+    cache.set(("naivas", 1500.0), "Groceries", namespace="v1")
+
+    assert cache.get(("kplc", 500.0)) is None
+    assert cache.get(("naivas", 1500.0)) is None
+    cache.set(("naivas", 1500.0), "Groceries")
+    assert cache.get(("naivas", 1500.0)) == "Groceries"
+    assert cache.get(("naivas", 1500.0), namespace="v1") is None
+
+
+def test_shared_entries_are_namespaced_by_model_version():
+    fakeredis = pytest.importorskip("fakeredis")
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    writer = PredictionCache(redis_client=redis_client, namespace="v1")
+    writer.set(("kplc", 500.0), "Utilities")
+
+    assert PredictionCache(redis_client=redis_client, namespace="v1").get(("kplc", 500.0)) == "Utilities"
+    assert PredictionCache(redis_client=redis_client, namespace="v2").get(("kplc", 500.0)) is None
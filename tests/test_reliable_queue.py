@@ -0,0 +1,114 @@
+import threading
+import time
+
+import app
+from src.utils.config_utils import config
+
+
+def enqueue(queue, count):
+    for index in range(count):
+        queue.enqueue({"id": index, "narration": f"narration {index}", "amount": 100})
+
+
+def test_dequeue_reliable_keeps_items_until_acknowledged(redis_queue):
+    enqueue(redis_queue, 5)
+    consumer = redis_queue.consumer_name()
+
+    items = redis_queue.dequeue_reliable(consumer, batch_size=3, timeout=1)
+
+    assert [item["id"] for item in items] == [0, 1, 2]
+    assert redis_queue.size() == 2
+    assert redis_queue.redis_client.llen(redis_queue._processing_list(consumer)) == 3
+
+    redis_queue.acknowledge(consumer)
+    assert not redis_queue.redis_client.exists(redis_queue._processing_list(consumer))
+    assert redis_queue.redis_client.hget(redis_queue._claims_key(), consumer) is None
+
+
+def test_requeue_stale_returns_items_of_a_dead_consumer(redis_queue):
+    enqueue(redis_queue, 3)
+    redis_queue.dequeue_reliable("dead-worker", batch_size=3, timeout=1)
+    assert redis_queue.size() == 0
+
+    assert redis_queue.requeue_stale(stale_after=300) == 0
+    assert redis_queue.requeue_stale(stale_after=0) == 3
+    assert redis_queue.size() == 3
+    assert redis_queue.redis_client.hgetall(redis_queue._claims_key()) == {}
+
+
+def run_one_batch(monkeypatch, redis_queue, succeeded):
+    monkeypatch.setitem(config["queue"], "mode", "reliable")
+    stop_event = threading.Event()
+    batches = []
+
+    def process_transactions(transactions, queue, categorization_service):
+        batches.append(transactions)
+        stop_event.set()
+        return succeeded
+
+    monkeypatch.setattr(app, "process_transactions", process_transactions)
+    app.process_batch(redis_queue, None, batch_size=10, stop_event=stop_event)
+    return batches
+
+
+def test_process_batch_acknowledges_a_written_batch(monkeypatch, redis_queue):
+    enqueue(redis_queue, 4)
+
+    batches = run_one_batch(monkeypatch, redis_queue, succeeded=True)
+
+    assert len(batches[0]) == 4
+    assert redis_queue.size() == 0
+    assert redis_queue.requeue_stale(stale_after=0) == 0
+
+
+def test_process_batch_redelivers_a_failed_batch(monkeypatch, redis_queue):
+    enqueue(redis_queue, 4)
+
+    run_one_batch(monkeypatch, redis_queue, succeeded=False)
+
+    # Set aside, not lost, and not redelivered before it is stale
+    assert redis_queue.size() == 0
+    assert redis_queue.requeue_stale(stale_after=300) == 0
+    assert redis_queue.requeue_stale(stale_after=0) == 4
+    assert sorted(item["id"] for item in redis_queue.pop_batch(10)) == [0, 1, 2, 3]
+
+
+def test_a_failed_batch_is_not_acknowledged_with_the_next_one(monkeypatch, redis_queue):
+    enqueue(redis_queue, 2)
+    run_one_batch(monkeypatch, redis_queue, succeeded=False)
+
+    enqueue(redis_queue, 1)
+    run_one_batch(monkeypatch, redis_queue, succeeded=True)
+
+    assert redis_queue.requeue_stale(stale_after=0) == 2
+
+
+def test_unparsable_items_are_dead_lettered_not_redelivered(redis_queue):
+    redis_queue.redis_client.rpush(redis_queue.queue_name, "not json", "{broken")
+    consumer = redis_queue.consumer_name()
+
+    assert redis_queue.dequeue_reliable(consumer, batch_size=5, timeout=1) == []
+
+    assert redis_queue.redis_client.lrange("error_queue", 0, -1) == ["not json", "{broken"]
+    assert redis_queue.requeue_stale(stale_after=0) == 0
+
+
+def test_claim_is_kept_fresh_while_a_batch_runs(monkeypatch, redis_queue):
+    enqueue(redis_queue, 3)
+    monkeypatch.setitem(config["queue"], "stale_after", 0.15)
+    stop_event = threading.Event()
+    requeued = []
+
+    def slow_process_transactions(transactions, queue, categorization_service):
+        time.sleep(0.5)
+        # A peer looking for stale batches well past 'stale_after'
+        requeued.append(queue.requeue_stale(stale_after=0.15))
+        stop_event.set()
+        return True
+
+    monkeypatch.setitem(config["queue"], "mode", "reliable")
+    monkeypatch.setattr(app, "process_transactions", slow_process_transactions)
+    app.process_batch(redis_queue, None, batch_size=10, stop_event=stop_event)
+
+    assert requeued == [0]
+    assert redis_queue.size() == 0
@@ -0,0 +1,83 @@
+from src.transaction_categorization.categorization_rules import (
+    KeywordMatcher,
+    MerchantMatcher,
+    match_by_keyword,
+    match_by_merchant,
+)
+from src.transaction_categorization.data_loader import load_keyword_categories, load_merchant_categories
+
+NARRATIONS = [
+    "",
+    "POS purchase at NAIVAS supermarket",
+    "Uber trip to JKIA",
+    "payment to AT&T wireless",
+    "ATT payment",
+    "Transfer to JOHN DOE",
+    "netflix.com monthly subscription",
+    "Restaurant and fuel at TOTAL station",
+    "zzqx unknown",
+    "Ümlaut café payment",
+]
+
+
+def test_keyword_matcher_matches_the_linear_scan_on_the_shipped_rules():
+    keyword_categories = load_keyword_categories()
+    matcher = KeywordMatcher(keyword_categories)
+    keywords = [keyword for keywords in keyword_categories.values() for keyword in keywords]
+
+    for narration in NARRATIONS + [f"paid {keyword} today" for keyword in keywords]:
+        assert matcher.match(narration) == match_by_keyword(narration, keyword_categories), narration
+
+
+def test_merchant_matcher_matches_the_linear_scan_on_the_shipped_rules():
+    merchant_categories = load_merchant_categories()
+    matcher = MerchantMatcher(merchant_categories)
+
+    for narration in NARRATIONS + [f"POS {merchant.lower()} 0042" for merchant in merchant_categories]:
+        assert matcher.match(narration) == match_by_merchant(narration, merchant_categories), narration
+
+
+def test_keyword_matcher_keeps_yaml_priority_between_overlapping_keywords():
+    keyword_categories = {
+        "transport": ["fuel", "bus"],
+        "grocery": ["food", "supermarket"],
+        # Contains the keyword 'bus' and is contained in 'supermarket'
+        "business": ["business", "market"],
+    }
+    matcher = KeywordMatcher(keyword_categories)
+    narrations = [
+        "business lunch",       # 'bus' of an earlier category inside 'business'
+        "supermarket run",      # 'supermarket' and its suffix 'market'
+        "market day",
+        "food and fuel",        # The later keyword of the earlier category wins
+        "fuelfood",
+        "marketbus",
+    ]
+
+    for narration in narrations:
+        assert matcher.match(narration) == match_by_keyword(narration, keyword_categories), narration
+    assert matcher.match("business lunch") == "transport"
+    assert matcher.match("market day") == "business"
+
+
+def test_merchant_matcher_keeps_yaml_priority_between_overlapping_names():
+    merchant_categories = {
+        "MART": "grocery",
+        "NAIROBI WEST MART": "shopping",
+        "WEST": "travel",
+        "AT&T": "utilities",
+        "AT": "other",
+    }
+    matcher = MerchantMatcher(merchant_categories)
+    narrations = [
+        "NAIROBI WEST MART LTD",    # Three overlapping names; the first listed wins
+        "west side cafe",
+        "at&t bill",
+        "ATM withdrawal",
+        "SMARTPHONE",
+    ]
+
+    for narration in narrations:
+        assert matcher.match(narration) == match_by_merchant(narration, merchant_categories), narration
+    assert matcher.match("NAIROBI WEST MART LTD") == "grocery"
+    assert matcher.match("at&t bill") == "utilities"
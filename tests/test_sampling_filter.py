@@ -0,0 +1,53 @@
+import logging
+
+import pytest
+
+from src.utils import logging_utils
+from src.utils.logging_utils import SamplingFilter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(logging_utils.time, "monotonic", lambda: now[0])
+    return now
+
+
+def record(event=None, level=logging.INFO):
+    log_record = logging.LogRecord("test", level, __file__, 1, "message", None, None)
+    if event is not None:
+        log_record.event = event
+    return log_record
+
+
+def passed(sampling_filter, count, **kwargs):
+    return sum(sampling_filter.filter(record(**kwargs)) for _ in range(count))
+
+
+def test_each_event_is_limited_per_second(clock):
+    sampling_filter = SamplingFilter({"categorized": {"max_per_second": 3}, "cache_hit": {"max_per_second": 1}})
+
+    assert passed(sampling_filter, 10, event="categorized") == 3
+    # Every event has its own budget
+    assert passed(sampling_filter, 10, event="cache_hit") == 1
+
+    clock[0] += 0.99
+    assert passed(sampling_filter, 10, event="categorized") == 0
+    clock[0] += 0.01
+    assert passed(sampling_filter, 10, event="categorized") == 3
+
+
+def test_warnings_and_unsampled_records_always_pass(clock):
+    sampling_filter = SamplingFilter({"categorized": {"max_per_second": 1}})
+
+    assert passed(sampling_filter, 5, event="categorized", level=logging.WARNING) == 5
+    assert passed(sampling_filter, 5, event="dequeued") == 5
+    assert passed(sampling_filter, 5) == 5
+
+
+def test_sampling_applies_before_the_rate_limit(clock):
+    sampling_filter = SamplingFilter({"categorized": {"sample_every": 4, "max_per_second": 2}})
+
+    assert passed(sampling_filter, 20, event="categorized") == 2
+    clock[0] += 1
+    assert passed(sampling_filter, 8, event="categorized") == 2
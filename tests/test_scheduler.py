@@ -0,0 +1,39 @@
+import multiprocessing
+
+import redis
+
+import scheduler
+
+
+class UnreachableRedis:
+    def lock(self, name, **kwargs):
+        return self
+
+    def acquire(self):
+        raise redis.ConnectionError("Connection refused")
+
+
+def run_job_without_redis(monkeypatch, tmp_path):
+    lock_path = str(tmp_path / "training.lock")
+    monkeypatch.setitem(scheduler.config["scheduler"], "training", {"nice": 0, "lock_path": lock_path})
+    monkeypatch.setattr(scheduler, "daily_model_update", lambda config: None)
+    fork = multiprocessing.get_context("fork")
+    monkeypatch.setattr(scheduler.multiprocessing, "get_context", lambda method=None: fork)
+    return lock_path
+
+
+def test_training_falls_back_to_a_lock_file_when_redis_is_down(monkeypatch, tmp_path):
+    run_job_without_redis(monkeypatch, tmp_path)
+
+    assert scheduler.run_training_job(UnreachableRedis()) == "succeeded"
+
+
+def test_training_is_skipped_while_another_scheduler_holds_the_lock_file(monkeypatch, tmp_path):
+    lock_path = run_job_without_redis(monkeypatch, tmp_path)
+    held = scheduler._acquire_local_lock(lock_path)
+    try:
+        assert scheduler.run_training_job(UnreachableRedis()) == "skipped"
+    finally:
+        held.close()
+
+    assert scheduler.run_training_job(UnreachableRedis()) == "succeeded"
@@ -0,0 +1,22 @@
+import app
+from src.database.db_utils import TransactionService
+
+from conftest import add_transactions
+
+
+def test_only_categorized_transactions_are_skipped(db_session):
+    add_transactions(db_session, {1: None, 2: 32, 3: 5})
+    transactions = [{"id": id_, "narration": "x", "amount": 1} for id_ in (1, 2, 3, 4)]
+
+    pending = app.select_unprocessed(transactions, [1, 2, 3, 4], TransactionService(db_session))
+
+    # 4 is not visible to the check, and the write-back's guard keeps it safe to process
+    assert [transaction["id"] for transaction in pending] == [1, 2, 4]
+
+
+def test_category_check_ends_its_read_transaction(db_session):
+    add_transactions(db_session, {1: None})
+
+    TransactionService(db_session).get_category_ids([1])
+
+    assert not db_session.in_transaction()
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import app
+
+
+def make_pages(count, size=3):
+    # Newest first, as the sweep pages them
+    start = datetime(2024, 6, 1)
+    rows = [
+        SimpleNamespace(id=index, narration=f"narration {index}", amount=10.0, date=start - timedelta(hours=index))
+        for index in range(count * size)
+    ]
+    return [rows[offset:offset + size] for offset in range(0, len(rows), size)]
+
+
+@pytest.fixture
+def sweep(categorizer, category_registry):
+    def run(transaction_service, checkpoint_path):
+        app.categorize_uncategorized_transactions(
+            categorizer, batch_size=3, transactionDBService=transaction_service,
+            categoryRegistry=category_registry, checkpoint_path=checkpoint_path
+        )
+    return run
+
+
+def test_completed_sweep_removes_its_checkpoint(tmp_path, sweep, make_transaction_service):
+    checkpoint_path = tmp_path / "checkpoint.json"
+    transaction_service = make_transaction_service(make_pages(3))
+
+    sweep(transaction_service, str(checkpoint_path))
+
+    assert len(transaction_service.updates) == 9
+    assert not checkpoint_path.exists()
+
+
+def test_checkpoint_stops_before_a_failed_page(tmp_path, sweep, make_transaction_service):
+    checkpoint_path = tmp_path / "checkpoint.json"
+    pages = make_pages(4)
+    # The write-back of the second page is rolled back
+    sweep(make_transaction_service(pages, failing_ids=[pages[1][0].id]), str(checkpoint_path))
+
+    assert json.loads(checkpoint_path.read_text())['id'] == pages[0][-1].id
+
+    retry = make_transaction_service(pages)
+    sweep(retry, str(checkpoint_path))
+    assert sorted(id_ for id_, _ in retry.updates) == list(range(3, 12))
+    assert not checkpoint_path.exists()
@@ -0,0 +1,66 @@
+from datetime import datetime
+import os
+
+import pandas as pd
+
+from src.transaction_categorization.training_store import TrainingStore
+
+
+def rows(labels, day):
+    """One row per entry of 'labels' (transaction id -> category id), dated 2024-06-'day'."""
+    return pd.DataFrame({
+        'transaction_id': list(labels),
+        'narration': [f"payment {id_}, ref #{day}" for id_ in labels],
+        'amount': [10.0 * id_ for id_ in labels],
+        'category_id': list(labels.values()),
+        'date': [datetime(2024, 6, day)] * len(labels),
+    })
+
+
+def partitions(store):
+    return sorted(name for name in os.listdir(store.path) if name.startswith("part-"))
+
+
+def test_a_relabelled_transaction_keeps_its_latest_label(tmp_path):
+    store = TrainingStore(str(tmp_path / "store"))
+    store.append(rows({1: 5, 2: 5, 3: 7}, day=1))
+    store.append(rows({2: 9, 4: 7}, day=2))
+
+    data = store.load()
+
+    assert data['transaction_id'].tolist() == [1, 3, 2, 4]
+    assert data['category_id'].tolist() == [5, 7, 9, 7]
+    assert data['narration'].tolist()[2] == "payment 2, ref #2"
+    assert store.count() == 5
+    assert store.load(since=datetime(2024, 6, 2))['transaction_id'].tolist() == [2, 4]
+    assert store.load(limit=2)['transaction_id'].tolist() == [2, 4]
+
+
+def test_compaction_merges_partitions_into_the_deduplicated_rows(tmp_path):
+    store = TrainingStore(str(tmp_path / "store"), max_partitions=2)
+    store.append(rows({1: 5, 2: 5}, day=1))
+    store.append(rows({2: 9, 3: 7}, day=2))
+    expected = store.load()
+
+    store.maintain()
+    assert len(partitions(store)) == 2
+
+    store.append(rows({4: 7}, day=3))
+    expected = pd.concat([expected, store.load().tail(1)], ignore_index=True)
+    store.maintain()
+
+    assert len(partitions(store)) == 1
+    assert store.count() == 4
+    pd.testing.assert_frame_equal(store.load(), expected)
+
+
+def test_compaction_keeps_only_the_newest_rows(tmp_path):
+    store = TrainingStore(str(tmp_path / "store"))
+    store.append(rows({1: 5, 2: 5, 3: 5}, day=1))
+    store.append(rows({4: 7, 5: 7, 6: 7, 7: 7}, day=2))
+
+    # More than twice the kept rows are stored
+    store.maintain(keep=3)
+
+    assert len(partitions(store)) == 1
+    assert store.load()['transaction_id'].tolist() == [5, 6, 7]